@@ -0,0 +1,85 @@
+# bench_login.py
+#
+# Logins/sec through /api/login with the configured scrypt parameters.
+#
+#   python bench_login.py [--threads 8] [--logins 200]
+#
+# Scenarios:
+#   valid     - correct passwords from --threads concurrent clients
+#   invalid   - wrong passwords for one account; after LOGIN_MAX_FAILURES_PER_USER
+#               they're refused with 429 without hashing
+#   rehash    - first logins after PASSWORD_SCRYPT_N changed (hash is upgraded)
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Flask
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from src.models.user import db, User
+from src.routes.user import user_bp
+from src.services import passwords
+
+
+def make_app(path):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="bench", SQLALCHEMY_DATABASE_URI=f"sqlite:///{path}")
+    db.init_app(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    return app
+
+
+def run(app, threads, logins, credentials):
+    statuses = Counter()
+
+    def login(i):
+        username, password = credentials(i)
+        with app.test_client() as client:
+            return client.post('/api/login', json={"username": username, "password": password}).status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        statuses.update(pool.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+    return logins / elapsed, dict(statuses)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=200)
+    args = parser.parse_args()
+
+    users = 32
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, "bench.db"))
+        with app.app_context():
+            db.create_all()
+            for i in range(users):
+                user = User(username=f"user{i}", role="bidder")
+                user.set_password(f"pw{i}")
+                db.session.add(user)
+            db.session.commit()
+
+        print(f"scrypt {passwords.current_method()}, {passwords.PASSWORD_HASH_WORKERS} hash workers, "
+              f"{args.threads} client threads")
+
+        rate, statuses = run(app, args.threads, args.logins, lambda i: (f"user{i % users}", f"pw{i % users}"))
+        print(f"valid:   {rate:8.1f} logins/s  {statuses}")
+
+        rate, statuses = run(app, args.threads, args.logins, lambda i: ("user0", "wrong"))
+        print(f"invalid: {rate:8.1f} logins/s  {statuses}")
+        passwords._failures.clear()
+
+        passwords.PASSWORD_SCRYPT_N *= 2
+        rate, statuses = run(app, args.threads, users, lambda i: (f"user{i}", f"pw{i}"))
+        print(f"rehash:  {rate:8.1f} logins/s  {statuses}")
+
+
+if __name__ == "__main__":
+    main()
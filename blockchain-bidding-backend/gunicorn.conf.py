@@ -0,0 +1,63 @@
+# gunicorn.conf.py
+#
+#   gunicorn -c gunicorn.conf.py src.wsgi:app
+#
+# Workers default to one per CPU core (Python runs one core per process),
+# each with GUNICORN_THREADS threads for requests waiting on the chain node,
+# the LLM or SQLite. The app is preloaded so create_all/upgrade_schema and
+# model loading run once in the master.
+import fcntl
+import multiprocessing
+import os
+
+# -------- Config --------
+bind = os.getenv("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", str(max(2, multiprocessing.cpu_count()))))
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+worker_class = "gthread"
+preload_app = True
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+# SIGTERM: stop accepting requests, then give in-flight evaluations this long to finish
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "120"))
+keepalive = 5
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))  # recycle workers; 0 = never
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+# One worker at a time runs the chain tracker/batcher and log indexer; whoever
+# holds this lock. A replacement for that worker picks the lock up when it starts.
+SINGLETON_LOCK = os.getenv("GUNICORN_SINGLETON_LOCK",
+                           os.path.join(os.path.dirname(os.path.abspath(__file__)), "src", "database", ".background.lock"))
+_lock_file = None
+
+
+def _take_singleton_lock() -> bool:
+    global _lock_file
+    _lock_file = open(SINGLETON_LOCK, "a")
+    try:
+        fcntl.flock(_lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        _lock_file.close()
+        _lock_file = None
+        return False
+
+
+def post_fork(server, worker):
+    from src.main import start_background
+    from src.models.user import db
+    from src.wsgi import app
+
+    # Don't share the master's pooled SQLite connections with the child
+    with app.app_context():
+        db.engine.dispose(close=False)
+    singletons = _take_singleton_lock()
+    start_background(app, singletons=singletons)
+    server.log.info("Worker %s started background threads%s", worker.pid, " (singletons)" if singletons else "")
+
+
+def worker_exit(server, worker):
+    from src.main import stop_background
+
+    # Requests have drained; all background threads share what remains of the grace period
+    stop_background(timeout=max(1, graceful_timeout - 10))
@@ -1,43 +1,161 @@
 import os
 import json
+import logging
+import threading
+import time
 from datetime import datetime
 from web3 import Web3
 from dotenv import load_dotenv
 from decimal import Decimal
-from flask import current_app
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, aliased
+
+from src.models.user import db, ChainTransaction, RFQ, Bid
+from src.blockchain.tx_pipeline import TxPipeline, TxBatcher
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # ---------------------------
-# Environment & Web3 setup
+# Environment
 # ---------------------------
 GANACHE_URL = os.getenv("GANACHE_URL", "http://127.0.0.1:8545")
 GANACHE_PRIVATE_KEY = os.getenv("GANACHE_PRIVATE_KEY")
 GANACHE_ADDRESS = os.getenv("GANACHE_ADDRESS")
 
-if not GANACHE_ADDRESS or not GANACHE_PRIVATE_KEY:
-    raise Exception("⚠️ Please set GANACHE_ADDRESS and GANACHE_PRIVATE_KEY in .env")
-
-if GANACHE_PRIVATE_KEY.startswith("0x"):
+if GANACHE_PRIVATE_KEY and GANACHE_PRIVATE_KEY.startswith("0x"):
     GANACHE_PRIVATE_KEY = GANACHE_PRIVATE_KEY[2:]
 
-w3 = Web3(Web3.HTTPProvider(GANACHE_URL))
-assert w3.is_connected(), f"❌ Web3 failed to connect to {GANACHE_URL}"
+# Writes made while serving requests go to the outbox and are sent by the tracker.
+# "auto" (default) / "1": accept writes while the node is unreachable; they're sent once it's back
+# "0": fail the request if the node is unreachable
+CHAIN_OFFLINE = os.getenv("CHAIN_OFFLINE", "auto").lower()
+CHAIN_TIMEOUT = float(os.getenv("CHAIN_TIMEOUT", "5"))
+CHAIN_HEALTH_INTERVAL = float(os.getenv("CHAIN_HEALTH_INTERVAL", "10"))
+CHAIN_BACKOFF_BASE = float(os.getenv("CHAIN_BACKOFF_BASE", "1"))
+CHAIN_BACKOFF_MAX = float(os.getenv("CHAIN_BACKOFF_MAX", "60"))
 
-# ---------------------------
-# Load contract ABI & address
-# ---------------------------
 THIS_DIR = os.path.dirname(__file__)
-with open(os.path.join(THIS_DIR, "RFQRegistry.json")) as f:
-    info = json.load(f)
+CONTRACT_INFO_PATH = os.path.join(THIS_DIR, "RFQRegistry.json")
 
-contract_address = Web3.to_checksum_address(info.get("address"))
-contract_abi = info.get("abi")
 
-if not contract_address or not contract_abi:
-    raise Exception("⚠️ RFQRegistry.json missing 'address' or 'abi'")
+class ChainUnavailable(Exception):
+    """Raised when the node can't be reached (or we're backing off from it)."""
+
+
+# ---------------------------
+# Lazily-connected chain client
+# ---------------------------
+class ChainClient:
+    """
+    Owns the Web3 connection and contract handle. Nothing touches the network
+    until the first call that needs it; failed connects back off exponentially
+    so a dead node doesn't add a timeout to every request.
+    """
+
+    def __init__(self, url: str, info_path: str):
+        self.url = url
+        self.info_path = info_path
+        self._w3 = None
+        self._contract = None
+        self._lock = threading.RLock()
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_check = 0.0
+        self._last_ok = False
+        self.last_error = None
+
+    def _load_contract_info(self):
+        with open(self.info_path) as f:
+            info = json.load(f)
+        address = info.get("address")
+        abi = info.get("abi")
+        if not address or not abi:
+            raise Exception("⚠️ RFQRegistry.json missing 'address' or 'abi'")
+        return Web3.to_checksum_address(address), abi
+
+    def connect(self):
+        """Return a connected Web3 instance or raise ChainUnavailable."""
+        with self._lock:
+            if self._w3 is not None and self.is_healthy():
+                return self._w3
+
+            now = time.monotonic()
+            if now < self._retry_at:
+                raise ChainUnavailable(
+                    f"Web3 node {self.url} unavailable, retrying in {self._retry_at - now:.0f}s: {self.last_error}")
+
+            try:
+                if not GANACHE_ADDRESS or not GANACHE_PRIVATE_KEY:
+                    raise Exception("⚠️ Please set GANACHE_ADDRESS and GANACHE_PRIVATE_KEY in .env")
+                w3 = Web3(Web3.HTTPProvider(self.url, request_kwargs={"timeout": CHAIN_TIMEOUT}))
+                if not w3.is_connected():
+                    raise Exception(f"❌ Web3 failed to connect to {self.url}")
+                address, abi = self._load_contract_info()
+                self._w3 = w3
+                self._contract = w3.eth.contract(address=address, abi=abi)
+            except Exception as e:
+                self._w3 = None
+                self._contract = None
+                self._failures += 1
+                self._retry_at = now + min(CHAIN_BACKOFF_MAX, CHAIN_BACKOFF_BASE * 2 ** (self._failures - 1))
+                self.last_error = str(e)
+                raise ChainUnavailable(str(e)) from e
+
+            self._failures = 0
+            self._retry_at = 0.0
+            self._last_check = now
+            self._last_ok = True
+            self.last_error = None
+            return self._w3
+
+    def is_healthy(self) -> bool:
+        """Cheap, rate-limited liveness check of the current connection."""
+        if self._w3 is None:
+            return False
+        now = time.monotonic()
+        if now - self._last_check < CHAIN_HEALTH_INTERVAL:
+            return self._last_ok
+        try:
+            self._last_ok = bool(self._w3.is_connected())
+        except Exception:
+            self._last_ok = False
+        self._last_check = now
+        return self._last_ok
+
+    @property
+    def w3(self):
+        return self.connect()
+
+    @property
+    def contract(self):
+        self.connect()
+        return self._contract
+
+    def health(self) -> dict:
+        connected = False
+        try:
+            self.connect()
+            connected = True
+        except ChainUnavailable:
+            pass
+        return {
+            "url": self.url,
+            "connected": connected,
+            "offline_mode": CHAIN_OFFLINE,
+            "consecutive_failures": self._failures,
+            "last_error": self.last_error,
+        }
+
+
+client = ChainClient(GANACHE_URL, CONTRACT_INFO_PATH)
+
+
+def get_client() -> ChainClient:
+    return client
 
-contract = w3.eth.contract(address=contract_address, abi=contract_abi)
 
 # ---------------------------
 # Helpers
@@ -52,130 +170,340 @@ def to_unix_seconds(deadline_iso: str) -> int:
     return int(dt.timestamp())
 
 def str_keccak(text: str) -> str:
-    """Compute keccak256 hash of a string."""
+    """Compute keccak256 hash of a string (no node connection needed)."""
     if isinstance(text, str):
-        return w3.keccak(text=text).hex()
+        return Web3.keccak(text=text).hex()
     elif isinstance(text, bytes):
-        return w3.keccak(text=text.decode("utf-8")).hex()
-    return w3.keccak(text=b"").hex()
+        return Web3.keccak(text=text.decode("utf-8")).hex()
+    return Web3.keccak(text="").hex()
+
+# ---------------------------
+# Outbox
+# ---------------------------
+_OUTBOX_KEY = "chain_outbox_written"
 
-def _sign_and_send(tx):
-    """Sign a transaction and send it on-chain (Web3.py v6 compatible)."""
-    signed_txn = w3.eth.account.sign_transaction(tx, private_key=GANACHE_PRIVATE_KEY)
-    tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-    receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-    if receipt.status != 1:
-        raise Exception("Transaction failed on-chain!")
-    return tx_hash, receipt
+def _require_node():
+    """With CHAIN_OFFLINE=0, refuse writes up front while the node is unreachable."""
+    if CHAIN_OFFLINE in ("0", "false", "no"):
+        client.connect()
+
+
+def rfq_chain_ref(rfq: RFQ):
+    """
+    Where a write for this RFQ should point: (rfqId, None) once the RFQ is
+    on-chain, (None, outbox id of its create) while that is still pending,
+    (None, None) if the RFQ was never written to the chain.
+    """
+    if rfq.onchain_id is not None:
+        return rfq.onchain_id, None
+    create = (ChainTransaction.query
+              .filter(ChainTransaction.kind == "create_rfq", ChainTransaction.ref_id == rfq.id,
+                      ChainTransaction.status != "failed")
+              .order_by(ChainTransaction.id.desc())
+              .first())
+    if create is None:
+        return None, None
+    if create.status == "confirmed" and create.result_id is not None:
+        return create.result_id, None
+    return None, create.id
 
 # ---------------------------
-# RFQ Functions
+# Receipt handling
 # ---------------------------
-def create_rfq_onchain(title: str, meta_hash: str, deadline_iso: str,
-                       category: str, budget: int, location: str):
-    """Create a new RFQ on-chain."""
-    deadline_secs = to_unix_seconds(deadline_iso)
-    nonce = w3.eth.get_transaction_count(GANACHE_ADDRESS)
-
-    tx = contract.functions.createRFQ(
-        title or "", meta_hash or "", int(deadline_secs),
-        category or "", int(budget or 0), location or ""
-    ).build_transaction({
-        "from": GANACHE_ADDRESS,
-        "nonce": nonce,
-        "gas": 500000,
-        "gasPrice": w3.to_wei("10", "gwei")
-    })
-
-    tx_hash, receipt = _sign_and_send(tx)
-
-    # Parse RFQCreated event
+_RESULT_EVENTS = {
+    "create_rfq": "RFQCreated",
+    "submit_bid": "BidSubmitted",
+}
+
+def _parse_result_id(kind: str, receipt, index: int = 0):
+    """
+    On-chain id emitted by the write, or None for writes without one. A batch
+    emits one event per item in order, so `index` picks the item's event.
+    """
+    event_name = _RESULT_EVENTS.get(kind)
+    if not event_name:
+        return None
     try:
-        events = contract.events.RFQCreated().process_receipt(receipt)
+        events = getattr(client.contract.events, event_name)().process_receipt(receipt)
         if not events:
-            raise Exception("No RFQCreated event found")
-        rfq_id = int(events[0]["args"]["id"])
+            raise Exception(f"No {event_name} event found")
+        return int(events[index]["args"]["id"])
     except Exception as e:
-        print("⚠️ Event parsing failed:", str(e))
-        rfq_id = None
+        logger.warning("Event parsing failed for %s: %s", kind, e)
+        return None
+
+def _apply_receipt(record: ChainTransaction, receipt):
+    """Called by the tracker once a write is mined: link the result to its row."""
+    record.result_id = _parse_result_id(record.kind, receipt, record.batch_index or 0)
+    if record.kind == "create_rfq" and record.ref_id:
+        rfq = RFQ.query.get(record.ref_id)
+        if rfq is not None:
+            rfq.onchain_id = record.result_id
+            rfq.tx_hash = record.tx_hash
+    elif record.kind == "submit_bid" and record.ref_id:
+        bid = Bid.query.get(record.ref_id)
+        if bid is not None:
+            bid.onchain_id = record.result_id
+            bid.tx_hash = record.tx_hash
 
-    return {"rfqId": rfq_id, "txHash": tx_hash.hex(), "logs": receipt.logs}
 
-def close_rfq_onchain(rfq_id: int):
-    nonce = w3.eth.get_transaction_count(GANACHE_ADDRESS)
-    tx = contract.functions.closeRFQ(int(rfq_id)).build_transaction({
-        "from": GANACHE_ADDRESS,
-        "nonce": nonce,
-        "gas": 200000,
-        "gasPrice": w3.to_wei("10", "gwei")
-    })
-    tx_hash, receipt = _sign_and_send(tx)
-    return {"txHash": tx_hash.hex(), "logs": receipt.logs}
+pipeline = TxPipeline(client, GANACHE_ADDRESS, GANACHE_PRIVATE_KEY, on_receipt=_apply_receipt)
 
 
+def _write(kind: str, args: dict, ref_id=None, wait=False, depends_on=None) -> dict:
+    """
+    Add a write to the outbox in the caller's transaction; the tracker sends it
+    once the caller's commit has made it durable. With `depends_on` (the outbox
+    id of the RFQ's create) the write waits until that one is mined and then
+    targets the resulting rfqId. wait=True, or no app context (scripts), sends
+    it now and blocks for the receipt instead.
+    """
+    if wait or not has_app_context():
+        tx_hash, receipt = pipeline.send_and_wait(_BUILDERS[kind](**args))
+        return {"txHash": tx_hash, "resultId": _parse_result_id(kind, receipt),
+                "logs": receipt.logs, "pendingId": None}
+    _require_node()
+    if depends_on is not None:
+        status = "waiting"
+    elif batcher.accepts(kind):
+        status = "queued"
+    else:
+        status = "recorded"
+    record = ChainTransaction(kind=kind, ref_id=ref_id, args=args, status=status, depends_on=depends_on)
+    db.session.add(record)
+    db.session.flush()
+    db.session.info[_OUTBOX_KEY] = True
+    return {"txHash": None, "resultId": None, "logs": [], "pendingId": record.id}
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_senders(session):
+    if session.info.pop(_OUTBOX_KEY, False):
+        pipeline.wake()
+        batcher.wake()
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_writes(session):
+    session.info.pop(_OUTBOX_KEY, None)
 
 
-# Assuming these are already initialized elsewhere in your project
-# w3 = Web3(Web3.HTTPProvider(GANACHE_URL))
-# contract = w3.eth.contract(address=CONTRACT_ADDRESS, abi=CONTRACT_ABI)
+# ---------------------------
+# RFQ Functions
+# ---------------------------
+GAS_HEADROOM = 1.2
+
+def _with_estimated_gas(call, base: dict) -> dict:
+    """build_transaction with the node's gas estimate plus headroom (a reverting call raises here)."""
+    tx = call.build_transaction(base)
+    tx["gas"] = int(tx["gas"] * GAS_HEADROOM)
+    return tx
+
+def _build_create_rfq(title, meta_hash, deadline_secs, category, budget, location):
+    def build(base):
+        return _with_estimated_gas(client.contract.functions.createRFQ(
+            title or "", meta_hash or "", int(deadline_secs),
+            category or "", int(budget or 0), location or ""
+        ), base)
+    return build
 
-def submit_bid_onchain(rfq_id: int, price: Decimal, doc_hash: str):
+def create_rfq_onchain(title: str, meta_hash: str, deadline_iso: str,
+                       category: str, budget: int, location: str,
+                       ref_id: int = None, wait: bool = False):
+    """
+    Create a new RFQ on-chain. Inside an app context this only adds the write
+    to the outbox (rfqId is filled in by the tracker once it is mined); with
+    wait=True or from a script it is sent and awaited.
     """
-    Submits a bid to the blockchain smart contract.
+    args = {
+        "title": title or "", "meta_hash": meta_hash or "",
+        "deadline_secs": to_unix_seconds(deadline_iso),
+        "category": category or "", "budget": int(budget or 0), "location": location or "",
+    }
+    result = _write("create_rfq", args, ref_id, wait)
+    return {"rfqId": result["resultId"], "txHash": result["txHash"],
+            "logs": result["logs"], "pendingId": result["pendingId"]}
+
+def _build_close_rfq(rfq_id):
+    def build(base):
+        return _with_estimated_gas(client.contract.functions.closeRFQ(int(rfq_id)), base)
+    return build
+
+def close_rfq_onchain(rfq_id: int, ref_id: int = None, wait: bool = False, depends_on: int = None):
+    """Close an RFQ on-chain; rfq_id may be None with depends_on, as for submit_bid_onchain."""
+    args = {"rfq_id": int(rfq_id) if rfq_id is not None else None}
+    result = _write("close_rfq", args, ref_id, wait, depends_on)
+    return {"txHash": result["txHash"], "logs": result["logs"], "pendingId": result["pendingId"]}
+
+
+# ---------------------------
+# Bid Functions
+# ---------------------------
+def _build_submit_bid(rfq_id, bid_ref, price_int, doc_hash):
+    def build(base):
+        return _with_estimated_gas(client.contract.functions.submitBid(
+            int(rfq_id),
+            int(bid_ref),
+            int(price_int),
+            doc_hash
+        ), base)
+    return build
+
+def submit_bid_onchain(rfq_id: int, price: Decimal, doc_hash: str,
+                       ref_id: int = None, wait: bool = False, depends_on: int = None):
+    """
+    Submits a bid to the blockchain smart contract. Every bid is sent from the
+    one operator account, so the contract tells bids apart by ref_id.
 
     Args:
-        rfq_id (int): The RFQ ID (matches off-chain DB).
+        rfq_id (int): The on-chain RFQ ID, or None with depends_on.
         price (Decimal): The bid price in USD (supports decimals).
         doc_hash (str): Hash of uploaded bid documents.
+        ref_id (int): Off-chain bid id; required, anchored on-chain as bidRef.
+        wait (bool): Block until the receipt is available.
+        depends_on (int): Outbox id of the RFQ's pending create (see rfq_chain_ref);
+            the write is sent once that is mined.
 
     Returns:
-        dict: { "bidId": <int>, "txHash": <str> }
+        dict: { "bidId": <int|None>, "txHash": <str|None>, ... }
     """
 
     try:
         if not doc_hash:
             raise ValueError("Document hash is required for on-chain submission")
+        if ref_id is None:
+            raise ValueError("Off-chain bid id (ref_id) is required for on-chain submission")
 
         # --- Ensure price is integer-compatible for Solidity ---
         # Example: store in cents (multiply by 100)
         price_int = int(Decimal(price) * 100)
 
-        # Get nonce for account
-        nonce = w3.eth.get_transaction_count(GANACHE_ADDRESS)
-
-        # Build transaction
-        tx = contract.functions.submitBid(
-            int(rfq_id),
-            price_int,
-            doc_hash
-        ).build_transaction({
-            "from": GANACHE_ADDRESS,
-            "nonce": nonce,
-            "gas": 500000,  # TODO: adjust or estimate
-            "gasPrice": w3.to_wei("10", "gwei"),
-        })
-
-        # Sign transaction
-        signed_txn = w3.eth.account.sign_transaction(tx, private_key=GANACHE_PRIVATE_KEY)
-
-        # Send transaction
-        tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+        args = {"rfq_id": int(rfq_id) if rfq_id is not None else None, "bid_ref": int(ref_id),
+                "price_int": price_int, "doc_hash": doc_hash}
+        result = _write("submit_bid", args, ref_id, wait, depends_on)
+        return {"bidId": result["resultId"], "txHash": result["txHash"], "pendingId": result["pendingId"]}
 
-        # Wait for confirmation
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+    except Exception as e:
+        current_app.logger.error(f"On-chain bid submission failed: {e}", exc_info=True)
+        raise
 
-        if receipt.status != 1:
-            raise Exception("Bid transaction failed on-chain!")
 
-        # Process events
-        events = contract.events.BidSubmitted().process_receipt(receipt)
-        if not events:
-            raise Exception("No BidSubmitted event found in receipt")
+_BUILDERS = {
+    "create_rfq": _build_create_rfq,
+    "close_rfq": _build_close_rfq,
+    "submit_bid": _build_submit_bid,
+}
 
-        bid_id = int(events[0]["args"]["id"])
 
-        return {"bidId": bid_id, "txHash": tx_hash.hex()}
-
-    except Exception as e:
-        current_app.logger.error(f"On-chain bid submission failed: {e}", exc_info=True)
-        raise
+# ---------------------------
+# Batching
+# ---------------------------
+def _build_batch(kind: str, items: list):
+    """build_fn for createRFQBatch / submitBidBatch; gas is estimated per batch."""
+    if kind == "create_rfq":
+        call = lambda: client.contract.functions.createRFQBatch([
+            (a["title"], a["meta_hash"], int(a["deadline_secs"]),
+             a["category"], int(a["budget"]), a["location"])
+            for a in items
+        ])
+    elif kind == "submit_bid":
+        call = lambda: client.contract.functions.submitBidBatch([
+            (int(a["rfq_id"]), int(a["bid_ref"]), int(a["price_int"]), a["doc_hash"])
+            for a in items
+        ])
+    else:
+        raise ValueError(f"{kind} writes can't be batched")
+
+    return lambda base: _with_estimated_gas(call(), base)
+
+
+batcher = TxBatcher(pipeline, _build_batch, kinds=("create_rfq", "submit_bid"),
+                    retry_on=(ChainUnavailable, OSError))
+
+
+def _resolve_waiting():
+    """Release writes whose RFQ create has been mined; fail those whose create failed."""
+    create = aliased(ChainTransaction)
+    rows = (db.session.query(ChainTransaction.id, ChainTransaction.kind, ChainTransaction.args,
+                             create.id, create.status, create.result_id, create.error)
+            .join(create, ChainTransaction.depends_on == create.id)
+            .filter(ChainTransaction.status == "waiting", create.status.in_(("confirmed", "failed")))
+            .order_by(ChainTransaction.id)
+            .all())
+    for record_id, kind, args, create_id, create_status, rfq_id, error in rows:
+        if create_status == "confirmed" and rfq_id is not None:
+            values = {"args": dict(args, rfq_id=rfq_id),
+                      "status": "queued" if batcher.accepts(kind) else "recorded"}
+        else:
+            values = {"status": "failed", "error": f"RFQ create #{create_id} failed: {error or 'no rfqId'}"}
+        # Guarded by status so a concurrent replay can't release a row twice
+        (ChainTransaction.query
+         .filter_by(id=record_id, status="waiting")
+         .update(values, synchronize_session=False))
+    if rows:
+        db.session.commit()
+        batcher.wake()
+
+
+def replay_recorded(limit: int = 100) -> dict:
+    """
+    Send outbox writes in status `recorded`, oldest first (the tracker runs
+    this every pass and confirms them), after releasing writes whose RFQ is now
+    on-chain. Stops at the first connectivity error so ordering is preserved.
+    Needs an app context.
+    """
+    _resolve_waiting()
+    client.connect()
+    sent = failed = 0
+    records = (ChainTransaction.query
+               .filter_by(status="recorded")
+               .order_by(ChainTransaction.id)
+               .limit(limit)
+               .all())
+    for record in records:
+        try:
+            if pipeline.send([record], _BUILDERS[record.kind](**record.args), expected="recorded"):
+                sent += 1
+        except (ChainUnavailable, OSError):
+            raise
+        except Exception as e:
+            (ChainTransaction.query
+             .filter_by(id=record.id, status="recorded")
+             .update({"status": "failed", "error": str(e)}, synchronize_session=False))
+            db.session.commit()
+            failed += 1
+    return {"sent": sent, "failed": failed,
+            "remaining": ChainTransaction.query.filter_by(status="recorded").count()}
+
+
+def retry_failed(ids: list) -> int:
+    """
+    Put failed outbox writes back in line for the tracker and the batcher,
+    which are the only senders (they run in the one worker that owns the
+    signing account's nonces). Writes still missing their RFQ id stay failed.
+    Returns how many rows were requeued; the caller commits.
+    """
+    retried = 0
+    for record in ChainTransaction.query.filter(ChainTransaction.id.in_(ids),
+                                                ChainTransaction.status == "failed"):
+        if record.depends_on is not None and (record.args or {}).get("rfq_id") is None:
+            continue
+        record.status = "queued" if batcher.accepts(record.kind) else "recorded"
+        record.batch_index = None
+        record.error = None
+        retried += 1
+    return retried
+
+
+def init_app(app):
+    """Start the receipt tracker (which also sends outbox writes) and the batcher."""
+    if app.config.get("CHAIN_TRACKER", True):
+        pipeline.start(app, replay=replay_recorded)
+        batcher.start(app)
+
+
+def shutdown(timeout: float = None):
+    """Stop the batcher and the receipt tracker within `timeout` seconds; queued writes stay in the outbox."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    batcher.stop(timeout)
+    pipeline.stop(None if deadline is None else max(0.0, deadline - time.monotonic()))
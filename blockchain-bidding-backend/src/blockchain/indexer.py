@@ -0,0 +1,255 @@
+# src/blockchain/indexer.py
+"""
+Incremental log indexer for the RFQRegistry contract.
+
+- Follows RFQCreated, RFQClosed and BidSubmitted by block range and upserts them
+  into chain_rfqs / chain_bids, so reads and audits are plain SQLite queries
+  instead of getBids() calls against the node
+- Progress is stored in indexer_checkpoints; a restart resumes from there
+- The hash of every indexed block in the last INDEXER_REORG_DEPTH blocks is kept
+  in indexed_blocks. If the node's hash for the checkpoint block no longer
+  matches, the indexer walks back to the last common block, deletes everything
+  indexed above it and re-reads from there
+"""
+
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+from eth_utils import event_abi_to_log_topic
+from flask import has_app_context
+
+from src.models.user import db, ChainRFQ, ChainBid, IndexedBlock, IndexerCheckpoint
+from src.blockchain.contract_service import get_client
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+INDEXER_START_BLOCK = int(os.getenv("INDEXER_START_BLOCK", "0"))
+INDEXER_BATCH_BLOCKS = int(os.getenv("INDEXER_BATCH_BLOCKS", "2000"))
+INDEXER_CONFIRMATIONS = int(os.getenv("INDEXER_CONFIRMATIONS", "0"))
+INDEXER_REORG_DEPTH = int(os.getenv("INDEXER_REORG_DEPTH", "64"))
+INDEXER_POLL_SECONDS = float(os.getenv("INDEXER_POLL_SECONDS", "5"))
+
+EVENTS = ("RFQCreated", "RFQClosed", "BidSubmitted")
+
+
+def _hex(value) -> str:
+    if isinstance(value, (bytes, bytearray)):
+        return "0x" + bytes(value).hex()
+    value = str(value)
+    return value if value.startswith("0x") else "0x" + value
+
+
+class EventIndexer:
+    def __init__(self, client):
+        self._client = client
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.last_error: Optional[str] = None
+
+    # ---------------------------
+    # Contract helpers
+    # ---------------------------
+    @property
+    def address(self) -> str:
+        return self._client.contract.address
+
+    def _topics(self) -> Dict[str, str]:
+        """topic0 -> event name for the events we follow."""
+        topics = {}
+        for item in self._client.contract.abi:
+            if item.get("type") == "event" and item.get("name") in EVENTS:
+                topics[_hex(event_abi_to_log_topic(item))] = item["name"]
+        return topics
+
+    def _block_hash(self, number: int) -> str:
+        return _hex(self._client.w3.eth.get_block(number)["hash"])
+
+    # ---------------------------
+    # Checkpoint / reorgs
+    # ---------------------------
+    def checkpoint(self) -> IndexerCheckpoint:
+        cp = IndexerCheckpoint.query.get(self.address)
+        if cp is None:
+            cp = IndexerCheckpoint(name=self.address, block_number=INDEXER_START_BLOCK - 1)
+            db.session.add(cp)
+            db.session.flush()
+        return cp
+
+    def _find_fork_point(self, cp: IndexerCheckpoint) -> int:
+        """Highest stored block whose hash still matches the node."""
+        stored = (IndexedBlock.query
+                  .filter(IndexedBlock.number <= cp.block_number)
+                  .order_by(IndexedBlock.number.desc())
+                  .all())
+        for block in stored:
+            if self._block_hash(block.number) == block.hash:
+                return block.number
+        # Reorg deeper than what we kept: re-index the whole window
+        return max(INDEXER_START_BLOCK - 1, cp.block_number - INDEXER_REORG_DEPTH)
+
+    def rollback_to(self, cp: IndexerCheckpoint, block_number: int):
+        """Drop everything indexed above block_number."""
+        ChainBid.query.filter(ChainBid.block_number > block_number).delete()
+        ChainRFQ.query.filter(ChainRFQ.block_number > block_number).delete()
+        (ChainRFQ.query
+         .filter(ChainRFQ.closed_block > block_number)
+         .update({"active": True, "closed_block": None, "closed_tx_hash": None}))
+        IndexedBlock.query.filter(IndexedBlock.number > block_number).delete()
+        cp.block_number = block_number
+        block = IndexedBlock.query.get(block_number)
+        cp.block_hash = block.hash if block else None
+
+    def _check_reorg(self, cp: IndexerCheckpoint) -> bool:
+        if cp.block_number < INDEXER_START_BLOCK or not cp.block_hash:
+            return False
+        if self._block_hash(cp.block_number) == cp.block_hash:
+            return False
+        fork = self._find_fork_point(cp)
+        logger.warning("Reorg detected at block %s, rolling back to %s", cp.block_number, fork)
+        self.rollback_to(cp, fork)
+        return True
+
+    # ---------------------------
+    # Log handling
+    # ---------------------------
+    def _apply(self, name: str, log):
+        event = getattr(self._client.contract.events, name)().process_log(log)
+        args = event["args"]
+        block_number = log["blockNumber"]
+        tx_hash = _hex(log["transactionHash"])
+
+        if name == "RFQCreated":
+            rfq = ChainRFQ.query.get(int(args["id"])) or ChainRFQ(id=int(args["id"]), active=True)
+            rfq.owner = args["owner"]
+            rfq.title = args["title"]
+            rfq.meta_hash = args["metaHash"]
+            rfq.deadline = int(args["deadline"])
+            rfq.category = args["category"]
+            rfq.budget = int(args["budget"])
+            rfq.location = args["location"]
+            rfq.block_number = block_number
+            rfq.tx_hash = tx_hash
+            rfq.log_index = log["logIndex"]
+            db.session.add(rfq)
+        elif name == "RFQClosed":
+            rfq = ChainRFQ.query.get(int(args["id"]))
+            if rfq is None:
+                logger.warning("RFQClosed for unknown RFQ %s at block %s", args["id"], block_number)
+                return
+            rfq.active = False
+            rfq.closed_block = block_number
+            rfq.closed_tx_hash = tx_hash
+        elif name == "BidSubmitted":
+            bid = ChainBid.query.get(int(args["id"])) or ChainBid(id=int(args["id"]))
+            bid.rfq_id = int(args["rfqId"])
+            bid.bidder = args["submitter"]
+            bid.bid_ref = int(args["bidRef"])
+            bid.price = int(args["price"])
+            bid.doc_hash = args["docHash"]
+            bid.block_number = block_number
+            bid.tx_hash = tx_hash
+            bid.log_index = log["logIndex"]
+            db.session.add(bid)
+        # Flush so a later log in the same batch (e.g. RFQClosed) sees this row
+        db.session.flush()
+
+    def _remember_block(self, number: int, block_hash: str):
+        block = IndexedBlock.query.get(number)
+        if block is None:
+            db.session.add(IndexedBlock(number=number, hash=block_hash))
+        else:
+            block.hash = block_hash
+
+    def sync_once(self) -> dict:
+        """
+        Index up to the current (confirmed) head. Commits after every batch so
+        progress survives a crash. Needs an app context.
+        """
+        w3 = self._client.w3
+        cp = self.checkpoint()
+        reorged = self._check_reorg(cp)
+        db.session.commit()
+
+        head = w3.eth.block_number - INDEXER_CONFIRMATIONS
+        topics = self._topics()
+        indexed = 0
+
+        while cp.block_number < head and not self._stop.is_set():
+            start = max(cp.block_number + 1, INDEXER_START_BLOCK)
+            end = min(head, start + INDEXER_BATCH_BLOCKS - 1)
+            logs = w3.eth.get_logs({
+                "address": self.address,
+                "fromBlock": start,
+                "toBlock": end,
+                "topics": [list(topics)],
+            })
+            for log in sorted(logs, key=lambda l: (l["blockNumber"], l["logIndex"])):
+                if log.get("removed"):
+                    continue
+                name = topics.get(_hex(log["topics"][0]))
+                if name:
+                    self._apply(name, log)
+                    self._remember_block(log["blockNumber"], _hex(log["blockHash"]))
+                    indexed += 1
+
+            end_hash = self._block_hash(end)
+            self._remember_block(end, end_hash)
+            cp.block_number = end
+            cp.block_hash = end_hash
+            IndexedBlock.query.filter(IndexedBlock.number < end - INDEXER_REORG_DEPTH).delete()
+            db.session.commit()
+
+        return {"block": cp.block_number, "head": head, "indexed": indexed, "reorg": reorged}
+
+    # ---------------------------
+    # Background follower
+    # ---------------------------
+    def _run(self, app):
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    self.sync_once()
+                    self.last_error = None
+                except Exception as e:
+                    db.session.rollback()
+                    self.last_error = str(e)
+                    logger.debug("Indexer pass skipped: %s", e)
+                finally:
+                    db.session.remove()
+            self._stop.wait(INDEXER_POLL_SECONDS)
+
+    def start(self, app):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name="chain-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> dict:
+        cp = None
+        if has_app_context():
+            cp = IndexerCheckpoint.query.order_by(IndexerCheckpoint.updated_at.desc()).first()
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "block": cp.block_number if cp else None,
+            "block_hash": cp.block_hash if cp else None,
+            "updated_at": cp.updated_at.isoformat() if cp and cp.updated_at else None,
+            "last_error": self.last_error,
+        }
+
+
+indexer = EventIndexer(get_client())
+
+
+def init_app(app):
+    """Follow the contract's logs in the background (CHAIN_INDEXER=0 disables)."""
+    if os.getenv("CHAIN_INDEXER", "1") != "0" and app.config.get("CHAIN_INDEXER", True):
+        indexer.start(app)
@@ -0,0 +1,506 @@
+# src/blockchain/tx_pipeline.py
+"""
+Nonce allocation and asynchronous submission for contract writes.
+
+- NonceManager hands out sequential nonces for the signing account locally, so
+  concurrent requests no longer race on get_transaction_count()
+- Writes are rows in chain_transactions (the outbox). TxPipeline.send signs a
+  row's transaction and commits its hash and nonce on the row before
+  broadcasting it, so a crash mid-send leaves a `sent` row to re-broadcast,
+  never a transaction the database doesn't know about. Requests only add rows;
+  they never wait for the node or for block confirmation
+- A background tracker polls receipts for `sent` rows, applies their results,
+  re-broadcasts transactions the node has lost, re-prices transactions that
+  are stuck in the mempool (same nonce, higher gas price) and sends rows that
+  are waiting in the outbox. A write still stuck at CHAIN_MAX_GAS_PRICE_GWEI
+  is cancelled: a 0-value self-transfer takes its nonce so later writes
+  aren't blocked behind it, and the row fails once that is mined
+- TxBatcher (opt-in via CHAIN_BATCH_WINDOW_MS) queues writes and sends writes
+  of the same kind as one batch transaction once CHAIN_BATCH_MAX_SIZE are
+  waiting or the oldest has waited for the window. Rows of a batch share the
+  tx hash and nonce and are told apart by batch_index
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from flask import has_app_context
+from web3.exceptions import TransactionNotFound
+
+from src.models.user import db, ChainTransaction
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+RECEIPT_POLL_SECONDS = float(os.getenv("CHAIN_RECEIPT_POLL_SECONDS", "2"))
+STUCK_SECONDS = float(os.getenv("CHAIN_STUCK_SECONDS", "60"))
+RESEND_SECONDS = float(os.getenv("CHAIN_RESEND_SECONDS", "10"))
+GAS_PRICE_BUMP = float(os.getenv("CHAIN_GAS_PRICE_BUMP", "1.125"))  # nodes require >= +10% to replace
+MAX_GAS_PRICE_GWEI = float(os.getenv("CHAIN_MAX_GAS_PRICE_GWEI", "200"))
+MIN_GAS_PRICE_GWEI = float(os.getenv("CHAIN_MIN_GAS_PRICE_GWEI", "10"))
+# A cancel costs 21000 gas, so it may outbid the write it replaces by more
+MAX_CANCEL_GAS_PRICE_GWEI = float(os.getenv("CHAIN_MAX_CANCEL_GAS_PRICE_GWEI", str(MAX_GAS_PRICE_GWEI * 4)))
+CANCEL_GAS = 21000
+BATCH_WINDOW_MS = float(os.getenv("CHAIN_BATCH_WINDOW_MS", "0"))  # 0 = send every write on its own
+BATCH_MAX_SIZE = int(os.getenv("CHAIN_BATCH_MAX_SIZE", "20"))
+BATCH_STALE_SECONDS = float(os.getenv("CHAIN_BATCH_STALE_SECONDS", "300"))
+
+
+class NonceManager:
+    """Local nonce counter, seeded from the node's pending count."""
+
+    def __init__(self, client, address: str):
+        self._client = client
+        self._address = address
+        self._next: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def allocate(self) -> int:
+        with self._lock:
+            if self._next is None:
+                self._next = self._client.w3.eth.get_transaction_count(self._address, "pending")
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def reset(self):
+        """Forget the local counter; the next allocate() re-reads it from the node."""
+        with self._lock:
+            self._next = None
+
+
+class TxPipeline:
+    def __init__(self, client, address: str, private_key: str,
+                 on_receipt: Callable[[ChainTransaction, dict], None]):
+        self._client = client
+        self._address = address
+        self._private_key = private_key
+        self._on_receipt = on_receipt
+        self.nonces = NonceManager(client, address)
+        self._send_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._replay: Optional[Callable[[], dict]] = None
+
+    # ---------------------------
+    # Broadcasting
+    # ---------------------------
+    def _gas_price(self) -> int:
+        w3 = self._client.w3
+        floor = w3.to_wei(MIN_GAS_PRICE_GWEI, "gwei")
+        try:
+            return max(int(w3.eth.gas_price), floor)
+        except Exception:
+            return floor
+
+    def _sign(self, tx: dict):
+        w3 = self._client.w3
+        signed = w3.eth.account.sign_transaction(tx, private_key=self._private_key)
+        return w3.to_hex(signed.hash), signed.raw_transaction
+
+    def _sign_and_broadcast(self, tx: dict) -> str:
+        tx_hash, raw = self._sign(tx)
+        self._client.w3.eth.send_raw_transaction(raw)
+        return tx_hash
+
+    def wake(self):
+        self._wakeup.set()
+
+    def broadcast(self, build_fn: Callable[[dict], dict]):
+        """
+        Allocate a nonce, build, sign and send, without an outbox row. Sending
+        is serialized so nonces hit the node in order; on failure the counter
+        is resynced to avoid gaps.
+        """
+        with self._send_lock:
+            for attempt in range(2):
+                nonce = self.nonces.allocate()
+                try:
+                    tx = build_fn({"from": self._address, "nonce": nonce, "gasPrice": self._gas_price()})
+                    tx_hash = self._sign_and_broadcast(tx)
+                    return tx_hash, tx
+                except Exception as e:
+                    self.nonces.reset()
+                    # Someone else used this account; retry once with a fresh count
+                    if attempt == 0 and "nonce" in str(e).lower():
+                        continue
+                    raise
+
+    def send_and_wait(self, build_fn: Callable[[dict], dict]):
+        """Broadcast and block for the receipt; for scripts running without the database."""
+        tx_hash, _ = self.broadcast(build_fn)
+        receipt = self._client.w3.eth.wait_for_transaction_receipt(tx_hash)
+        if receipt.status != 1:
+            raise Exception("Transaction failed on-chain!")
+        return tx_hash, receipt
+
+    def send(self, records: List[ChainTransaction], build_fn: Callable[[dict], dict],
+             expected: str, batched: bool = False) -> Optional[str]:
+        """
+        Sign one transaction for outbox rows in status `expected`, commit it on
+        them as `sent`, then broadcast it. Returns the tx hash, or None if
+        another sender claimed the rows first. A failed broadcast leaves the
+        rows `sent`; the tracker re-sends them. Needs an app context.
+        """
+        with self._send_lock:
+            for attempt in range(2):
+                nonce = self.nonces.allocate()
+                try:
+                    tx = build_fn({"from": self._address, "nonce": nonce, "gasPrice": self._gas_price()})
+                    tx_hash, raw = self._sign(tx)
+                except Exception:
+                    self.nonces.reset()
+                    raise
+                if not self._claim(records, expected, tx_hash, tx, batched):
+                    self.nonces.reset()
+                    return None
+                try:
+                    self._client.w3.eth.send_raw_transaction(raw)
+                except Exception as e:
+                    # Someone else used this account; take the rows back and retry once with a fresh count
+                    if attempt == 0 and "nonce" in str(e).lower() and self._unclaim(records, expected, tx_hash):
+                        self.nonces.reset()
+                        continue
+                    logger.warning("Broadcast of %s failed, the tracker will re-send it: %s", tx_hash, e)
+                self._wakeup.set()
+                return tx_hash
+
+    def _claim(self, records: List[ChainTransaction], expected: str, tx_hash: str, tx: dict, batched: bool) -> bool:
+        """Mark the rows sent with this tx, each guarded by its status; commits."""
+        now = datetime.utcnow()
+        for i, record in enumerate(records):
+            claimed = (ChainTransaction.query
+                       .filter_by(id=record.id, status=expected)
+                       .update({"status": "sent", "tx_hash": tx_hash, "nonce": tx["nonce"],
+                                "gas_price": int(tx["gasPrice"]), "tx": {k: v for k, v in tx.items()},
+                                "batch_index": i if batched else None,
+                                "attempts": (record.attempts or 0) + 1, "sent_at": now, "error": None},
+                               synchronize_session=False))
+            if not claimed:
+                db.session.rollback()
+                return False
+        db.session.commit()
+        return True
+
+    def _unclaim(self, records: List[ChainTransaction], expected: str, tx_hash: str) -> bool:
+        """Undo _claim for a tx the node refused, unless the tracker got to the rows first."""
+        released = (ChainTransaction.query
+                    .filter(ChainTransaction.id.in_([r.id for r in records]),
+                            ChainTransaction.status == "sent", ChainTransaction.tx_hash == tx_hash)
+                    .update({"status": expected, "tx_hash": None, "nonce": None, "tx": None, "batch_index": None},
+                            synchronize_session=False))
+        db.session.commit()
+        return released == len(records)
+
+    # ---------------------------
+    # Receipt tracking
+    # ---------------------------
+    def _find_receipt(self, record: ChainTransaction):
+        w3 = self._client.w3
+        # Any of the replacements (or the original) may be the one that got mined
+        for tx_hash in [record.tx_hash] + list(reversed(record.replaced_hashes or [])):
+            try:
+                receipt = w3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            if receipt is not None:
+                return tx_hash, receipt
+        return None, None
+
+    def _known(self, tx_hash: str) -> bool:
+        try:
+            return self._client.w3.eth.get_transaction(tx_hash) is not None
+        except TransactionNotFound:
+            return False
+
+    def _resend(self, record: ChainTransaction):
+        """Broadcast a committed tx the node doesn't know (crash mid-send, node restart)."""
+        try:
+            with self._send_lock:
+                self._sign_and_broadcast(dict(record.tx))
+        except Exception as e:
+            if "nonce" in str(e).lower():
+                # Another transaction took the nonce, so this one can never be mined
+                record.status = "failed"
+                record.error = f"Nonce {record.nonce} was used by another transaction"
+                self.nonces.reset()
+            logger.warning("Re-sending %s failed: %s", record.tx_hash, e)
+            return
+        record.sent_at = datetime.utcnow()
+        logger.warning("Re-sent tx %s at nonce %s", record.tx_hash, record.nonce)
+
+    def _replace(self, record: ChainTransaction):
+        tx = dict(record.tx or {})
+        w3 = self._client.w3
+        bumped = int(int(tx["gasPrice"]) * GAS_PRICE_BUMP) + 1
+        if record.status == "cancelling":
+            if bumped > w3.to_wei(MAX_CANCEL_GAS_PRICE_GWEI, "gwei"):
+                # Nothing cheaper will take the nonce; later writes stay queued behind it
+                logger.error("Cancel %s for nonce %s is stuck at CHAIN_MAX_CANCEL_GAS_PRICE_GWEI",
+                             record.tx_hash, record.nonce)
+                return
+        elif bumped > w3.to_wei(MAX_GAS_PRICE_GWEI, "gwei"):
+            self._cancel(record, bumped)
+            return
+        tx["gasPrice"] = bumped
+        try:
+            new_hash = self._sign_and_broadcast(tx)
+        except Exception as e:
+            # "nonce too low" / "already known" -> an earlier version was mined
+            logger.warning("Replacement for %s not accepted: %s", record.tx_hash, e)
+            return
+        record.replaced_hashes = (record.replaced_hashes or []) + [record.tx_hash]
+        record.tx_hash = new_hash
+        record.tx = tx
+        record.gas_price = bumped
+        record.attempts = (record.attempts or 0) + 1
+        record.sent_at = datetime.utcnow()
+        logger.warning("Replaced stuck tx nonce=%s with %s at %s wei", record.nonce, new_hash, bumped)
+
+    def _cancel(self, record: ChainTransaction, gas_price: int):
+        """Replace a write that is stuck at the gas price cap with a 0-value self-transfer."""
+        tx = {"from": self._address, "to": self._address, "value": 0, "gas": CANCEL_GAS,
+              "nonce": record.nonce, "gasPrice": gas_price}
+        if (record.tx or {}).get("chainId") is not None:
+            tx["chainId"] = record.tx["chainId"]
+        try:
+            cancel_hash = self._sign_and_broadcast(tx)
+        except Exception as e:
+            logger.warning("Cancel for %s not accepted: %s", record.tx_hash, e)
+            return
+        record.status = "cancelling"
+        record.error = f"Stuck at nonce {record.nonce} above CHAIN_MAX_GAS_PRICE_GWEI, cancelled by {cancel_hash}"
+        record.replaced_hashes = (record.replaced_hashes or []) + [record.tx_hash]
+        record.tx_hash = cancel_hash
+        record.tx = tx
+        record.gas_price = gas_price
+        record.attempts = (record.attempts or 0) + 1
+        record.sent_at = datetime.utcnow()
+        logger.error("Cancelling tx nonce=%s: %s", record.nonce, record.error)
+
+    def _is_cancel(self, receipt) -> bool:
+        # Writes go to the contract; only a cancel is sent to our own address
+        return (getattr(receipt, "to", None) or "").lower() == self._address.lower()
+
+    def track_once(self):
+        """
+        One pass over in-flight transactions. Rows sharing a nonce belong to
+        the same (batch) transaction and are confirmed or re-priced together.
+        Needs an app context.
+        """
+        now = datetime.utcnow()
+        stuck_before = now - timedelta(seconds=STUCK_SECONDS)
+        resend_before = now - timedelta(seconds=RESEND_SECONDS)
+        sent = (ChainTransaction.query
+                .filter(ChainTransaction.status.in_(("sent", "cancelling")))
+                .order_by(ChainTransaction.nonce, ChainTransaction.batch_index)
+                .all())
+        groups: Dict[int, List[ChainTransaction]] = {}
+        for record in sent:
+            groups.setdefault(record.nonce, []).append(record)
+
+        for records in groups.values():
+            lead = records[0]
+            tx_hash, receipt = self._find_receipt(lead)
+            if receipt is not None:
+                batched = lead.batch_index is not None
+                for record in records:
+                    self._confirm(record, tx_hash, receipt, batched)
+            elif lead.sent_at and lead.sent_at < resend_before and not self._known(lead.tx_hash):
+                self._resend(lead)
+                self._follow(lead, records[1:])
+            elif lead.sent_at and lead.sent_at < stuck_before:
+                self._replace(lead)
+                self._follow(lead, records[1:])
+            db.session.commit()
+
+        if self._replay is not None:
+            self._replay()
+
+    @staticmethod
+    def _follow(lead: ChainTransaction, records: List[ChainTransaction]):
+        """Copy the lead row's send state to the other rows of its batch."""
+        for record in records:
+            record.status = lead.status
+            record.error = lead.error
+            record.tx_hash = lead.tx_hash
+            record.tx = lead.tx
+            record.gas_price = lead.gas_price
+            record.replaced_hashes = lead.replaced_hashes
+            record.attempts = lead.attempts
+            record.sent_at = lead.sent_at
+
+    def _confirm(self, record: ChainTransaction, tx_hash: str, receipt, batched: bool = False):
+        record.tx_hash = tx_hash
+        record.confirmed_at = datetime.utcnow()
+        if record.status == "cancelling" and self._is_cancel(receipt):
+            record.status = "failed"  # the error set by _cancel says why
+        elif receipt.status == 1:
+            record.status = "confirmed"
+            record.error = None
+            try:
+                self._on_receipt(record, receipt)
+            except Exception as e:
+                record.error = f"Result handling failed: {e}"
+        elif batched:
+            # One bad item reverts the whole batch; send each write on its own
+            # so only the bad one fails
+            record.status = "recorded"
+            record.batch_index = None
+            record.error = f"Batch {tx_hash} reverted"
+        else:
+            record.status = "failed"
+            record.error = "Transaction reverted"
+
+    def _run(self, app):
+        while not self._stop.is_set():
+            with app.app_context():
+                try:
+                    if self._client.is_healthy() or self._client.connect():
+                        self.track_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.debug("Tx tracker pass skipped: %s", e)
+                finally:
+                    db.session.remove()
+            self._wakeup.wait(RECEIPT_POLL_SECONDS)
+            self._wakeup.clear()
+
+    def start(self, app, replay: Optional[Callable[[], dict]] = None):
+        self._replay = replay
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name="tx-tracker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class TxBatcher:
+    """
+    Sends outbox rows in status `queued` in batches through the pipeline.
+    build_batch(kind, [args, ...]) returns the build_fn for the batch call of
+    that kind.
+    """
+
+    def __init__(self, pipeline: TxPipeline, build_batch: Callable[[str, list], Callable[[dict], dict]],
+                 kinds, retry_on: tuple = (OSError,),
+                 window_ms: float = BATCH_WINDOW_MS, max_size: int = BATCH_MAX_SIZE):
+        self._pipeline = pipeline
+        self._retry_on = retry_on
+        self._build_batch = build_batch
+        self.kinds = tuple(kinds)
+        self.window = window_ms / 1000.0
+        self.max_size = max_size
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_size > 1
+
+    def accepts(self, kind: str) -> bool:
+        return self.enabled and kind in self.kinds and has_app_context()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _claim(self, ids: List[int]) -> List[ChainTransaction]:
+        # queued -> batching in one UPDATE so only one worker process sends a row
+        (ChainTransaction.query
+         .filter(ChainTransaction.id.in_(ids), ChainTransaction.status == "queued")
+         .update({"status": "batching", "sent_at": datetime.utcnow()}, synchronize_session=False))
+        db.session.commit()
+        return (ChainTransaction.query
+                .filter(ChainTransaction.id.in_(ids), ChainTransaction.status == "batching")
+                .order_by(ChainTransaction.id)
+                .all())
+
+    def flush_once(self, force: bool = False) -> int:
+        """Send every batch that is full or past its window. Needs an app context."""
+        sent = 0
+        for kind in self.kinds:
+            while True:
+                queued = (ChainTransaction.query
+                          .filter_by(kind=kind, status="queued")
+                          .order_by(ChainTransaction.id)
+                          .limit(self.max_size)
+                          .all())
+                if not queued:
+                    break
+                age = (datetime.utcnow() - queued[0].created_at).total_seconds()
+                if not force and len(queued) < self.max_size and age < self.window:
+                    break
+                records = self._claim([r.id for r in queued])
+                if not records:
+                    continue
+                sent += self._send(kind, records)
+        return sent
+
+    def _send(self, kind: str, records: List[ChainTransaction]) -> int:
+        try:
+            tx_hash = self._pipeline.send(records, self._build_batch(kind, [r.args for r in records]),
+                                          expected="batching", batched=True)
+        except Exception as e:
+            # Node trouble: try again next window. Anything else (e.g. the batch
+            # call reverts in estimation): fall back to sending each write alone.
+            retry = isinstance(e, self._retry_on)
+            for record in records:
+                record.status = "queued" if retry else "recorded"
+                record.error = f"Batch send failed: {e}"
+            db.session.commit()
+            logger.warning("Batch of %d %s writes not sent: %s", len(records), kind, e)
+            return 0
+        if tx_hash is None:
+            return 0
+        logger.info("Sent %d %s writes in one transaction %s", len(records), kind, tx_hash)
+        return len(records)
+
+    def _release_stale(self):
+        """Rows left in `batching` by a crashed worker go back to the queue."""
+        cutoff = datetime.utcnow() - timedelta(seconds=BATCH_STALE_SECONDS)
+        (ChainTransaction.query
+         .filter(ChainTransaction.status == "batching", ChainTransaction.sent_at < cutoff)
+         .update({"status": "queued"}, synchronize_session=False))
+        db.session.commit()
+
+    def _run(self, app):
+        with app.app_context():
+            try:
+                self._release_stale()
+            finally:
+                db.session.remove()
+        while not self._stop.is_set():
+            self._wakeup.wait(self.window)
+            self._wakeup.clear()
+            with app.app_context():
+                try:
+                    self.flush_once()
+                except Exception as e:
+                    db.session.rollback()
+                    logger.debug("Batch flush skipped: %s", e)
+                finally:
+                    db.session.remove()
+
+    def start(self, app):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(app,), name="tx-batcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
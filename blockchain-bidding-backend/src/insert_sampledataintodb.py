@@ -1,8 +1,9 @@
 from datetime import datetime, timedelta
-from main import app, db
+from main import create_app, db
 from models.user import User, RFQ, Bid, Project, Milestone, ClarificationThread, ClarificationMessage
 
 def seed_data():
+    app = create_app()
     with app.app_context():
         db.drop_all()
         db.create_all()
@@ -1,62 +1,177 @@
 import os
 import sys
+import time
 from datetime import timedelta
-from flask import Flask, send_from_directory
+from flask import Flask, current_app, send_from_directory
 from flask_cors import CORS
-from flask_session import Session   # NEW
 
 # Add project root to Python path so "src" is always found
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(BASE_DIR)
 sys.path.insert(0, PROJECT_ROOT)
 
-from src.models.user import db
+from src.models.user import db, upgrade_schema
 from src.routes.user import user_bp
+from src.services import jobs, bid_stats, blobs, page_index, recommend, search, sessions
+from src.blockchain import contract_service, indexer
+from src.services.model_registry import registry
+from src.services.ingest import UPLOAD_MAX_REQUEST_BYTES
 
-app = Flask(__name__, static_folder=os.path.join(BASE_DIR, 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+# Models load lazily on first evaluation; MODEL_WARMUP=1 loads them up front
+# so the first bid doesn't pay the load time.
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "0") == "1"
 
-# Database config
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(BASE_DIR, 'database', 'app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
-# Session & cookie settings
-app.config['SESSION_COOKIE_SAMESITE'] = 'None'
-app.config['SESSION_COOKIE_SECURE'] = True
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
+def create_app(config=None):
+    """
+    Build the app without touching the database or starting threads: see
+    init_database() and start_background(). src/wsgi.py is the production
+    entry point.
+    """
+    app = Flask(__name__, static_folder=os.path.join(BASE_DIR, 'static'))
+    app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
 
+    # Database config
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(BASE_DIR, 'database', 'app.db')}"
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # Uploads: reject oversized requests before the form is parsed
+    app.config['MAX_CONTENT_LENGTH'] = UPLOAD_MAX_REQUEST_BYTES
 
-# CORS config
-CORS(
-    app,
-    resources={r"/api/*": {"origins": ["http://localhost:5173", "http://127.0.0.1:5173"]}},
-    supports_credentials=True
-)
+    # Session & cookie settings
+    app.config['SESSION_COOKIE_SAMESITE'] = 'None'
+    app.config['SESSION_COOKIE_SECURE'] = True
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
 
-# Init DB
-db.init_app(app)
-with app.app_context():
-    db.create_all()
+    app.config.update(config or {})
 
-# Register routes
-app.register_blueprint(user_bp, url_prefix='/api')
+    # CORS config
+    CORS(
+        app,
+        resources={r"/api/*": {"origins": ["http://localhost:5173", "http://127.0.0.1:5173"]}},
+        supports_credentials=True
+    )
+
+    db.init_app(app)
+
+    # Server-side sessions (SESSION_BACKEND=sqlite|redis)
+    sessions.init_app(app)
+
+    register_commands(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.add_url_rule('/', 'serve', serve, defaults={'path': ''})
+    app.add_url_rule('/<path:path>', 'serve', serve)
+    return app
+
+
+def init_database(app):
+    """Create missing tables/columns/indexes and backfill derived data. Run once per deployment start."""
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        bid_stats.backfill()
+
+
+def start_background(app, singletons=True):
+    """
+    Start the per-process background threads. `singletons` are the chain
+    receipt tracker/batcher and log indexer, which one process runs for all.
+    """
+    # Background bid evaluation workers
+    jobs.init_app(app)
+
+    # RFQ recommendation index: loads from disk and follows RFQ writes
+    recommend.init_app(app)
+
+    sessions.start_purge(app)
+
+    # On-chain receipt tracker and event indexer
+    if singletons:
+        contract_service.init_app(app)
+        indexer.init_app(app)
+
+
+def stop_background(timeout=None):
+    """
+    Stop claiming new work and wait for in-flight evaluations, then for the
+    other background threads, all within `timeout` seconds (None: no limit).
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+
+    def remaining(cap=None):
+        if deadline is None:
+            return cap
+        left = max(0.0, deadline - time.monotonic())
+        return left if cap is None else min(cap, left)
+
+    sessions.stop_purge()
+    jobs.stop_workers(remaining())
+    contract_service.shutdown(remaining(5))
+    indexer.indexer.stop(remaining(5))
+    recommend.shutdown(remaining())
+
+
+def register_commands(app):
+    @app.cli.command("init-db")
+    def init_db_command():
+        """Create or upgrade the database schema."""
+        init_database(app)
+        print("Database ready")
+
+    @app.cli.command("rebuild-bid-stats")
+    def rebuild_bid_stats_command():
+        """Recompute rfq_bid_stats from the bids table."""
+        print(f"Rebuilt bid stats for {bid_stats.rebuild()} RFQs")
+
+    @app.cli.command("adopt-uploads")
+    def adopt_uploads_command():
+        """Move uploads saved before the blob store into it, deduplicating."""
+        print(blobs.adopt_existing())
+
+    @app.cli.command("gc-blobs")
+    def gc_blobs_command():
+        """Delete unreferenced blobs and orphaned files."""
+        print(blobs.gc())
+
+    @app.cli.command("index-documents")
+    def index_documents_command():
+        """Extract text of every RFQ/bid file into the page index (resumes partial runs)."""
+        print(page_index.index_all())
+
+    @app.cli.command("rebuild-search")
+    def rebuild_search_command():
+        """Rebuild the full-text search indexes from their source tables."""
+        search.rebuild()
+        print("Search indexes rebuilt")
+
+    @app.cli.command("rebuild-rfq-index")
+    def rebuild_rfq_index_command():
+        """Re-embed every open RFQ into the recommendation index."""
+        print(recommend.rebuild())
 
 
 # Serve frontend
-@app.route('/', defaults={'path': ''})
-@app.route('/<path:path>')
 def serve(path):
-    if path != "" and os.path.exists(os.path.join(app.static_folder, path)):
-        return send_from_directory(app.static_folder, path)
+    static_folder = current_app.static_folder
+    if path != "" and os.path.exists(os.path.join(static_folder, path)):
+        return send_from_directory(static_folder, path)
     else:
-        index_path = os.path.join(app.static_folder, 'index.html')
+        index_path = os.path.join(static_folder, 'index.html')
         if os.path.exists(index_path):
-            return send_from_directory(app.static_folder, 'index.html')
+            return send_from_directory(static_folder, 'index.html')
         else:
             return "index.html not found", 404
 
 
 if __name__ == '__main__':
+    # Development server; see src/wsgi.py and gunicorn.conf.py for production
+    app = create_app()
+    # The debug reloader re-runs this module in a child process that serves
+    # requests (WERKZEUG_RUN_MAIN=true); the watching parent starts nothing
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        init_database(app)
+        start_background(app)
+        if MODEL_WARMUP:
+            registry.warmup(background=True)
     app.run(host='127.0.0.1', port=5000, debug=True)
@@ -1,11 +1,35 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 from datetime import datetime
+from sqlalchemy import func, inspect, text
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.services import passwords
 
 db = SQLAlchemy()
 
+
+def upgrade_schema():
+    """
+    db.create_all() only creates missing tables. Bring an existing app.db up to
+    date by adding columns and indexes that newer models define but it lacks.
+    New columns must be nullable (or have a server default) for this to work.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                col_type = column.type.compile(dialect=db.engine.dialect)
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {col_type}'))
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+
 # -----------------------------
 # User model
 # -----------------------------
@@ -25,10 +49,15 @@ class User(db.Model):
     avatar_url = db.Column(db.String(250))
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password, method="scrypt")
+        self.password_hash = passwords.hash_password(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        """Verify a login; a hash made with old scrypt parameters is upgraded (caller commits)."""
+        if not passwords.verify_password(self.password_hash, password):
+            return False
+        if passwords.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
 
     def to_dict(self):
@@ -51,6 +80,12 @@ class User(db.Model):
 # -----------------------------
 class RFQ(db.Model):
     __tablename__ = 'rfqs'
+    # Keyset pagination indexes; SQLite appends the rowid (id) to every index,
+    # so these also cover the (created_at, id) tie-break
+    __table_args__ = (
+        db.Index('ix_rfqs_status_created_at', 'status', 'created_at'),
+        db.Index('ix_rfqs_created_at', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     owner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -82,10 +117,60 @@ class RFQ(db.Model):
     bids = relationship("Bid", backref="rfq", lazy="dynamic", cascade="all, delete-orphan")
     files = relationship("RFQFile", backref="rfq", cascade="all, delete-orphan")
 
+    stats = relationship("RFQBidStats", uselist=False, cascade="all, delete-orphan")
+
     @property
     def bid_count(self):
+        # Set by to_dict_many(); otherwise the materialized stats row, and a
+        # COUNT only for RFQs that predate it
+        cached = self.__dict__.get("_bid_count")
+        if cached is not None:
+            return cached
+        if self.stats is not None:
+            return self.stats.bid_count
         return self.bids.count()
 
+    @staticmethod
+    def bid_counts(rfq_ids):
+        """
+        {rfq_id: number of bids} for many RFQs: one read of rfq_bid_stats, plus
+        one grouped COUNT for any RFQ without a stats row yet.
+        """
+        if not rfq_ids:
+            return {}
+        counts = dict(db.session.query(RFQBidStats.rfq_id, RFQBidStats.bid_count)
+                      .filter(RFQBidStats.rfq_id.in_(rfq_ids))
+                      .all())
+        missing = [i for i in rfq_ids if i not in counts]
+        if missing:
+            counts.update(db.session.query(Bid.rfq_id, func.count(Bid.id))
+                          .filter(Bid.rfq_id.in_(missing))
+                          .group_by(Bid.rfq_id)
+                          .all())
+        return counts
+
+    @classmethod
+    def to_dict_many(cls, rfqs, include_files=False):
+        """
+        Serialize a list of RFQs in a constant number of queries: bid counts
+        come from one GROUP BY, files from one SELECT ... IN (...) unless the
+        caller already eager-loaded them.
+        """
+        rfqs = list(rfqs)
+        counts = cls.bid_counts([r.id for r in rfqs])
+        if include_files:
+            missing = [r for r in rfqs if "files" not in r.__dict__]
+            if missing:
+                files = RFQFile.query.filter(RFQFile.rfq_id.in_([r.id for r in missing])).all()
+                by_rfq = {}
+                for f in files:
+                    by_rfq.setdefault(f.rfq_id, []).append(f)
+                for r in missing:
+                    set_committed_value(r, "files", by_rfq.get(r.id, []))
+        for r in rfqs:
+            r._bid_count = counts.get(r.id, 0)
+        return [r.to_dict(include_files=include_files) for r in rfqs]
+
     @property
     def submission_status(self):
         if not self.deadline:
@@ -127,20 +212,136 @@ class RFQ(db.Model):
         return data
 
 
+class Blob(db.Model):
+    """
+    One stored copy of an uploaded file's bytes, keyed by SHA-256. File rows
+    point at it; refcount is kept by src/services/blobs.py.
+    """
+    __tablename__ = 'blobs'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    keccak256 = db.Column(db.String(66))
+    size_bytes = db.Column(db.BigInteger, nullable=False)
+    path = db.Column(db.String(500), nullable=False)
+    refcount = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unreferenced_at = db.Column(db.DateTime, index=True)  # refcount last dropped to 0
+
+    def to_dict(self):
+        return {
+            "sha256": self.sha256,
+            "keccak256": self.keccak256,
+            "size_bytes": self.size_bytes,
+            "refcount": self.refcount,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+
+class DocumentText(db.Model):
+    """
+    Extraction progress of one document, keyed by the file's SHA-256. Its text
+    is stored page by page in document_pages by src/services/page_index.py.
+    """
+    __tablename__ = 'document_texts'
+    sha256 = db.Column(db.String(64), primary_key=True)
+    filename = db.Column(db.String(255))  # picks the parser
+    extractor_version = db.Column(db.String(10), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default="running")  # running | complete | failed
+    pages_done = db.Column(db.Integer, nullable=False, default=0)
+    char_count = db.Column(db.BigInteger, nullable=False, default=0)  # char_end of the last stored page
+    error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "sha256": self.sha256,
+            "filename": self.filename,
+            "status": self.status,
+            "pages_done": self.pages_done,
+            "char_count": self.char_count,
+            "error": self.error,
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None
+        }
+
+
+class DocumentPage(db.Model):
+    """One page of extracted text; [char_start, char_end) within the whole document."""
+    __tablename__ = 'document_pages'
+    __table_args__ = (
+        db.UniqueConstraint('sha256', 'page_no', name='uq_document_pages_sha256_page_no'),
+        db.Index('ix_document_pages_sha256_char_start', 'sha256', 'char_start'),
+    )
+    # Explicit integer key: document_fts (src/services/search.py) refers to
+    # pages by rowid, and VACUUM may renumber implicit rowids
+    id = db.Column(db.Integer, primary_key=True)
+    sha256 = db.Column(db.String(64), db.ForeignKey('document_texts.sha256', ondelete='CASCADE'), nullable=False)
+    page_no = db.Column(db.Integer, nullable=False)
+    char_start = db.Column(db.BigInteger, nullable=False)
+    char_end = db.Column(db.BigInteger, nullable=False)
+    text = db.Column(db.Text, nullable=False)
+
+    def to_dict(self):
+        return {
+            "page_no": self.page_no,
+            "char_start": self.char_start,
+            "char_end": self.char_end,
+            "text": self.text
+        }
+
+
+class RFQBidStats(db.Model):
+    """
+    Materialized per-RFQ bid aggregates, kept current by
+    src/services/bid_stats.py whenever bids (or the RFQ) are written.
+    """
+    __tablename__ = 'rfq_bid_stats'
+    rfq_id = db.Column(db.Integer, db.ForeignKey('rfqs.id', ondelete='CASCADE'), primary_key=True)
+    bid_count = db.Column(db.Integer, nullable=False, default=0)
+    min_price = db.Column(db.Float)
+    max_price = db.Column(db.Float)
+    median_price = db.Column(db.Float)
+    avg_phase2_score = db.Column(db.Float)
+    scored_count = db.Column(db.Integer, nullable=False, default=0)
+    phase2_score_sum = db.Column(db.Float)  # NULL on rows built before it existed: recomputed on next write
+    status_counts = db.Column(db.JSON)  # {status: n}
+    phase1_counts = db.Column(db.JSON)  # {phase1_status: n}
+    phase2_counts = db.Column(db.JSON)  # {phase2_status: n}
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            "rfq_id": self.rfq_id,
+            "bid_count": self.bid_count,
+            "min_price": self.min_price,
+            "max_price": self.max_price,
+            "median_price": self.median_price,
+            "avg_phase2_score": self.avg_phase2_score,
+            "scored_count": self.scored_count,
+            "status_counts": self.status_counts or {},
+            "phase1_counts": self.phase1_counts or {},
+            "phase2_counts": self.phase2_counts or {},
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
+
+
 class RFQFile(db.Model):
     __tablename__ = "rfq_files"
     id = db.Column(db.Integer, primary_key=True)
     rfq_id = db.Column(db.Integer, db.ForeignKey("rfqs.id"), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     filepath = db.Column(db.String(500), nullable=False)
+    size_bytes = db.Column(db.BigInteger)
+    sha256 = db.Column(db.String(64), index=True)
+    keccak256 = db.Column(db.String(66))
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), index=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    blob = relationship("Blob")
+
     def extract_text(self):
-        try:
-            with open(self.filepath, "r", encoding="utf-8") as f:
-                return f.read()
-        except:
-            return ""
+        from src.services.page_index import row_text
+        return row_text(self)
 
     def to_dict(self):
         return {
@@ -148,12 +349,20 @@ class RFQFile(db.Model):
             "rfq_id": self.rfq_id,
             "filename": self.filename,
             "filepath": self.filepath,
+            "size_bytes": self.size_bytes,
+            "sha256": self.sha256,
+            "keccak256": self.keccak256,
             "uploaded_at": self.uploaded_at.isoformat()
         }
 
 
 class Bid(db.Model):
     __tablename__ = "bids"
+    __table_args__ = (
+        db.Index('ix_bids_rfq_id_created_at', 'rfq_id', 'created_at'),
+        db.Index('ix_bids_rfq_id_price', 'rfq_id', 'price'),  # min/max/median in rfq_bid_stats
+        db.Index('ix_bids_bidder_id_created_at', 'bidder_id', 'created_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     rfq_id = db.Column(db.Integer, db.ForeignKey("rfqs.id"), nullable=False)
@@ -168,7 +377,11 @@ class Bid(db.Model):
     phase1_report = db.Column(db.JSON)
     phase2_breakdown = db.Column(db.JSON)
     phase2_score = db.Column(db.Float)
+    phase2_review = db.Column(db.JSON)  # last LLM review + hash of the texts it saw
     red_flags = db.Column(db.JSON)
+    document_hash = db.Column(db.String(66))  # keccak256 over the files' keccak256 digests
+    onchain_id = db.Column(db.Integer)
+    tx_hash = db.Column(db.String(80))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     files = db.relationship("BidFile", backref="bid", cascade="all, delete-orphan")
@@ -211,14 +424,27 @@ class BidFile(db.Model):
     bid_id = db.Column(db.Integer, db.ForeignKey("bids.id"), nullable=False)
     filename = db.Column(db.String(255), nullable=False)
     filepath = db.Column(db.String(500), nullable=False)
+    size_bytes = db.Column(db.BigInteger)
+    sha256 = db.Column(db.String(64), index=True)
+    keccak256 = db.Column(db.String(66))
+    blob_sha256 = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), index=True)
     uploaded_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    blob = relationship("Blob")
+
+    def extract_text(self):
+        from src.services.page_index import row_text
+        return row_text(self)
+
     def to_dict(self):
         return {
             "id": self.id,
             "bid_id": self.bid_id,
             "filename": self.filename,
             "filepath": self.filepath,
+            "size_bytes": self.size_bytes,
+            "sha256": self.sha256,
+            "keccak256": self.keccak256,
             "uploaded_at": self.uploaded_at.isoformat() if self.uploaded_at else None,
         }
 
@@ -242,6 +468,186 @@ class Project(db.Model):
         }
 
 
+# -----------------------------
+# Background evaluation jobs
+# -----------------------------
+class EvaluationJob(db.Model):
+    __tablename__ = 'evaluation_jobs'
+    id = db.Column(db.Integer, primary_key=True)
+    bid_id = db.Column(db.Integer, db.ForeignKey('bids.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), default="evaluate")  # evaluate | rescore (NULL on old rows: evaluate)
+    status = db.Column(db.String(20), default="pending", index=True)  # pending | running | done | failed
+    stage = db.Column(db.String(20), default="queued")  # queued | extract | phase1 | phase2 | complete
+    attempts = db.Column(db.Integer, default=0)
+    worker_id = db.Column(db.String(64))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "bid_id": self.bid_id,
+            "kind": self.kind or "evaluate",
+            "status": self.status,
+            "stage": self.stage,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
+
+
+# -----------------------------
+# On-chain transaction log
+# -----------------------------
+class ChainTransaction(db.Model):
+    __tablename__ = 'chain_transactions'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)  # create_rfq | close_rfq | submit_bid
+    ref_id = db.Column(db.Integer)  # off-chain row the tx belongs to (rfqs.id / bids.id)
+    args = db.Column(db.JSON, nullable=False)
+    status = db.Column(db.String(20), default="recorded", index=True)  # waiting | queued | batching | recorded | sent | cancelling | confirmed | failed
+    depends_on = db.Column(db.Integer, db.ForeignKey('chain_transactions.id'), index=True)  # `waiting` until this write is mined
+    tx_hash = db.Column(db.String(80))
+    nonce = db.Column(db.Integer)
+    gas_price = db.Column(db.BigInteger)
+    tx = db.Column(db.JSON)  # unsigned tx as broadcast, kept so it can be re-signed with a higher gas price
+    replaced_hashes = db.Column(db.JSON)  # earlier hashes for the same nonce
+    batch_index = db.Column(db.Integer)  # position within a batch transaction (rows share tx_hash/nonce)
+    attempts = db.Column(db.Integer, default=0)
+    result_id = db.Column(db.Integer)  # on-chain id parsed from the receipt
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+    confirmed_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "ref_id": self.ref_id,
+            "args": self.args,
+            "status": self.status,
+            "depends_on": self.depends_on,
+            "tx_hash": self.tx_hash,
+            "nonce": self.nonce,
+            "batch_index": self.batch_index,
+            "gas_price": self.gas_price,
+            "attempts": self.attempts,
+            "result_id": self.result_id,
+            "error": self.error,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "sent_at": self.sent_at.isoformat() if self.sent_at else None,
+            "confirmed_at": self.confirmed_at.isoformat() if self.confirmed_at else None
+        }
+
+
+# -----------------------------
+# On-chain event index
+# -----------------------------
+class ChainRFQ(db.Model):
+    """RFQ as seen in RFQCreated / RFQClosed logs."""
+    __tablename__ = 'chain_rfqs'
+    id = db.Column(db.Integer, primary_key=True)  # on-chain RFQ id
+    owner = db.Column(db.String(42), index=True)
+    title = db.Column(db.String(200))
+    meta_hash = db.Column(db.String(80))
+    deadline = db.Column(db.BigInteger)  # unix seconds
+    category = db.Column(db.String(100))
+    budget = db.Column(db.BigInteger)
+    location = db.Column(db.String(200))
+    active = db.Column(db.Boolean, default=True)
+    block_number = db.Column(db.Integer, nullable=False, index=True)
+    tx_hash = db.Column(db.String(80))
+    log_index = db.Column(db.Integer)
+    closed_block = db.Column(db.Integer, index=True)
+    closed_tx_hash = db.Column(db.String(80))
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "owner": self.owner,
+            "title": self.title,
+            "meta_hash": self.meta_hash,
+            "deadline": self.deadline,
+            "category": self.category,
+            "budget": self.budget,
+            "location": self.location,
+            "active": self.active,
+            "block_number": self.block_number,
+            "tx_hash": self.tx_hash,
+            "closed_block": self.closed_block,
+            "closed_tx_hash": self.closed_tx_hash
+        }
+
+
+class ChainBid(db.Model):
+    """Bid as seen in BidSubmitted logs."""
+    __tablename__ = 'chain_bids'
+    id = db.Column(db.Integer, primary_key=True)  # on-chain bid id
+    rfq_id = db.Column(db.Integer, nullable=False, index=True)  # on-chain RFQ id
+    bidder = db.Column(db.String(42), index=True)  # submitting (operator) address
+    bid_ref = db.Column(db.Integer, index=True)  # off-chain bid id
+    price = db.Column(db.BigInteger)  # cents
+    doc_hash = db.Column(db.String(80))
+    block_number = db.Column(db.Integer, nullable=False, index=True)
+    tx_hash = db.Column(db.String(80))
+    log_index = db.Column(db.Integer)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "rfq_id": self.rfq_id,
+            "bidder": self.bidder,
+            "bid_ref": self.bid_ref,
+            "price": self.price,
+            "doc_hash": self.doc_hash,
+            "block_number": self.block_number,
+            "tx_hash": self.tx_hash
+        }
+
+
+class IndexedBlock(db.Model):
+    """Hashes of recently indexed blocks, used to detect reorgs."""
+    __tablename__ = 'indexed_blocks'
+    number = db.Column(db.Integer, primary_key=True)
+    hash = db.Column(db.String(66), nullable=False)
+
+
+class IndexerCheckpoint(db.Model):
+    __tablename__ = 'indexer_checkpoints'
+    name = db.Column(db.String(64), primary_key=True)  # contract address
+    block_number = db.Column(db.Integer, nullable=False)  # last fully indexed block
+    block_hash = db.Column(db.String(66))
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+# -----------------------------
+# Server-side sessions
+# -----------------------------
+class UserSession(db.Model):
+    __tablename__ = 'sessions'
+    sid = db.Column(db.String(64), primary_key=True)
+    user_id = db.Column(db.Integer, index=True)  # for signing a user out everywhere
+    data = db.Column(db.Text, nullable=False)  # Flask tagged JSON
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+
+# -----------------------------
+# Embedding store
+# -----------------------------
+class DocumentEmbedding(db.Model):
+    __tablename__ = 'document_embeddings'
+    content_hash = db.Column(db.String(64), primary_key=True)  # sha256(model + text)
+    model = db.Column(db.String(120), nullable=False)
+    dim = db.Column(db.Integer, nullable=False)
+    vector = db.Column(db.LargeBinary, nullable=False)  # float32 bytes
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
 # -----------------------------
 # Milestone model
 # -----------------------------
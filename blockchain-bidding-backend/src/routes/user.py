@@ -1,21 +1,79 @@
-from flask import Blueprint, jsonify, request, session, current_app, send_file
-from werkzeug.utils import secure_filename
+from flask import Blueprint, jsonify, request, session, current_app, send_file, g
+from werkzeug.exceptions import RequestEntityTooLarge
+from sqlalchemy import func
+from sqlalchemy.orm import make_transient_to_detached, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from datetime import datetime
+from decimal import Decimal
 from functools import wraps
 import os, json
 
 # Import models
-from src.models.user import User, db, RFQ, Bid, Project, Milestone, ClarificationThread, ClarificationMessage, RFQFile, BidFile
+from src.models.user import User, db, RFQ, Bid, Project, Milestone, ClarificationThread, ClarificationMessage, RFQFile, BidFile, ChainTransaction, ChainRFQ, ChainBid
 
 # Import blockchain service
-from src.blockchain.contract_service import create_rfq_onchain, submit_bid_onchain, str_keccak, to_unix_seconds
+from src.blockchain.contract_service import (
+    create_rfq_onchain, close_rfq_onchain, submit_bid_onchain, rfq_chain_ref, str_keccak, to_unix_seconds,
+    get_client, retry_failed, pipeline, batcher
+)
 
 # Import evaluation services
-from src.services.evalution import evaluate_phase1, evaluate_phase2
+from src.blockchain.indexer import indexer
+from src.services import bid_stats
+from src.services.cache import TTLCache, invalidate_on_commit
+from src.services import blobs, page_index, passwords, recommend, search, sessions
+from src.services.ingest import UploadRejected, UPLOAD_MAX_FILES, document_hash
+from src.services.pagination import InvalidCursor, paginate, page_size, wants_page
+from src.services.jobs import enqueue_evaluation, enqueue_rescore, latest_job
+from src.services.llm import batch_metrics, cache_metrics
+from src.services.evalution import SCORE_COMPONENTS
+from src.services.model_registry import registry
 
 user_bp = Blueprint('user', __name__, url_prefix='/api')
 
 
+# ---------------------------
+# Current user
+# ---------------------------
+# The signed-in user is loaded at most once per request (g.user). With
+# USER_CACHE_TTL > 0 their profile is also cached per process and re-attached
+# to the session without a query; a commit that writes any User clears it.
+# The password hash isn't cached: it loads on access like an expired column.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "0"))
+_USER_CACHE_FIELDS = ("id", "username", "role", "name", "email", "phone", "company", "address", "avatar_url")
+
+user_cache = TTLCache(ttl=USER_CACHE_TTL, max_entries=10000)
+invalidate_on_commit(user_cache, User)
+
+
+def _load_user(user_id):
+    if USER_CACHE_TTL > 0:
+        cached = user_cache.get(user_id)
+        if cached is not None:
+            user = User()
+            for key, value in cached.items():
+                set_committed_value(user, key, value)
+            make_transient_to_detached(user)
+            return db.session.merge(user, load=False)
+    user = db.session.get(User, user_id)
+    if user is not None and USER_CACHE_TTL > 0:
+        user_cache.set(user_id, {key: getattr(user, key) for key in _USER_CACHE_FIELDS}, ttl=USER_CACHE_TTL)
+    return user
+
+
+@user_bp.before_app_request
+def _forget_current_user():
+    # g lives as long as the app context, which may span several requests
+    g.pop('user', None)
+
+
+def current_user():
+    """The signed-in User, or None if signed out or the account is gone."""
+    if 'user' not in g:
+        g.user = _load_user(session['user_id']) if 'user_id' in session else None
+    return g.user
+
+
 # ---------------------------
 # Utility decorators
 # ---------------------------
@@ -33,7 +91,7 @@ def role_required(role):
         def decorated_function(*args, **kwargs):
             if 'user_id' not in session:
                 return jsonify({'error': 'Authentication required'}), 401
-            user = User.query.get(session['user_id'])
+            user = current_user()
             if not user or user.role != role:
                 return jsonify({'error': 'Insufficient permissions'}), 403
             return f(*args, **kwargs)
@@ -66,23 +124,38 @@ def register_user():
         address=data.get('address'),
         avatar_url=data.get('avatar_url')
     )
-    user.set_password(password)
     try:
+        user.set_password(password)
         db.session.add(user)
         db.session.commit()
         session['user_id'] = user.id
         return jsonify(user.to_dict()), 201
+    except passwords.HashingBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f"Registration failed: {str(e)}"}), 500
 
 @user_bp.route('/login', methods=['POST'])
 def login():
-    data = request.json
-    user = User.query.filter_by(username=data.get('username')).first()
-    if user and user.check_password(data.get('password')):
-        session['user_id'] = user.id
-        return jsonify(user.to_dict())
+    data = request.json or {}
+    username, ip = data.get('username') or '', request.remote_addr
+    try:
+        # Counts the attempt as failed until it succeeds; throttled attempts
+        # are refused before any hashing
+        passwords.check_throttle(username, ip)
+    except passwords.LoginThrottled as e:
+        return jsonify({'error': str(e)}), 429, {'Retry-After': str(e.retry_after)}
+    try:
+        user = User.query.filter_by(username=username).first()
+        if user and user.check_password(data.get('password')):
+            db.session.commit()  # persists a rehashed password
+            passwords.record_success(username, ip)
+            session['user_id'] = user.id
+            return jsonify(user.to_dict())
+    except passwords.HashingBusy as e:
+        passwords.release_attempt(username, ip)
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     return jsonify({'error': 'Invalid credentials'}), 401
 
 @user_bp.route('/logout', methods=['POST'])
@@ -94,7 +167,7 @@ def logout_user():
 @user_bp.route('/me', methods=['GET'])
 @login_required
 def get_current_user():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     return jsonify(user.to_dict())
 
 
@@ -102,27 +175,125 @@ def get_current_user():
 # File helper
 # ---------------------------
 def save_file(file, rfq_id):
-    upload_dir = os.path.join(
-        current_app.config.get("UPLOAD_FOLDER", "uploads"),
-        "rfqs", str(rfq_id)
-    )
-    os.makedirs(upload_dir, exist_ok=True)
-    filename = secure_filename(file.filename)
-    filepath = os.path.join(upload_dir, filename)
-    file.save(filepath)
-    rfq_file = RFQFile(rfq_id=rfq_id, filename=filename, filepath=filepath)
+    rfq_file = RFQFile(rfq_id=rfq_id)
+    blobs.attach(rfq_file, file)
     db.session.add(rfq_file)
     return rfq_file
 
 
+def normalize_weights(weights_str):
+    """Accept 'price=0.4, timeline=0.2', a dict or a JSON string; store JSON."""
+    if isinstance(weights_str, dict):
+        return json.dumps({k.strip().lower(): float(v) for k, v in weights_str.items()})
+    if weights_str and "=" in weights_str:
+        pairs = (part.split("=", 1) for part in weights_str.split(",") if "=" in part)
+        weights_dict = {k.strip().lower(): float(v.strip()) for k, v in pairs}
+        weights_str = json.dumps(weights_dict)
+    return weights_str
+
+
+def parse_weights_param(value):
+    """normalize_weights for user input: ValueError unless it is non-negative numbers per component."""
+    try:
+        weights = json.loads(normalize_weights(value))
+    except (AttributeError, TypeError, ValueError):
+        raise ValueError("evaluation_weights must be 'name=number, ...', an object or a JSON object")
+    if not isinstance(weights, dict) or not weights:
+        raise ValueError("evaluation_weights must name at least one component")
+    unknown = set(weights) - set(SCORE_COMPONENTS)
+    if unknown:
+        raise ValueError(f"Unknown evaluation_weights components: {', '.join(sorted(unknown))}")
+    if any(isinstance(v, bool) or not isinstance(v, (int, float)) or v < 0 for v in weights.values()) \
+            or not sum(weights.values()):
+        raise ValueError("evaluation_weights must be non-negative numbers, not all zero")
+    return json.dumps(weights)
+
+
 # ---------------------------
 # RFQ Routes
 # ---------------------------
+def list_response(query, model, serialize):
+    """
+    Legacy plain array, or {items, next_cursor} (newest first) when the client
+    passes `limit` and/or `cursor`.
+    """
+    try:
+        if not wants_page(request.args):
+            return jsonify(serialize(query.all()))
+        rows, next_cursor = paginate(query, model, page_size(request.args), request.args.get('cursor'))
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({"items": serialize(rows), "next_cursor": next_cursor})
+
+
+def filter_rfqs(query, args):
+    """?status=&category=&budget_min=&budget_max=&deadline_after=&deadline_before="""
+    if args.get('status'):
+        query = query.filter(RFQ.status == args['status'])
+    if args.get('category'):
+        query = query.filter(RFQ.category == args['category'])
+    # Budget range: keep RFQs whose [budget_min, budget_max] overlaps the requested range
+    if args.get('budget_min'):
+        query = query.filter(RFQ.budget_max >= int(args['budget_min']))
+    if args.get('budget_max'):
+        query = query.filter(RFQ.budget_min <= int(args['budget_max']))
+    # Deadlines are stored as YYYY-MM-DD strings, which compare correctly as text
+    if args.get('deadline_after'):
+        datetime.strptime(args['deadline_after'], "%Y-%m-%d")
+        query = query.filter(RFQ.deadline >= args['deadline_after'])
+    if args.get('deadline_before'):
+        datetime.strptime(args['deadline_before'], "%Y-%m-%d")
+        query = query.filter(RFQ.deadline <= args['deadline_before'])
+    return query
+
+
 @user_bp.route('/rfqs', methods=['GET'])
 @login_required
 def get_rfqs():
-    rfqs = RFQ.query.all()
-    return jsonify([rfq.to_dict(include_files=True) for rfq in rfqs])
+    try:
+        query = filter_rfqs(RFQ.query.options(selectinload(RFQ.files)), request.args)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid filter: {str(e)}"}), 400
+    return list_response(query, RFQ, lambda rfqs: RFQ.to_dict_many(rfqs, include_files=True))
+
+
+@user_bp.route('/search', methods=['GET'])
+@login_required
+def search_rfqs_and_documents():
+    """?q=&type=rfq,rfq_file,bid_file&rfq_id=&prefix=1&limit=&offset= plus the /rfqs filters"""
+    user = current_user()
+    types = [t for t in request.args.get('type', ','.join(search.RESULT_TYPES)).split(',') if t]
+    if not types or set(types) - set(search.RESULT_TYPES):
+        return jsonify({'error': f"type must be one of {', '.join(search.RESULT_TYPES)}"}), 400
+
+    def narrow(query):
+        query = filter_rfqs(query, request.args)
+        if request.args.get('rfq_id'):
+            query = query.filter(RFQ.id == int(request.args['rfq_id']))
+        return query
+
+    try:
+        offset = max(0, int(request.args.get('offset', 0)))
+        result = search.search(request.args.get('q', ''), user, types, narrow,
+                               page_size(request.args), offset,
+                               prefix=request.args.get('prefix') in ('1', 'true'))
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': f"Invalid search: {str(e)}"}), 400
+    return jsonify(result)
+
+
+@user_bp.route('/rfqs/recommended', methods=['GET'])
+@role_required('bidder')
+def get_recommended_rfqs():
+    """?k= open RFQs closest to the bidder's profile and past bids"""
+    user = current_user()
+    try:
+        k = int(request.args.get('k', 10))
+    except ValueError:
+        return jsonify({'error': 'k must be an integer'}), 400
+    results = recommend.recommend(user, k)
+    db.session.commit()  # keep the profile embeddings computed for it
+    return jsonify(results)
 
 
 @user_bp.route('/rfqs/<int:rfq_id>', methods=['GET'])
@@ -136,14 +307,10 @@ def get_rfq(rfq_id):
 @login_required
 def serve_rfq_file(rfq_id, filename):
     rfq = RFQ.query.get_or_404(rfq_id)
-    upload_dir = os.path.join(
-        current_app.config.get("UPLOAD_FOLDER", "uploads"),
-        "rfqs", str(rfq_id)
-    )
-    file_path = os.path.join(upload_dir, filename)
-    if not os.path.exists(file_path):
+    rfq_file = RFQFile.query.filter_by(rfq_id=rfq.id, filename=filename).first()
+    if rfq_file is None or not os.path.exists(rfq_file.filepath):
         return jsonify({"error": "File not found"}), 404
-    return send_file(file_path, as_attachment=True)
+    return send_file(rfq_file.filepath, as_attachment=True, download_name=rfq_file.filename)
 
 
 @user_bp.route('/rfqs', methods=['POST'])
@@ -170,20 +337,7 @@ def create_rfq():
         budget_max = int(data.get('budget_max', 0) or 0)
         budget = budget_max or budget_min or 0
 
-        weights_str = data.get("evaluation_weights","")
-        if weights_str and "=" in weights_str:
-            weights_dict = {k.strip().lower(): float(v.strip()) for k,v in (part.split("=") for part in weights_str.split(",")) if "=" in part}
-            weights_str = json.dumps(weights_dict)
-
-        onchain = create_rfq_onchain(
-            data.get('title',''), meta_hash, data.get('deadline',''),
-            data.get('category',''), budget, data.get('location','')
-        )
-
-        rfq_id_chain = onchain.get("rfqId")
-        tx_hash = onchain.get("txHash")
-        # if not rfq_id_chain or not tx_hash:
-        #     return jsonify({"error": "On-chain RFQ creation failed"}), 500
+        weights_str = normalize_weights(data.get("evaluation_weights",""))
 
         rfq = RFQ(
             owner_id=session['user_id'],
@@ -200,51 +354,129 @@ def create_rfq():
             end_date=data.get('end_date'),
             eligibility_requirements=data.get('eligibility_requirements'),
             evaluation_weights=weights_str,
-            onchain_id=rfq_id_chain,
-            tx_hash=tx_hash,
             status="open"
         )
         db.session.add(rfq)
-        db.session.commit()
+        db.session.flush()
 
+        if len(files) > UPLOAD_MAX_FILES:
+            raise UploadRejected(f"At most {UPLOAD_MAX_FILES} files per upload")
         for f in files:
             save_file(f, rfq.id)
+
+        # Outbox row committed with the RFQ; the tracker sends it afterwards and
+        # fills in onchain_id/tx_hash (via ref_id) once it is mined
+        create_rfq_onchain(
+            data.get('title',''), meta_hash, data.get('deadline',''),
+            data.get('category',''), budget, data.get('location',''),
+            ref_id=rfq.id
+        )
         db.session.commit()
+        # Extract text for search off the request thread
+        page_index.index_in_background(rfq.files)
 
         return jsonify(rfq.to_dict(include_files=True)), 201
 
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 413
+
     except Exception as e:
         db.session.rollback()
         current_app.logger.error(f"RFQ creation failed: {e}")
         return jsonify({'error': f"RFQ creation failed: {str(e)}"}), 500
 
 
+@user_bp.route('/rfqs/<int:rfq_id>/rescore', methods=['POST'])
+@role_required('owner')
+def rescore_rfq(rfq_id):
+    rfq = RFQ.query.get_or_404(rfq_id)
+    if rfq.owner_id != session['user_id']:
+        return jsonify({'error': 'Insufficient permissions'}), 403
+
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get("evaluation_weights"):
+            rfq.evaluation_weights = parse_weights_param(data["evaluation_weights"])
+            db.session.commit()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        # Reviews run on the evaluation workers; poll /bids/<id>/status or the RFQ's bids
+        jobs = enqueue_rescore(rfq.id)
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Re-scoring failed: {e}")
+        return jsonify({'error': f"Re-scoring failed: {str(e)}"}), 500
+    return jsonify({"rfq_id": rfq.id, "evaluation_weights": rfq.evaluation_weights,
+                    "jobs": [job.to_dict() for job in jobs]}), 202
+
+
+@user_bp.route('/rfqs/<int:rfq_id>/close', methods=['POST'])
+@role_required('owner')
+def close_rfq(rfq_id):
+    rfq = RFQ.query.get_or_404(rfq_id)
+    if rfq.owner_id != session['user_id']:
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    if rfq.status != "open":
+        return jsonify({'error': f"RFQ is already {rfq.status}"}), 409
+
+    rfq.status = "closed"
+    db.session.commit()
+    # Waits in the outbox for the RFQ's create if that hasn't been mined yet
+    rfq_onchain_id, waits_for = rfq_chain_ref(rfq)
+    if rfq_onchain_id is None and waits_for is None:
+        current_app.logger.warning(f"RFQ {rfq.id} was never written on-chain, skipping on-chain close")
+    else:
+        try:
+            close_rfq_onchain(rfq_onchain_id, ref_id=rfq.id, depends_on=waits_for)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"RFQ {rfq.id}: on-chain close failed: {e}")
+    return jsonify(rfq.to_dict())
+
+
 # ---------------------------
 # Bid Routes
 # ---------------------------
+def register_bid_onchain(bid):
+    """
+    Add the bid's document hash to the outbox for its RFQ. If the RFQ's own
+    create is still pending, the write waits for it and the tracker sends it
+    once the rfqId is known. A chain failure never fails the bid itself.
+    """
+    rfq = RFQ.query.get(bid.rfq_id)
+    rfq_onchain_id, waits_for = rfq_chain_ref(rfq) if rfq is not None else (None, None)
+    if rfq_onchain_id is None and waits_for is None:
+        current_app.logger.warning(f"Bid {bid.id}: RFQ {bid.rfq_id} was never written on-chain, skipping bid registration")
+        return
+    try:
+        submit_bid_onchain(rfq_onchain_id, Decimal(str(bid.price)), bid.document_hash,
+                           ref_id=bid.id, depends_on=waits_for)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Bid {bid.id}: on-chain registration failed: {e}")
+
+
 @user_bp.route('/bids', methods=['POST'])
 @role_required('bidder')
 def create_bid():
     try:
-        print("Step 1: Parsing request data...")
+        # Step 1: Parse the multipart request
         if request.content_type.startswith('multipart/form-data'):
             data_str = request.form.get('data', '{}')
             data = json.loads(data_str)
             files = request.files.getlist('files')
-            print("Step 1: Success - Request data parsed.")
         else:
-            print("Step 1: Failed - Content type is not multipart/form-data")
             return jsonify({"error": "Bid must include a file upload"}), 400
 
+        # Step 2: At least one document
         if not files:
-            print("Step 2: Failed - No files uploaded")
             return jsonify({"error": "At least one file (PDF/PPT) is required"}), 400
-        print(f"Step 2: {len(files)} file(s) uploaded successfully.")
 
         # Step 3: Save bid in DB
-        print("Step 3: Saving bid to database...")
-        from datetime import datetime
-
         # Convert timeline strings to date objects
         timeline_start_str = data.get('timeline_start')
         timeline_end_str = data.get('timeline_end')
@@ -271,122 +503,107 @@ def create_bid():
 
         db.session.add(bid)
         db.session.flush()
-        print(f"Step 3: Success - Bid saved with ID {bid.id}")
-
-        # Step 4: Save files
-        print("Step 4: Saving files...")
-        upload_dir = os.path.join(
-            current_app.config.get("UPLOAD_FOLDER", "uploads"),
-            "bids",
-            str(bid.id)
-        )
-        os.makedirs(upload_dir, exist_ok=True)
 
+        # Step 4: Save files (streamed and hashed into the deduplicated blob store)
+        if len(files) > UPLOAD_MAX_FILES:
+            raise UploadRejected(f"At most {UPLOAD_MAX_FILES} files per upload")
+        ingested = []
         for f in files:
-            filename = secure_filename(f.filename)
-            filepath = os.path.join(upload_dir, filename)
-            f.save(filepath)
-            bid_file = BidFile(bid_id=bid.id, filename=filename, filepath=filepath)
+            bid_file = BidFile(bid_id=bid.id)
+            ingested.append(blobs.attach(bid_file, f))
             db.session.add(bid_file)
-            print(f"Step 4: File saved - {filename}")
+        bid.document_hash = document_hash(ingested)
 
         db.session.commit()
-        print("Step 4: Success - All files saved and committed.")
-
-        # Step 5: Extract text from files
-        print("Step 5: Extracting text from files...")
-        from PyPDF2 import PdfReader
-        import pptx
-
-        text_content = ""
-        for bf in bid.files:
-            if bf.filename.lower().endswith(".pdf"):
-                reader = PdfReader(bf.filepath)
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text_content += page_text + "\n"
-                print(f"Step 5: Text extracted from PDF - {bf.filename}")
-            elif bf.filename.lower().endswith(".ppt") or bf.filename.lower().endswith(".pptx"):
-                prs = pptx.Presentation(bf.filepath)
-                for slide in prs.slides:
-                    for shape in slide.shapes:
-                        if hasattr(shape, "text"):
-                            text_content += shape.text + "\n"
-                print(f"Step 5: Text extracted from PPT - {bf.filename}")
-
-        bid.qualifications = text_content[:5000]
-        db.session.commit()
-        print("Step 5: Success - Text extraction complete.")
-
-        # Step 6: Phase 1 Evaluation
-        print("Step 6: Running Phase 1 evaluation...")
-        p1 = evaluate_phase1(bid.qualifications, bid.rfq_id)
-        bid.phase1_status = p1.get("status", "pending")
-        bid.phase1_report = {
-            "reasons": p1.get("reasons", []),
-            "missing": p1.get("missing", []),
-            "red_flags": p1.get("red_flags", [])
-        }
-        bid.red_flags = p1.get("red_flags", []) or []
-
-        if bid.phase1_status == "reject":
-            bid.status = "rejected"
-            print("Step 6: Phase 1 evaluation failed - Bid rejected.")
-        elif bid.phase1_status == "clarify":
-            bid.status = "needs_clarification"
-            print("Step 6: Phase 1 evaluation needs clarification.")
-        else:
-            bid.status = "submitted"
-            print("Step 6: Phase 1 evaluation passed.")
 
-        db.session.commit()
-        print("Step 6: Phase 1 evaluation committed to DB.")
-
-        # Step 7: Phase 2 Evaluation
-        if bid.phase1_status == "pass":
-            print("Step 7: Running Phase 2 evaluation...")
-            p2 = evaluate_phase2(bid)
-            bid.phase2_status = p2.get("status", "pending")
-            bid.phase2_score = p2.get("score")
-            bid.phase2_breakdown = p2.get("breakdown")
-            bid.red_flags = list(set((bid.red_flags or []) + p2.get("red_flags", [])))
-            db.session.commit()
-            print(f"Step 7: Phase 2 evaluation complete - Status: {bid.phase2_status}")
-        else:
-            print("Step 7: Phase 2 evaluation skipped (Phase 1 not passed).")
+        # Step 4b: Register the document hash on-chain (confirmed in the background)
+        register_bid_onchain(bid)
+
+        # Step 5: Queue text extraction + Phase 1/2 evaluation
+        job = enqueue_evaluation(bid.id)
+        current_app.logger.info(f"Bid {bid.id}: {len(files)} file(s) saved, evaluation job {job.id} queued")
 
-        print("Bid submission complete!")
-        return jsonify({"bid": bid.to_dict(include_files=True)}), 201
+        return jsonify({"bid": bid.to_dict(include_files=True), "job": job.to_dict()}), 202
+
+    except (UploadRejected, RequestEntityTooLarge) as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 413
 
     except Exception as e:
         db.session.rollback()
-        print("Error occurred during bid submission!")
-        print(str(e))
-        import traceback
-        traceback.print_exc()
+        current_app.logger.exception(f"Bid submission failed: {e}")
         return jsonify({'error': f"Bid submission failed: {str(e)}"}), 500
 
 
+@user_bp.route('/bids/<int:bid_id>/status', methods=['GET'])
+@login_required
+def get_bid_status(bid_id):
+    user = current_user()
+    bid = Bid.query.get_or_404(bid_id)
+    if bid.bidder_id != user.id and bid.rfq.owner_id != user.id and user.role != 'admin':
+        return jsonify({'error': 'Insufficient permissions'}), 403
+
+    job = latest_job(bid.id)
+    return jsonify({
+        "bid_id": bid.id,
+        "status": bid.status,
+        "phase1_status": bid.phase1_status,
+        "phase2_status": bid.phase2_status,
+        "phase2_score": bid.phase2_score,
+        "job": job.to_dict() if job else None
+    })
+
+
 @user_bp.route('/my-bids', methods=['GET','post'])
 @role_required('bidder')
 def get_my_bids():
-    bids = Bid.query.filter_by(bidder_id=session['user_id']).order_by(Bid.created_at.desc()).all()
-    return jsonify([bid.to_dict() for bid in bids])
+    query = (Bid.query.options(selectinload(Bid.files))
+             .filter_by(bidder_id=session['user_id'])
+             .order_by(Bid.created_at.desc()))
+    if request.args.get('status'):
+        query = query.filter(Bid.status == request.args['status'])
+    return list_response(query, Bid, lambda bids: [bid.to_dict() for bid in bids])
 
 
 @user_bp.route('/rfqs/<int:rfq_id>/bids', methods=['GET'])
 @login_required
 def get_rfq_bids(rfq_id):
-    user = User.query.get(session['user_id'])
+    user = current_user()
     rfq = RFQ.query.get_or_404(rfq_id)
+    query = Bid.query.options(selectinload(Bid.files))
     if user.role=='owner' and rfq.owner_id==user.id:
-        bids = Bid.query.filter_by(rfq_id=rfq_id).order_by(Bid.created_at.desc()).all()
+        query = query.filter_by(rfq_id=rfq_id).order_by(Bid.created_at.desc())
     elif user.role=='bidder':
-        bids = Bid.query.filter_by(rfq_id=rfq_id, bidder_id=user.id).order_by(Bid.created_at.desc()).all()
+        query = query.filter_by(rfq_id=rfq_id, bidder_id=user.id).order_by(Bid.created_at.desc())
     else:
         return jsonify({'error':'Insufficient permissions'}), 403
-    return jsonify([b.to_dict() for b in bids])
+    if request.args.get('status'):
+        query = query.filter(Bid.status == request.args['status'])
+    return list_response(query, Bid, lambda bids: [b.to_dict() for b in bids])
+
+
+@user_bp.route('/rfqs/<int:rfq_id>/bid-stats', methods=['GET'])
+@login_required
+def get_rfq_bid_stats(rfq_id):
+    user = current_user()
+    rfq = RFQ.query.get_or_404(rfq_id)
+    if not (user.role == 'admin' or (user.role == 'owner' and rfq.owner_id == user.id)):
+        return jsonify({'error': 'Insufficient permissions'}), 403
+    return jsonify(bid_stats.get(rfq_id).to_dict())
+
+
+@user_bp.route('/rfqs/<int:rfq_id>/onchain', methods=['GET'])
+@login_required
+def get_rfq_onchain(rfq_id):
+    """On-chain view of an RFQ and its bids, served from the event index."""
+    rfq = RFQ.query.get_or_404(rfq_id)
+    if rfq.onchain_id is None:
+        return jsonify({'error': 'RFQ is not on-chain yet'}), 404
+    chain_rfq = ChainRFQ.query.get(rfq.onchain_id)
+    if chain_rfq is None:
+        return jsonify({'error': 'RFQ not indexed yet', 'indexer': indexer.status()}), 404
+    bids = ChainBid.query.filter_by(rfq_id=rfq.onchain_id).order_by(ChainBid.id).all()
+    return jsonify({"rfq": chain_rfq.to_dict(), "bids": [b.to_dict() for b in bids]})
 
 
 # ---------------------------
@@ -395,14 +612,16 @@ def get_rfq_bids(rfq_id):
 @user_bp.route('/projects', methods=['GET'])
 @login_required
 def get_projects():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if user.role == 'owner':
-        projects = Project.query.join(RFQ).filter(RFQ.owner_id==user.id).all()
+        query = Project.query.join(RFQ).filter(RFQ.owner_id==user.id)
     elif user.role == 'bidder':
-        projects = Project.query.join(Bid).filter(Bid.bidder_id==user.id).all()
+        query = Project.query.join(Bid).filter(Bid.bidder_id==user.id)
     else:
-        projects = Project.query.all()
-    return jsonify([p.to_dict() for p in projects])
+        query = Project.query
+    if request.args.get('rfq_id', type=int):
+        query = query.filter(Project.rfq_id == request.args.get('rfq_id', type=int))
+    return list_response(query, Project, lambda projects: [p.to_dict() for p in projects])
 
 @user_bp.route('/projects/<int:project_id>', methods=['GET','post'])
 @login_required
@@ -471,51 +690,149 @@ def resubmit_milestone(milestone_id):
 # ---------------------------
 # Dashboard
 # ---------------------------
-@user_bp.route('/dashboard', methods=['GET','post'])
-@login_required
-def dashboard():
-    user = User.query.get(session['user_id'])
-    if not user:
-        return jsonify({"error": "User not found"}), 404
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", "10"))
+DASHBOARD_RECENT = 5
+
+dashboard_cache = TTLCache(ttl=DASHBOARD_CACHE_TTL)
+invalidate_on_commit(dashboard_cache, RFQ, Bid, Project, User)
 
+
+def build_dashboard(user):
+    """Counts via COUNT(*) and the few rows shown via LIMIT; never whole tables."""
     # ---------------- Bidder Dashboard ----------------
     if user.role == "bidder":
-        available_rfqs = RFQ.query.filter_by(status="open").order_by(RFQ.created_at.desc()).all()
-        bids = Bid.query.filter_by(bidder_id=user.id).order_by(Bid.created_at.desc()).all()
-        projects = Project.query.join(Bid).filter(Bid.bidder_id == user.id, Bid.status == "selected").all()
-
-        return jsonify({
+        open_rfqs = RFQ.query.filter_by(status="open")
+        my_bids = Bid.query.filter_by(bidder_id=user.id)
+        recent_rfqs = open_rfqs.order_by(RFQ.created_at.desc(), RFQ.id.desc()).limit(DASHBOARD_RECENT).all()
+        recent_bids = (my_bids.options(selectinload(Bid.files))
+                       .order_by(Bid.created_at.desc(), Bid.id.desc())
+                       .limit(DASHBOARD_RECENT)
+                       .all())
+        return {
             "role": "bidder",
-            "available_rfqs": len(available_rfqs),
-            "bid_count": len(bids),
-            "project_count": len(projects),
-            "recent_rfqs": [r.to_dict() for r in available_rfqs[:5]],
-            "bids": [b.to_dict() for b in bids[:5]]
-        })
+            "available_rfqs": open_rfqs.count(),
+            "bid_count": my_bids.count(),
+            "won_count": my_bids.filter(Bid.status == "selected").count(),
+            "project_count": Project.query.join(Bid).filter(Bid.bidder_id == user.id, Bid.status == "selected").count(),
+            "recent_rfqs": RFQ.to_dict_many(recent_rfqs),
+            "bids": [b.to_dict() for b in recent_bids]
+        }
 
     # ---------------- Owner Dashboard ----------------
     if user.role == "owner":
-        rfqs = RFQ.query.filter_by(owner_id=user.id).order_by(RFQ.created_at.desc()).all()
-        projects = Project.query.join(RFQ).filter(RFQ.owner_id == user.id).all()
-        return jsonify({
+        my_rfqs = RFQ.query.filter_by(owner_id=user.id)
+        by_status = dict(db.session.query(RFQ.status, func.count(RFQ.id))
+                         .filter(RFQ.owner_id == user.id)
+                         .group_by(RFQ.status)
+                         .all())
+        recent_rfqs = my_rfqs.order_by(RFQ.created_at.desc(), RFQ.id.desc()).limit(DASHBOARD_RECENT).all()
+        projects = Project.query.join(RFQ).filter(RFQ.owner_id == user.id)
+        recent_projects = projects.order_by(Project.created_at.desc(), Project.id.desc()).limit(DASHBOARD_RECENT).all()
+        return {
             "role": "owner",
-            "rfq_count": len(rfqs),
-            "project_count": len(projects),
-            "rfqs": [r.to_dict() for r in rfqs],
-            "projects": [p.to_dict() for p in projects]
-        })
+            "rfq_count": sum(by_status.values()),
+            "rfqs_by_status": by_status,
+            "bid_count": Bid.query.join(RFQ).filter(RFQ.owner_id == user.id).count(),
+            "project_count": projects.count(),
+            "rfqs": RFQ.to_dict_many(recent_rfqs),
+            "projects": [p.to_dict() for p in recent_projects]
+        }
 
     # ---------------- Admin Dashboard ----------------
     if user.role == "admin":
-        users = User.query.all()
-        return jsonify({
+        by_role = dict(db.session.query(User.role, func.count(User.id)).group_by(User.role).all())
+        recent_users = User.query.order_by(User.id.desc()).limit(DASHBOARD_RECENT).all()
+        return {
             "role": "admin",
-            "user_count": len(users),
-            "users": [u.to_dict() for u in users]
-        })
+            "user_count": sum(by_role.values()),
+            "users_by_role": by_role,
+            "rfq_count": RFQ.query.count(),
+            "bid_count": Bid.query.count(),
+            "project_count": Project.query.count(),
+            "users": [u.to_dict() for u in recent_users]
+        }
+
+    return None
 
-    return jsonify({"error": "Unknown role"}), 400
 
+@user_bp.route('/dashboard', methods=['GET','post'])
+@login_required
+def dashboard():
+    user = current_user()
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    data = dashboard_cache.get(user.id)
+    if data is None:
+        data = build_dashboard(user)
+        if data is None:
+            return jsonify({"error": "Unknown role"}), 400
+        dashboard_cache.set(user.id, data)
+    return jsonify(data)
+
+
+@user_bp.route('/admin/metrics', methods=['GET'])
+@role_required('admin')
+def get_metrics():
+    return jsonify({
+        "llm_batching": batch_metrics(),
+        "llm_cache": cache_metrics(),
+        "models": registry.status(),
+        "dashboard_cache": dashboard_cache.stats(),
+        "user_cache": user_cache.stats()
+    })
+
+
+
+@user_bp.route('/admin/bid-stats/rebuild', methods=['POST'])
+@role_required('admin')
+def rebuild_bid_stats():
+    return jsonify({"rebuilt": bid_stats.rebuild()})
+
+
+@user_bp.route('/admin/blobs/gc', methods=['POST'])
+@role_required('admin')
+def gc_blobs():
+    return jsonify(blobs.gc())
+
+
+@user_bp.route('/admin/users/<int:user_id>/sessions', methods=['DELETE'])
+@role_required('admin')
+def revoke_user_sessions(user_id):
+    User.query.get_or_404(user_id)
+    return jsonify({"revoked": sessions.revoke_user(user_id)})
+
+
+@user_bp.route('/admin/chain', methods=['GET'])
+@role_required('admin')
+def get_chain_status():
+    pending = ChainTransaction.query.filter_by(status="recorded").count()
+    in_flight = ChainTransaction.query.filter(ChainTransaction.status.in_(("sent", "cancelling"))).count()
+    queued = ChainTransaction.query.filter(ChainTransaction.status.in_(("queued", "batching"))).count()
+    waiting = ChainTransaction.query.filter_by(status="waiting").count()
+    return jsonify({**get_client().health(), "recorded_pending": pending, "queued": queued, "in_flight": in_flight,
+                    "waiting": waiting, "indexer": indexer.status()})
+
+
+@user_bp.route('/admin/chain/replay', methods=['POST'])
+@role_required('admin')
+def replay_chain_writes():
+    """
+    Requeue the failed writes in `ids` and wake the senders. Only the tracker
+    and batcher send, so requests never race their nonces; the tracker sends
+    everything `recorded` on its next pass.
+    """
+    data = request.get_json(silent=True) or {}
+    ids = data.get("ids") or []
+    if not isinstance(ids, list) or not all(isinstance(i, int) and not isinstance(i, bool) for i in ids):
+        return jsonify({'error': "ids must be a list of outbox row ids"}), 400
+    retried = retry_failed(ids) if ids else 0
+    db.session.commit()
+    pipeline.wake()
+    batcher.wake()
+    return jsonify({"retried": retried,
+                    "recorded_pending": ChainTransaction.query.filter_by(status="recorded").count(),
+                    "queued": ChainTransaction.query.filter_by(status="queued").count()}), 202
 
 
 # -----------------------------
@@ -524,7 +841,7 @@ def dashboard():
 @user_bp.route('/bidder/profile', methods=['GET'])
 @role_required('bidder')
 def get_bidder_profile():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
     return jsonify(user.to_dict()), 200
@@ -535,7 +852,7 @@ def get_bidder_profile():
 @user_bp.route('/bidder/profile', methods=['PUT'])
 @role_required('bidder')
 def update_bidder_profile():
-    user = User.query.get(session['user_id'])
+    user = current_user()
     if not user:
         return jsonify({"error": "User not found"}), 404
 
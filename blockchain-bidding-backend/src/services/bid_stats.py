@@ -0,0 +1,314 @@
+# src/services/bid_stats.py
+"""
+Maintains the materialized rfq_bid_stats table.
+
+- Writes to bids are turned into per-RFQ deltas by mapper events and applied
+  right after the flush, inside the same transaction, so the stats commit (or
+  roll back) together with the bids. Counts, the score sum/average and the
+  status breakdowns are adjusted in place; min/max are re-read only when a
+  bid at either end was removed or repriced, and the median only when prices
+  changed. A bid moved to another RFQ leaves one and joins the other
+- Writes that don't touch a counted column (reports, reviews, timelines) cost
+  nothing; when the old values of a write aren't loaded, or a row predates
+  phase2_score_sum, that RFQ is recomputed instead
+- The median is read with ORDER BY price LIMIT 1/2 OFFSET n/2 on the
+  (rfq_id, price) index rather than by loading prices into Python
+- Bulk writes skip mapper events; callers doing bulk_update_mappings on bids
+  call refresh() for the affected RFQs themselves
+- rebuild() recomputes every RFQ (CLI: `flask rebuild-bid-stats`)
+"""
+
+import logging
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.base import NO_VALUE
+
+from src.models.user import db, Bid, RFQ, RFQBidStats
+
+logger = logging.getLogger(__name__)
+
+_DELTA_KEY = "rfq_stats_deltas"
+_COUNTED = (("status", "status_counts"), ("phase1_status", "phase1_counts"), ("phase2_status", "phase2_counts"))
+_TRACKED = ("rfq_id", "price", "phase2_score") + tuple(attr for attr, _ in _COUNTED)
+
+
+def _grouped_counts(session, rfq_id: int, column) -> Dict[str, int]:
+    rows = session.execute(
+        select(column, func.count(Bid.id)).where(Bid.rfq_id == rfq_id).group_by(column)
+    ).all()
+    return {str(key): n for key, n in rows if key is not None}
+
+
+def _median_price(session, rfq_id: int, count: int) -> Optional[float]:
+    if count == 0:
+        return None
+    middle = (select(Bid.price)
+              .where(Bid.rfq_id == rfq_id)
+              .order_by(Bid.price)
+              .offset((count - 1) // 2)
+              .limit(1 if count % 2 else 2))
+    prices = session.execute(middle).scalars().all()
+    return sum(prices) / len(prices)
+
+
+def compute(session, rfq_id: int) -> dict:
+    count, min_price, max_price, score_sum, scored = session.execute(
+        select(func.count(Bid.id), func.min(Bid.price), func.max(Bid.price),
+               func.sum(Bid.phase2_score), func.count(Bid.phase2_score))
+        .where(Bid.rfq_id == rfq_id)
+    ).one()
+    return {
+        "rfq_id": rfq_id,
+        "bid_count": count,
+        "min_price": min_price,
+        "max_price": max_price,
+        "median_price": _median_price(session, rfq_id, count),
+        "avg_phase2_score": round(score_sum / scored, 4) if scored else None,
+        "scored_count": scored,
+        "phase2_score_sum": score_sum or 0.0,
+        "status_counts": _grouped_counts(session, rfq_id, Bid.status),
+        "phase1_counts": _grouped_counts(session, rfq_id, Bid.phase1_status),
+        "phase2_counts": _grouped_counts(session, rfq_id, Bid.phase2_status),
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def _write(session, rfq_ids: Iterable[int]):
+    """Recompute and replace the rows with Core statements (no ORM flush)."""
+    table = RFQBidStats.__table__
+    rfq_ids = sorted(set(rfq_ids))
+    if not rfq_ids:
+        return
+    existing = set(session.execute(select(RFQ.id).where(RFQ.id.in_(rfq_ids))).scalars())
+    session.execute(table.delete().where(table.c.rfq_id.in_(rfq_ids)))
+    rows = [compute(session, rfq_id) for rfq_id in rfq_ids if rfq_id in existing]
+    if rows:
+        session.execute(table.insert(), rows)
+    _expire(session, rfq_ids)
+
+
+def _expire(session, rfq_ids):
+    # ORM copies loaded before this flush are now stale
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, RFQBidStats) and obj.rfq_id in rfq_ids:
+            session.expire(obj)
+
+
+def refresh(rfq_ids: Iterable[int]):
+    """Recompute the stats of the given RFQs in the current session."""
+    _write(db.session, rfq_ids)
+
+
+def rebuild() -> int:
+    """Recompute every RFQ's stats; returns the number of rows written."""
+    rfq_ids = db.session.execute(select(RFQ.id)).scalars().all()
+    table = RFQBidStats.__table__
+    db.session.execute(table.delete())
+    _write(db.session, rfq_ids)
+    db.session.commit()
+    logger.info("Rebuilt bid stats for %d RFQs", len(rfq_ids))
+    return len(rfq_ids)
+
+
+def backfill() -> int:
+    """Build the table once for databases that predate it."""
+    if db.session.query(RFQBidStats.rfq_id).first() is None and db.session.query(RFQ.id).first() is not None:
+        return rebuild()
+    return 0
+
+
+def get(rfq_id: int) -> RFQBidStats:
+    """Stats row for an RFQ, computed on the spot if it has none yet."""
+    stats = db.session.get(RFQBidStats, rfq_id)
+    if stats is None:
+        refresh([rfq_id])
+        db.session.commit()
+        stats = db.session.get(RFQBidStats, rfq_id)
+    return stats
+
+
+# -------- Incremental maintenance --------
+class _Delta:
+    """Net change to one RFQ's bids within a flush."""
+
+    def __init__(self):
+        self.count = 0
+        self.scored = 0
+        self.score_sum = 0.0
+        self.prices = Counter()
+        self.counts = {column: Counter() for _, column in _COUNTED}
+        self.full = False  # recompute instead
+
+    def add(self, values: dict, sign: int = 1):
+        """Count a bid in (sign=1) or out (sign=-1)."""
+        self.count += sign
+        self.prices[values["price"]] += sign
+        self._score(values["phase2_score"], sign)
+        for attr, column in _COUNTED:
+            self._status(column, values[attr], sign)
+
+    def change(self, name: str, old, new):
+        """One column of a bid that stays in this RFQ changed from old to new."""
+        if name == "price":
+            self.prices[old] -= 1
+            self.prices[new] += 1
+        elif name == "phase2_score":
+            self._score(old, -1)
+            self._score(new, 1)
+        else:
+            column = dict(_COUNTED)[name]
+            self._status(column, old, -1)
+            self._status(column, new, 1)
+
+    def _score(self, score, sign):
+        if score is not None:
+            self.scored += sign
+            self.score_sum += sign * score
+
+    def _status(self, column, value, sign):
+        if value is not None:
+            self.counts[column][str(value)] += sign
+
+    def values(self, session, row) -> dict:
+        """Column values for the RFQ's stats row, or {} if nothing it shows changed."""
+        values = {}
+        added = [price for price, n in self.prices.items() if n > 0]
+        removed = [price for price, n in self.prices.items() if n < 0]
+        count = row.bid_count + self.count
+        if self.count:
+            values["bid_count"] = count
+        if added or removed:
+            if any(price in (row.min_price, row.max_price) for price in removed):
+                lo, hi = session.execute(select(func.min(Bid.price), func.max(Bid.price))
+                                         .where(Bid.rfq_id == row.rfq_id)).one()
+            else:
+                lo = min([p for p in (row.min_price, *added) if p is not None], default=None)
+                hi = max([p for p in (row.max_price, *added) if p is not None], default=None)
+            values.update(min_price=lo, max_price=hi, median_price=_median_price(session, row.rfq_id, count))
+        if self.scored or self.score_sum:
+            scored = row.scored_count + self.scored
+            total = row.phase2_score_sum + self.score_sum if scored else 0.0
+            values.update(scored_count=scored, phase2_score_sum=total,
+                          avg_phase2_score=round(total / scored, 4) if scored else None)
+        for column, changes in self.counts.items():
+            if any(changes.values()):
+                merged = Counter(getattr(row, column) or {})
+                merged.update(changes)
+                values[column] = {key: n for key, n in merged.items() if n > 0}
+        if values:
+            values["updated_at"] = datetime.utcnow()
+        return values
+
+
+def _delta(session, rfq_id) -> Optional[_Delta]:
+    if session is None or rfq_id is None:
+        return None
+    return session.info.setdefault(_DELTA_KEY, {}).setdefault(rfq_id, _Delta())
+
+
+def _old_values(state) -> Optional[dict]:
+    """Tracked columns as they were before this flush, or None if some aren't loaded."""
+    values = {}
+    for name in _TRACKED:
+        value = state.committed_state.get(name, state.dict.get(name, NO_VALUE))
+        if value is NO_VALUE:
+            return None
+        values[name] = value
+    return values
+
+
+def _old_value_loaded(target, value, oldvalue, initiator):
+    pass
+
+
+# Setting a counted column on an expired bid loads its old value first, so
+# the write can be applied as a delta (and a move leaves the old RFQ)
+for _name in _TRACKED:
+    event.listen(getattr(Bid, _name), "set", _old_value_loaded, active_history=True)
+
+
+@event.listens_for(Bid, "after_insert")
+def _bid_inserted(mapper, connection, target):
+    delta = _delta(Session.object_session(target), target.rfq_id)
+    if delta is not None:
+        delta.add({name: getattr(target, name) for name in _TRACKED})
+
+
+@event.listens_for(Bid, "after_delete")
+def _bid_deleted(mapper, connection, target):
+    state = inspect(target)
+    rfq_id = state.committed_state.get("rfq_id", state.dict.get("rfq_id"))
+    delta = _delta(state.session, None if rfq_id is NO_VALUE else rfq_id)
+    if delta is None:
+        return
+    old = _old_values(state)
+    if old is None:
+        delta.full = True
+    else:
+        delta.add(old, -1)
+
+
+@event.listens_for(Bid, "after_update")
+def _bid_updated(mapper, connection, target):
+    state = inspect(target)
+    changed = [name for name in _TRACKED
+               if name in state.committed_state and state.committed_state[name] != state.dict.get(name)]
+    if not changed:
+        return
+    session = state.session
+    old_rfq_id = state.committed_state.get("rfq_id", target.rfq_id)
+    if old_rfq_id in (NO_VALUE, None):
+        _delta(session, target.rfq_id).full = True
+        return
+    if old_rfq_id == target.rfq_id:
+        delta = _delta(session, target.rfq_id)
+        for name in changed:
+            old = state.committed_state[name]
+            if old is NO_VALUE:
+                delta.full = True
+                return
+            delta.change(name, old, state.dict.get(name))
+        return
+    # Moved to another RFQ: it leaves the old one with its old values
+    old, leaving, joining = _old_values(state), _delta(session, old_rfq_id), _delta(session, target.rfq_id)
+    if old is None:
+        leaving.full = joining.full = True
+        return
+    leaving.add(old, -1)
+    joining.add({name: getattr(target, name) for name in _TRACKED})
+
+
+@event.listens_for(RFQ, "after_insert")
+def _rfq_created(mapper, connection, target):
+    delta = _delta(Session.object_session(target), target.id)
+    if delta is not None:
+        delta.full = True
+
+
+@event.listens_for(Session, "after_flush_postexec")
+def _apply_deltas(session, flush_context):
+    deltas = session.info.pop(_DELTA_KEY, None)
+    if not deltas:
+        return
+    table = RFQBidStats.__table__
+    rows = {row.rfq_id: row for row in session.execute(select(table).where(table.c.rfq_id.in_(list(deltas))))}
+    recompute = []
+    for rfq_id, delta in deltas.items():
+        row = rows.get(rfq_id)
+        if delta.full or row is None or row.phase2_score_sum is None:
+            recompute.append(rfq_id)
+            continue
+        values = delta.values(session, row)
+        if values:
+            session.execute(table.update().where(table.c.rfq_id == rfq_id).values(**values))
+    _write(session, recompute)
+    _expire(session, set(deltas))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_deltas(session):
+    session.info.pop(_DELTA_KEY, None)
@@ -0,0 +1,194 @@
+# src/services/blobs.py
+"""
+Content-addressed, deduplicated storage for uploaded files.
+
+- Bytes live once under UPLOAD_FOLDER/blobs/<aa>/<bb>/<sha256>; RFQFile and
+  BidFile rows keep their own filename and point at the blob through
+  blob_sha256 (filepath is the blob path, so readers need no changes)
+- Blob.refcount is maintained by mapper events on the file rows, inside the
+  same flush as the insert/delete that changes it
+- gc() deletes blobs that have been unreferenced for BLOB_GC_GRACE_SECONDS and
+  sweeps files on disk that never made it into the table (e.g. the request
+  rolled back after the bytes were written). store_upload() touches the blob
+  row before it puts the file in place, and gc() re-checks the row in its
+  DELETE and removes the file before committing, so an upload racing gc()
+  either keeps the blob alive or finds it gone and writes the file again
+- Extracted text is not kept here; it lives once per sha256 in document_pages
+  (src/services/page_index.py)
+- adopt_existing() moves pre-blob uploads into the store
+"""
+
+import logging
+import os
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from flask import current_app
+from sqlalchemy import case, delete, event, inspect as sa_inspect, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import FileStorage
+
+from src.models.user import db, Blob, BidFile, RFQFile
+from src.services.ingest import IngestedFile, ingest_upload
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+BLOB_GC_GRACE_SECONDS = float(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))
+
+
+def blob_root() -> str:
+    return os.path.join(current_app.config.get("UPLOAD_FOLDER", "uploads"), "blobs")
+
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(blob_root(), sha256[:2], sha256[2:4], sha256)
+
+
+# ---------------------------
+# Storing
+# ---------------------------
+def store_upload(file) -> Tuple[Blob, IngestedFile]:
+    """
+    Stream an upload into the store. Returns the (possibly pre-existing) blob
+    and the ingest result; the caller points a file row at blob.sha256.
+    """
+    staging_root = os.path.join(blob_root(), "tmp")
+    os.makedirs(staging_root, exist_ok=True)
+    staging = tempfile.mkdtemp(dir=staging_root)
+    try:
+        item = ingest_upload(file, staging)
+        path = blob_path(item.sha256)
+        now = datetime.utcnow()
+        blobs = Blob.__table__
+        # Row first: the upsert holds SQLite's write lock until the caller
+        # commits, and refreshes unreferenced_at so gc() leaves the blob alone
+        db.session.execute(
+            sqlite_insert(blobs)
+            .values(sha256=item.sha256, keccak256=item.keccak256, size_bytes=item.size_bytes,
+                    path=path, refcount=0, created_at=now, unreferenced_at=now)
+            .on_conflict_do_update(
+                index_elements=["sha256"],
+                set_={"unreferenced_at": case((blobs.c.refcount <= 0, now), else_=blobs.c.unreferenced_at)})
+        )
+        if os.path.exists(path):
+            os.remove(item.filepath)  # duplicate bytes, keep the stored copy
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(item.filepath, path)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+    blob = db.session.get(Blob, item.sha256)
+    if blob.path != path:
+        blob.path = path
+    return blob, item
+
+
+def attach(row, file):
+    """Store `file` and point the RFQFile/BidFile `row` at its blob."""
+    blob, item = store_upload(file)
+    row.filename = item.filename
+    row.filepath = blob.path
+    row.size_bytes = item.size_bytes
+    row.sha256 = item.sha256
+    row.keccak256 = item.keccak256
+    row.blob_sha256 = blob.sha256
+    return item
+
+
+# ---------------------------
+# Reference counting
+# ---------------------------
+def _adjust(connection, sha256: Optional[str], delta: int):
+    if not sha256:
+        return
+    blobs = Blob.__table__
+    values = {"refcount": blobs.c.refcount + delta}
+    values["unreferenced_at"] = None if delta > 0 else datetime.utcnow()
+    connection.execute(update(blobs).where(blobs.c.sha256 == sha256).values(**values))
+
+
+def _file_inserted(mapper, connection, target):
+    _adjust(connection, target.blob_sha256, +1)
+
+
+def _file_deleted(mapper, connection, target):
+    _adjust(connection, target.blob_sha256, -1)
+
+
+def _file_updated(mapper, connection, target):
+    history = sa_inspect(target).attrs.blob_sha256.history
+    if history.has_changes():
+        for old in history.deleted:
+            _adjust(connection, old, -1)
+        for new in history.added:
+            _adjust(connection, new, +1)
+
+
+for _model in (RFQFile, BidFile):
+    event.listen(_model, "after_insert", _file_inserted)
+    event.listen(_model, "after_delete", _file_deleted)
+    event.listen(_model, "after_update", _file_updated)
+
+
+# ---------------------------
+# Maintenance
+# ---------------------------
+def gc(grace_seconds: float = BLOB_GC_GRACE_SECONDS) -> dict:
+    """Delete unreferenced blobs past the grace period and orphaned files on disk."""
+    cutoff = datetime.utcnow() - timedelta(seconds=grace_seconds)
+    candidates = (db.session.query(Blob.sha256, Blob.path)
+                  .filter(Blob.refcount <= 0, Blob.unreferenced_at < cutoff)
+                  .all())
+    blobs = Blob.__table__
+    deleted = freed = 0
+    for sha256, path in candidates:
+        # Re-checked: an upload may have referenced or touched the blob since
+        gone = db.session.execute(delete(blobs).where(blobs.c.sha256 == sha256, blobs.c.refcount <= 0,
+                                                      blobs.c.unreferenced_at < cutoff)).rowcount
+        if gone and os.path.exists(path):
+            freed += os.path.getsize(path)
+            os.remove(path)
+        db.session.commit()
+        deleted += gone
+
+    # Files with no row: written by a request that later rolled back
+    known = {sha for (sha,) in db.session.query(Blob.sha256)}
+    orphans = 0
+    root = blob_root()
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name in known or os.path.getmtime(path) > time.time() - grace_seconds:
+                continue
+            freed += os.path.getsize(path)
+            os.remove(path)
+            orphans += 1
+    logger.info("Blob GC: %d blobs, %d orphaned files, %d bytes freed", deleted, orphans, freed)
+    return {"deleted_blobs": deleted, "deleted_orphans": orphans, "bytes_freed": freed}
+
+
+def adopt_existing() -> dict:
+    """Move uploads stored before the blob store existed into it, deduplicating."""
+    upload_root = os.path.abspath(current_app.config.get("UPLOAD_FOLDER", "uploads"))
+    adopted = missing = 0
+    for model in (RFQFile, BidFile):
+        for row in model.query.filter(model.blob_sha256.is_(None)).all():
+            # Rows written on Windows hold backslash-separated paths
+            old_path = (row.filepath or "").replace("\\", os.sep)
+            if not old_path or not os.path.exists(old_path):
+                missing += 1
+                continue
+            with open(old_path, "rb") as f:
+                attach(row, FileStorage(stream=f, filename=row.filename))
+            db.session.commit()
+            if os.path.abspath(old_path).startswith(upload_root + os.sep):
+                os.remove(old_path)
+            adopted += 1
+    return {"adopted": adopted, "missing": missing,
+            "blobs": Blob.query.count(),
+            "bytes_stored": db.session.query(db.func.coalesce(db.func.sum(Blob.size_bytes), 0)).scalar()}
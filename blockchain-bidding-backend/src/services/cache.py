@@ -0,0 +1,130 @@
+# src/services/cache.py
+"""
+Small in-process TTL cache for read-heavy endpoints.
+
+- Entries expire after `ttl` seconds; the cache holds at most `max_entries`
+  (oldest-expiring entries are dropped first)
+- invalidate_on_commit() clears a cache whenever a session commits inserts,
+  updates or deletes of the given models, so a writer never reads its own
+  stale data. Other worker processes keep their copy until the TTL runs out,
+  which is why TTLs here should stay short
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+_MISSING = object()
+
+
+class TTLCache:
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, value)
+            if len(self._data) > self.max_entries:
+                self._prune()
+
+    def get_or_set(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(key, value)
+        return value
+
+    def incr(self, key: Hashable, amount: int = 1, ttl: Optional[float] = None) -> Tuple[int, float]:
+        """
+        Atomically add `amount` to a counter and return (new value, seconds
+        left). A missing or expired counter starts at 0 with a fresh `ttl`;
+        counters that drop to 0 are removed.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                self._data.pop(key, None)
+                if amount <= 0:
+                    return 0, 0.0
+                entry = (now + (self.ttl if ttl is None else ttl), 0)
+            expires, value = entry[0], entry[1] + amount
+            if value <= 0:
+                self._data.pop(key, None)
+                return 0, expires - now
+            self._data[key] = (expires, value)
+            if len(self._data) > self.max_entries:
+                self._prune()
+            return value, expires - now
+
+    def delete(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _prune(self):
+        now = time.monotonic()
+        for key in [k for k, (expires, _) in self._data.items() if expires <= now]:
+            del self._data[key]
+        overflow = len(self._data) - self.max_entries
+        if overflow > 0:
+            for key, _ in sorted(self._data.items(), key=lambda kv: kv[1][0])[:overflow]:
+                del self._data[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+                "ttl": self.ttl,
+            }
+
+
+def invalidate_on_commit(cache: TTLCache, *models):
+    """Clear `cache` after any commit that wrote one of `models`."""
+    flag = f"invalidate_{id(cache)}"
+
+    def mark(mapper, connection, target):
+        session = Session.object_session(target)
+        if session is not None:
+            session.info[flag] = True
+
+    for model in models:
+        for name in ("after_insert", "after_update", "after_delete"):
+            event.listen(model, name, mark)
+
+    @event.listens_for(Session, "after_commit")
+    def clear_after_commit(session):
+        if session.info.pop(flag, False):
+            cache.clear()
+
+    @event.listens_for(Session, "after_rollback")
+    def forget_after_rollback(session):
+        session.info.pop(flag, None)
@@ -9,30 +9,174 @@ Assumptions:
 - RFQFile and BidFile models expose .extract_text() (safe; return '' if cannot parse)
 """
 
+import hashlib
 import json
-from datetime import datetime
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
 from typing import Dict, Any, List, Tuple, Optional
 
 import numpy as np
 
-from src.models.user import RFQ, RFQFile, BidFile, Bid
+from flask import has_app_context
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+
+from src.models.user import db, RFQ, RFQFile, BidFile, Bid, DocumentEmbedding
 from src.services.llm import ask_llm_json, ask_llm
+from src.services.model_registry import registry
+from src.services import bid_stats
+
+logger = logging.getLogger(__name__)
 
 # ---- Embeddings (free local) ----
-# We lazy-load the model to keep startup fast
-_SENTS_MODEL = None
+# Loaded lazily through the model registry to keep startup fast
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+def _load_sentence_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+registry.register(EMBEDDING_MODEL_NAME, _load_sentence_model)
 
 def _get_sentence_model():
-    global _SENTS_MODEL
-    if _SENTS_MODEL is None:
-        from sentence_transformers import SentenceTransformer
-        _SENTS_MODEL = SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
-    return _SENTS_MODEL
+    return registry.get(EMBEDDING_MODEL_NAME)
+
+# Vectors are keyed by a hash of the embedded text, so identical documents
+# (e.g. the same RFQ text for every bid on it) are only encoded once. Hot
+# vectors are kept in a small in-process LRU in front of the DB table.
+# Everything in the store is a 2-D float32 matrix (one row per passage).
+_EMBED_MEMO_SIZE = 512
+_embed_memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+_embed_memo_lock = threading.Lock()
+
+# Chunking: MiniLM only sees max_seq_length tokens per sequence, so long
+# documents are split into overlapping token windows and encoded in batches.
+EMBED_BATCH_SIZE = 32
+CHUNK_OVERLAP_TOKENS = 32
+MAX_CHUNKS_PER_DOC = 256
+
+def _content_hash(text: str, kind: str = "doc") -> str:
+    return hashlib.sha256(f"{EMBEDDING_MODEL_NAME}\n{kind}\n{text}".encode("utf-8")).hexdigest()
+
+def _memo_put(key: str, mat: np.ndarray):
+    with _embed_memo_lock:
+        _embed_memo[key] = mat
+        _embed_memo.move_to_end(key)
+        while len(_embed_memo) > _EMBED_MEMO_SIZE:
+            _embed_memo.popitem(last=False)
+
+def _load_embedding(key: str) -> Optional[np.ndarray]:
+    with _embed_memo_lock:
+        mat = _embed_memo.get(key)
+        if mat is not None:
+            _embed_memo.move_to_end(key)
+            return mat
+    try:
+        row = DocumentEmbedding.query.get(key)
+    except Exception:
+        # No app context / table (e.g. unit tests) -> behave as a cache miss
+        return None
+    if row is None:
+        return None
+    mat = np.frombuffer(row.vector, dtype=np.float32).reshape(-1, row.dim)
+    _memo_put(key, mat)
+    return mat
+
+def _store_embedding(key: str, mat: np.ndarray):
+    """Add a vector to the caller's transaction under a savepoint; the caller commits."""
+    _memo_put(key, mat)
+    if not has_app_context():
+        # e.g. unit tests: the vector stays in the memo only
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(sqlite_insert(DocumentEmbedding.__table__).values(
+                content_hash=key,
+                model=EMBEDDING_MODEL_NAME,
+                dim=int(mat.shape[-1]),
+                vector=np.ascontiguousarray(mat, dtype=np.float32).tobytes(),
+                created_at=datetime.utcnow(),
+            ).on_conflict_do_nothing(index_elements=["content_hash"]))  # another worker stored it first
+    except IntegrityError:
+        pass  # stored by another worker between the insert and its conflict check
+    except Exception:
+        # The savepoint is rolled back; the caller's transaction and the memo are intact
+        logger.exception("Failed to store embedding %s", key)
+
+def _encode(texts: List[str]) -> np.ndarray:
+    model = _get_sentence_model()
+    mat = model.encode(texts, batch_size=EMBED_BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True)
+    return np.asarray(mat, dtype=np.float32).reshape(len(texts), -1)
 
 def _embed(text: str) -> np.ndarray:
+    text = text or ""
+    key = _content_hash(text)
+    mat = _load_embedding(key)
+    if mat is None:
+        mat = _encode([text])
+        _store_embedding(key, mat)
+    return mat[0]
+
+def _chunk_text(text: str, max_tokens: Optional[int] = None,
+                overlap: int = CHUNK_OVERLAP_TOKENS) -> List[str]:
+    """Split text into overlapping passages of at most `max_tokens` model tokens."""
+    if not text or not text.strip():
+        return []
     model = _get_sentence_model()
-    vec = model.encode([text or ""], normalize_embeddings=True)[0]
-    return np.asarray(vec, dtype=np.float32)
+    max_tokens = max_tokens or max(16, int(model.max_seq_length) - 2)  # room for [CLS]/[SEP]
+    step = max(1, max_tokens - overlap)
+
+    try:
+        enc = model.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)
+        offsets = enc["offset_mapping"]
+    except Exception:
+        # Slow tokenizers have no offsets; approximate ~0.75 words per token
+        words = text.split()
+        size = max(1, int(max_tokens * 0.75))
+        wstep = max(1, int(step * 0.75))
+        return [" ".join(words[i:i + size]) for i in range(0, len(words), wstep)][:MAX_CHUNKS_PER_DOC]
+
+    chunks = []
+    for start in range(0, len(offsets), step):
+        end = min(start + max_tokens, len(offsets))
+        chunks.append(text[offsets[start][0]:offsets[end - 1][1]])
+        if end == len(offsets) or len(chunks) >= MAX_CHUNKS_PER_DOC:
+            break
+    return chunks
+
+def _embed_chunks(text: str) -> np.ndarray:
+    """(n_chunks, dim) matrix of normalized passage embeddings, cached by content hash."""
+    text = text or ""
+    key = _content_hash(text, kind="chunks")
+    mat = _load_embedding(key)
+    if mat is None:
+        chunks = _chunk_text(text)
+        if not chunks:
+            return np.zeros((0, 0), dtype=np.float32)
+        mat = _encode(chunks)
+        _store_embedding(key, mat)
+    return mat
+
+def _chunk_similarity(rfq_mat: np.ndarray, bid_mat: np.ndarray) -> Dict[str, float]:
+    """
+    Cosine similarity of every RFQ passage against every bid passage.
+    - max: best single passage match
+    - mean: average over the full matrix
+    - coverage: mean over RFQ passages of their best bid match (max/mean pooling),
+      i.e. how much of the RFQ the bid actually addresses
+    """
+    if rfq_mat.size == 0 or bid_mat.size == 0:
+        return {"max": 0.0, "mean": 0.0, "coverage": 0.0}
+    sim = rfq_mat @ bid_mat.T  # rows are L2-normalized -> cosine
+    return {
+        "max": float(sim.max()),
+        "mean": float(sim.mean()),
+        "coverage": float(sim.max(axis=1).mean()),
+    }
 
 def _cosine(a: np.ndarray, b: np.ndarray) -> float:
     if a is None or b is None or a.size == 0 or b.size == 0:
@@ -54,19 +198,28 @@ def _parse_weights(weights_str: str) -> Dict[str, float]:
         return {"price": 0.3, "timeline": 0.2, "experience": 0.2, "semantic": 0.3}
 
 
+def _as_datetime(value) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        # Bid.timeline_start/end are Date columns, RFQ dates are ISO strings
+        return datetime(value.year, value.month, value.day)
+    return datetime.fromisoformat(value)
+
+
 def _days_between(start_iso: Optional[str], end_iso: Optional[str]) -> int:
     if not start_iso or not end_iso:
         return 0
     try:
-        s = datetime.fromisoformat(start_iso)
-        e = datetime.fromisoformat(end_iso)
+        s = _as_datetime(start_iso)
+        e = _as_datetime(end_iso)
         return max(0, (e - s).days)
     except Exception:
         return 0
 
 
-def _safe_join_texts(items: List[str], limit_chars: int = 12000) -> str:
-    """Join and cap text length so we don't overload the models."""
+def _safe_join_texts(items: List[str], limit_chars: Optional[int] = 12000) -> str:
+    """Join and cap text length so we don't overload the models (None = no cap)."""
     text = "\n\n".join([x for x in items if x])[:limit_chars]
     return text
 
@@ -167,67 +320,90 @@ Only return JSON.
 # ---------------------------
 # Phase 2 – Semantic + Weighted Scoring + AI red flags
 # ---------------------------
-def evaluate_phase2(bid: Bid) -> dict:
-    rfq = RFQ.query.get(bid.rfq_id)
-    weights = _parse_weights(rfq.evaluation_weights or {})
+SCORE_COMPONENTS = ("price", "timeline", "experience", "semantic")
+EXPERIENCE_KEYWORDS = ["experience", "methodology", "case study", "reference", "certification", "compliance"]
 
-    # --- Gather text from files (owner RFQ vs bidder submission)
-    rfq_files = RFQFile.query.filter_by(rfq_id=rfq.id).all()
-    bid_files = BidFile.query.filter_by(bid_id=bid.id).all()
 
-    # --- Collect RFQ text
+def _rfq_full_text(rfq: RFQ) -> str:
     rfq_texts = [rfq.scope or "", rfq.evaluation_criteria or "", rfq.eligibility_requirements or ""]
-    for f in rfq_files:
+    for f in RFQFile.query.filter_by(rfq_id=rfq.id).all():
         try:
             rfq_texts.append(f.extract_text() or "")
         except Exception:
             pass
-    rfq_text = _safe_join_texts(rfq_texts)
+    return _safe_join_texts(rfq_texts, limit_chars=None)
+
 
-    # --- Collect bidder text
+def _bid_full_text(bid: Bid, files=None) -> str:
     bid_texts = [bid.qualifications or ""]
-    for f in bid_files:
+    files = BidFile.query.filter_by(bid_id=bid.id).all() if files is None else files
+    for f in files:
         try:
             bid_texts.append(f.extract_text() or "")
         except Exception:
             pass
-    bid_text = _safe_join_texts(bid_texts)
+    return _safe_join_texts(bid_texts, limit_chars=None)
+
 
-    # --- Semantic similarity
+def _semantic_scores(rfq_text: str, bid_texts: List[str]) -> np.ndarray:
+    """
+    Coverage score per bid. All bid passages are stacked into one matrix so the
+    RFQ-vs-bids similarity is a single matmul, then max-pooled per bid segment.
+    """
+    scores = np.zeros(len(bid_texts), dtype=np.float32)
     try:
-        if rfq_text and bid_text:
-            emb_rfq = _embed(rfq_text)
-            emb_bid = _embed(bid_text)
-            semantic_score = max(0.0, min(1.0, _cosine(emb_rfq, emb_bid)))
-        else:
-            semantic_score = 0.0
+        rfq_mat = _embed_chunks(rfq_text) if rfq_text else np.zeros((0, 0), dtype=np.float32)
+        if rfq_mat.size == 0:
+            return scores
+        mats = [_embed_chunks(t) if t else np.zeros((0, 0), dtype=np.float32) for t in bid_texts]
+        present = [i for i, m in enumerate(mats) if m.size]
+        if not present:
+            return scores
+        stacked = np.vstack([mats[i] for i in present])
+        starts = np.cumsum([0] + [mats[i].shape[0] for i in present[:-1]])
+        sim = rfq_mat @ stacked.T                              # (rfq_chunks, all_bid_chunks)
+        best = np.maximum.reduceat(sim, starts, axis=1)        # (rfq_chunks, n_present)
+        scores[present] = best.mean(axis=0)
     except Exception:
-        semantic_score = 0.0
+        pass
+    return np.clip(scores, 0.0, 1.0)
+
+
+def _score_bids(rfq: RFQ, bids: List[Bid], semantic: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Vectorized weighted scoring.
+    Returns (components, totals): components is (n_bids, 4) in SCORE_COMPONENTS order.
+    """
+    weights = _parse_weights(rfq.evaluation_weights or {})
 
-    # --- Numeric scoring: price, timeline, experience
+    prices = np.array([float(b.price or 0) for b in bids], dtype=np.float64)
     bmin = rfq.budget_min or 0
     bmax = rfq.budget_max or (bmin + 1 if bmin else 1)
-    price_score = max(0.0, min(1.0, (bmax - float(bid.price)) / (bmax - bmin))) if bid.price > 0 and bmax > bmin else 0.5
+    if bmax > bmin:
+        price = np.where(prices > 0, np.clip((bmax - prices) / (bmax - bmin), 0.0, 1.0), 0.5)
+    else:
+        price = np.full(len(bids), 0.5)
 
     window_days = _days_between(rfq.start_date, rfq.end_date)
-    bid_days = _days_between(bid.timeline_start, bid.timeline_end)
-    timeline_score = 1.0 if not window_days else max(0.0, min(1.0, (window_days - abs(window_days - bid_days)) / window_days))
-
-    text_l = (bid.qualifications or "").lower()
-    exp_hits = sum(kw in text_l for kw in ["experience", "methodology", "case study", "reference", "certification", "compliance"])
-    experience_score = max(0.0, min(1.0, 0.3 + 0.1 * exp_hits))
-    if len(text_l) < 200:
-        experience_score *= 0.85
-
-    breakdown = {
-        "price": round(price_score, 3),
-        "timeline": round(timeline_score, 3),
-        "experience": round(experience_score, 3),
-        "semantic": round(semantic_score, 3),
-    }
-    total = max(0.0, min(1.0, sum(breakdown[k] * weights.get(k, 0.25) for k in breakdown)))
+    bid_days = np.array([_days_between(b.timeline_start, b.timeline_end) for b in bids], dtype=np.float64)
+    if window_days:
+        timeline = np.clip((window_days - np.abs(window_days - bid_days)) / window_days, 0.0, 1.0)
+    else:
+        timeline = np.ones(len(bids))
 
-    # --- AI analysis for missing points / red flags / clarifications
+    texts_l = [(b.qualifications or "").lower() for b in bids]
+    exp_hits = np.array([sum(kw in t for kw in EXPERIENCE_KEYWORDS) for t in texts_l], dtype=np.float64)
+    short = np.array([len(t) < 200 for t in texts_l])
+    experience = np.clip(0.3 + 0.1 * exp_hits, 0.0, 1.0) * np.where(short, 0.85, 1.0)
+
+    components = np.round(np.column_stack([price, timeline, experience, semantic]), 3)
+    w = np.array([weights.get(k, 0.25) for k in SCORE_COMPONENTS], dtype=np.float64)
+    totals = np.clip(components @ w, 0.0, 1.0)
+    return components, totals
+
+
+def _ai_review(rfq_text: str, bid_text: str) -> Dict[str, Any]:
+    """LLM pass for missing points / red flags / clarifications."""
     ai_prompt = f"""
 You compare an RFQ document to a bidder proposal.
 
@@ -249,22 +425,113 @@ BID TEXT:
     # Ensure it's a dict
     if not isinstance(extra, dict):
         extra = {"missing": [], "red_flags": [], "clarification_needed": []}
+    return {
+        "text_hash": _review_hash(rfq_text, bid_text),
+        "missing": extra.get("missing", []),
+        "red_flags": extra.get("red_flags", []),
+        "clarification_needed": extra.get("clarification_needed", []),
+    }
+
+
+def _review_hash(rfq_text: str, bid_text: str) -> str:
+    return hashlib.sha256(f"{rfq_text[:6000]}\x00{bid_text[:6000]}".encode("utf-8")).hexdigest()
+
 
-    # --- Decide status using score + AI signals
-    has_red_flags = bool(extra.get("red_flags"))
-    print(has_red_flags)
+def _decide_status(total: float, has_red_flags: bool) -> str:
     if total >= 0.72 and not has_red_flags:
-        status = "pass"
-    elif total >= 0.5:
-        status = "clarify"
-    else:
-        status = "reject"
+        return "pass"
+    if total >= 0.5:
+        return "clarify"
+    return "reject"
+
+
+def evaluate_phase2(bid: Bid) -> dict:
+    rfq = RFQ.query.get(bid.rfq_id)
+
+    rfq_full_text = _rfq_full_text(rfq)
+    bid_full_text = _bid_full_text(bid)
+
+    semantic = _semantic_scores(rfq_full_text, [bid_full_text])
+    components, totals = _score_bids(rfq, [bid], semantic)
+    breakdown = {k: float(v) for k, v in zip(SCORE_COMPONENTS, components[0])}
+    total = float(totals[0])
+
+    review = _ai_review(rfq_full_text[:12000], bid_full_text[:12000])
+    status = _decide_status(total, bool(review.get("red_flags")))
 
     return {
         "status": status,
         "score": round(total, 3),
         "breakdown": breakdown,
-        "missing": extra.get("missing", []),
-        "red_flags": extra.get("red_flags", []),
-        "clarification_needed": extra.get("clarification_needed", []),
+        "missing": review["missing"],
+        "red_flags": review["red_flags"],
+        "clarification_needed": review["clarification_needed"],
+        "review": review,
     }
+
+
+def rescore_rfq_bids(rfq_id: int, bid_ids: Optional[List[int]] = None) -> List[Dict[str, Any]]:
+    """
+    Re-rank the Phase-1-passed bids on an RFQ (all, or just `bid_ids`) with
+    the current weights. Runs LLM reviews, so it belongs on the job queue
+    (jobs.enqueue_rescore), not in a request.
+
+    Scores for all bids are computed as one batch of NumPy arrays and written
+    back with a single bulk update. The LLM red-flag review is only re-run for
+    bids whose text changed since their last review.
+    """
+    rfq = RFQ.query.get(rfq_id)
+    query = (Bid.query
+             .options(selectinload(Bid.files))
+             .filter(Bid.rfq_id == rfq_id, Bid.phase1_status == "pass"))
+    if bid_ids is not None:
+        query = query.filter(Bid.id.in_(bid_ids))
+    bids = query.order_by(Bid.id).all()
+    if rfq is None or not bids:
+        return []
+
+    rfq_full_text = _rfq_full_text(rfq)
+    bid_texts = [_bid_full_text(b, files=b.files) for b in bids]
+
+    semantic = _semantic_scores(rfq_full_text, bid_texts)
+    components, totals = _score_bids(rfq, bids, semantic)
+
+    # Reuse stored reviews when the texts they were computed from are unchanged
+    rfq_prompt_text = rfq_full_text[:12000]
+    reviews: List[Optional[Dict[str, Any]]] = []
+    stale = []
+    for i, (bid, text) in enumerate(zip(bids, bid_texts)):
+        prev = bid.phase2_review or {}
+        if prev.get("text_hash") == _review_hash(rfq_prompt_text, text[:12000]):
+            reviews.append(prev)
+        else:
+            reviews.append(None)
+            stale.append(i)
+    if stale:
+        # Concurrent calls are micro-batched by the LLM service
+        with ThreadPoolExecutor(max_workers=min(8, len(stale))) as pool:
+            fresh = list(pool.map(lambda i: _ai_review(rfq_prompt_text, bid_texts[i][:12000]), stale))
+        for i, review in zip(stale, fresh):
+            reviews[i] = review
+
+    updates = []
+    results = []
+    for bid, row, total, review in zip(bids, components, totals, reviews):
+        breakdown = {k: float(v) for k, v in zip(SCORE_COMPONENTS, row)}
+        phase1_flags = (bid.phase1_report or {}).get("red_flags", []) or []
+        update = {
+            "id": bid.id,
+            "phase2_score": round(float(total), 3),
+            "phase2_breakdown": breakdown,
+            "phase2_status": _decide_status(float(total), bool(review.get("red_flags"))),
+            "phase2_review": review,
+            "red_flags": list(set(phase1_flags + (review.get("red_flags") or []))),
+        }
+        updates.append(update)
+        results.append({k: update[k] for k in ("id", "phase2_score", "phase2_status", "phase2_breakdown")})
+
+    db.session.bulk_update_mappings(Bid, updates)
+    # Bulk updates bypass the mapper events that keep rfq_bid_stats current
+    bid_stats.refresh([rfq_id])
+    db.session.commit()
+    return sorted(results, key=lambda r: r["phase2_score"], reverse=True)
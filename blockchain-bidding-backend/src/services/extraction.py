@@ -0,0 +1,205 @@
+# src/services/extraction.py
+"""
+Text extraction for uploaded documents (PDF, PPTX, DOCX, plain text).
+
+- Documents are read page by page (slides for PPTX, explicit page breaks for
+  DOCX); callers iterate pages instead of building one large string, and can
+  start at any page to resume an interrupted extraction
+- Documents with at least EXTRACTION_PARALLEL_MIN_PAGES pages are split into
+  page ranges that run in a shared process pool, so one big PDF doesn't hold
+  the GIL of the web/evaluation process; results are still yielded in order
+- Nothing here touches the database: extracted pages are stored, with their
+  offsets, by src/services/page_index.py
+"""
+
+import atexit
+import hashlib
+import multiprocessing
+import os
+import threading
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterator, List, Optional
+from xml.etree import ElementTree
+
+# -------- Config --------
+EXTRACTION_WORKERS = int(os.getenv("EXTRACTION_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+EXTRACTION_PAGES_PER_TASK = int(os.getenv("EXTRACTION_PAGES_PER_TASK", "16"))
+# Smaller documents are cheaper to parse inline than to ship to a worker
+EXTRACTION_PARALLEL_MIN_PAGES = int(os.getenv("EXTRACTION_PARALLEL_MIN_PAGES", "32"))
+# Bump when extraction output changes so stored pages are re-extracted
+EXTRACTOR_VERSION = "1"
+
+TEXT_EXTENSIONS = (".txt", ".md", ".csv", ".json", ".xml", ".html", ".htm")
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def file_kind(filename: str) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".pdf"):
+        return "pdf"
+    if name.endswith(".pptx"):
+        return "pptx"
+    if name.endswith(".docx"):
+        return "docx"
+    if name.endswith(TEXT_EXTENSIONS):
+        return "text"
+    return "unknown"
+
+
+# ---------------------------
+# Parsers (run in pool workers too, so no app imports here)
+# ---------------------------
+def _page_count(path: str, kind: str) -> int:
+    if kind == "pdf":
+        from PyPDF2 import PdfReader
+        return len(PdfReader(path).pages)
+    if kind == "pptx":
+        import pptx
+        return len(pptx.Presentation(path).slides)
+    return 1
+
+
+def _pdf_pages(path: str, start: int, stop: Optional[int]) -> Iterator[str]:
+    from PyPDF2 import PdfReader
+    reader = PdfReader(path)
+    for page in reader.pages[start:stop]:
+        yield page.extract_text() or ""
+
+
+def _shape_texts(shapes) -> Iterator[str]:
+    for shape in shapes:
+        if getattr(shape, "has_text_frame", False) and shape.text:
+            yield shape.text
+        elif getattr(shape, "has_table", False):
+            for row in shape.table.rows:
+                cells = [cell.text for cell in row.cells if cell.text]
+                if cells:
+                    yield "\t".join(cells)
+        elif hasattr(shape, "shapes"):  # group
+            yield from _shape_texts(shape.shapes)
+
+
+def _pptx_pages(path: str, start: int, stop: Optional[int]) -> Iterator[str]:
+    import pptx
+    slides = list(pptx.Presentation(path).slides)
+    for slide in slides[start:stop]:
+        yield "\n".join(_shape_texts(slide.shapes))
+
+
+def _docx_pages(path: str) -> Iterator[str]:
+    """Paragraph text from word/document.xml, split at explicit page breaks."""
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        paragraphs: List[str] = []
+        for _, element in ElementTree.iterparse(xml):
+            if element.tag != _W + "p":
+                continue
+            runs = []
+            page_break = False
+            for node in element.iter():
+                if node.tag == _W + "t" and node.text:
+                    runs.append(node.text)
+                elif node.tag == _W + "tab":
+                    runs.append("\t")
+                elif (node.tag == _W + "br" and node.get(_W + "type") == "page") or node.tag == _W + "lastRenderedPageBreak":
+                    page_break = True
+            if page_break and paragraphs:
+                yield "\n".join(paragraphs)
+                paragraphs = []
+            if runs:
+                paragraphs.append("".join(runs))
+            element.clear()
+        if paragraphs:
+            yield "\n".join(paragraphs)
+
+
+def _text_pages(path: str, strict: bool) -> Iterator[str]:
+    with open(path, "r", encoding="utf-8", errors="strict" if strict else "replace") as f:
+        yield f.read()
+
+
+def _iter_range(path: str, kind: str, start: int = 0, stop: Optional[int] = None) -> Iterator[str]:
+    if kind == "pdf":
+        return _pdf_pages(path, start, stop)
+    if kind == "pptx":
+        return _pptx_pages(path, start, stop)
+    if kind == "docx":
+        return _docx_pages(path)
+    # Unknown extensions are tried as UTF-8 text, as RFQFile.extract_text always did
+    return _text_pages(path, strict=kind != "text")
+
+
+def _extract_range(path: str, kind: str, start: int, stop: int) -> List[str]:
+    """Pool task: the text of pages [start, stop)."""
+    return list(_iter_range(path, kind, start, stop))
+
+
+# ---------------------------
+# Process pool
+# ---------------------------
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: forking a process that runs web/worker threads can deadlock
+            _pool = ProcessPoolExecutor(max_workers=EXTRACTION_WORKERS,
+                                        mp_context=multiprocessing.get_context("spawn"))
+            atexit.register(shutdown)
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _parallel_pages(path: str, kind: str, count: int, first: int) -> Iterator[str]:
+    """Fan page ranges out to the pool, keeping a bounded number in flight."""
+    pool = _get_pool()
+    ranges = deque((start, min(start + EXTRACTION_PAGES_PER_TASK, count))
+                   for start in range(first, count, EXTRACTION_PAGES_PER_TASK))
+    pending = deque()
+    try:
+        while ranges or pending:
+            while ranges and len(pending) < EXTRACTION_WORKERS * 2:
+                start, stop = ranges.popleft()
+                pending.append(pool.submit(_extract_range, path, kind, start, stop))
+            yield from pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_pages(path: str, filename: str, start: int = 0) -> Iterator[str]:
+    """Parse `path` page by page from page `start`, in parallel for long PDF/PPTX files."""
+    kind = file_kind(filename)
+    if kind in ("pdf", "pptx"):
+        if EXTRACTION_WORKERS > 1:
+            count = _page_count(path, kind)
+            if count - start >= EXTRACTION_PARALLEL_MIN_PAGES:
+                return _parallel_pages(path, kind, count, start)
+        return _iter_range(path, kind, start)
+    # No random access into DOCX/text pages; re-read and skip
+    return islice(_iter_range(path, kind), start, None)
+
+
+def extract_text(path: str, filename: str) -> str:
+    """Whole-document text, uncached. Raises if the document can't be parsed."""
+    return "\n".join(page for page in iter_pages(path, filename) if page)
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
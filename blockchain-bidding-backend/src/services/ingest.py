@@ -0,0 +1,85 @@
+# src/services/ingest.py
+"""
+Streaming ingest for uploaded documents.
+
+- The upload is copied to disk in UPLOAD_CHUNK_SIZE chunks while SHA-256 and
+  keccak256 are updated from the same buffer, so each file is read exactly once
+  and memory use does not depend on its size
+- Writes go to a temporary ".part" file that is renamed into place only when
+  the copy completes; uploads over UPLOAD_MAX_FILE_BYTES are aborted and
+  removed without being written in full
+- document_hash() combines the per-file keccak256 digests into the single
+  hash a bid is registered with on-chain
+"""
+
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Iterable
+
+from Crypto.Hash import keccak
+from werkzeug.utils import secure_filename
+
+# -------- Config --------
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(64 * 1024)))
+UPLOAD_MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_MAX_FILES = int(os.getenv("UPLOAD_MAX_FILES", "20"))
+# Whole-request cap, enforced by Werkzeug before the form is parsed
+UPLOAD_MAX_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_BYTES", str(200 * 1024 * 1024)))
+
+
+class UploadRejected(ValueError):
+    """The upload breaks a size/count limit or is otherwise unusable."""
+
+
+@dataclass
+class IngestedFile:
+    filename: str
+    filepath: str
+    size_bytes: int
+    sha256: str
+    keccak256: str  # 0x-prefixed, as stored on-chain
+
+
+def ingest_upload(file, dest_dir: str, max_bytes: int = UPLOAD_MAX_FILE_BYTES) -> IngestedFile:
+    """Stream a Werkzeug FileStorage into dest_dir, hashing as it goes."""
+    filename = secure_filename(file.filename or "")
+    if not filename:
+        raise UploadRejected("Uploaded file has no usable filename")
+
+    os.makedirs(dest_dir, exist_ok=True)
+    filepath = os.path.join(dest_dir, filename)
+    tmp_path = filepath + ".part"
+    sha = hashlib.sha256()
+    kec = keccak.new(digest_bits=256)
+    size = 0
+
+    try:
+        with open(tmp_path, "wb") as out:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(f"{filename} exceeds the {max_bytes // (1024 * 1024)} MB upload limit")
+                sha.update(chunk)
+                kec.update(chunk)
+                out.write(chunk)
+        if size == 0:
+            raise UploadRejected(f"{filename} is empty")
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    return IngestedFile(filename, filepath, size, sha.hexdigest(), "0x" + kec.hexdigest())
+
+
+def document_hash(files: Iterable[IngestedFile]) -> str:
+    """keccak256 over the files' keccak256 digests, in upload order."""
+    kec = keccak.new(digest_bits=256)
+    for f in files:
+        kec.update(bytes.fromhex(f.keccak256[2:]))
+    return "0x" + kec.hexdigest()
@@ -0,0 +1,264 @@
+# src/services/jobs.py
+"""
+Persistent background queue for bid evaluation.
+
+- Jobs live in the `evaluation_jobs` table, so queued work survives restarts
+- A local pool of worker threads claims pending jobs with a compare-and-swap
+  UPDATE, so several processes can share the same SQLite queue safely
+- Each job extracts the bid text, runs Phase 1 and (if passed) Phase 2, and
+  writes every phase transition back to the Bid row as it happens
+- Rescore jobs (kind="rescore", one per Phase-1-passed bid) re-run Phase 2
+  scoring with the RFQ's current weights, reusing unchanged LLM reviews
+"""
+
+import logging
+import os
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, or_
+
+from src.models.user import db, Bid, EvaluationJob
+from src.services import page_index
+from src.services.evalution import evaluate_phase1, evaluate_phase2, rescore_rfq_bids
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+EVALUATION_WORKERS = int(os.getenv("EVALUATION_WORKERS", "2"))
+POLL_INTERVAL = float(os.getenv("EVALUATION_POLL_SECONDS", "2.0"))
+# A running job whose worker has not finished within the lease is considered
+# abandoned (crashed process) and becomes claimable again.
+LEASE_SECONDS = int(os.getenv("EVALUATION_LEASE_SECONDS", "900"))
+MAX_ATTEMPTS = int(os.getenv("EVALUATION_MAX_ATTEMPTS", "3"))
+# Leading document text copied into bid.qualifications for the Phase 1 prompt;
+# the full text stays in the page index
+QUALIFICATIONS_EXCERPT_CHARS = int(os.getenv("QUALIFICATIONS_EXCERPT_CHARS", "5000"))
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers = []
+
+
+# ---------------------------
+# Producer side
+# ---------------------------
+def enqueue_evaluation(bid_id: int) -> EvaluationJob:
+    """Queue a bid for evaluation and wake the local workers."""
+    job = EvaluationJob(bid_id=bid_id, status="pending", stage="queued")
+    db.session.add(job)
+    db.session.commit()
+    _wakeup.set()
+    return job
+
+
+def enqueue_rescore(rfq_id: int) -> List[EvaluationJob]:
+    """Queue a rescore of every Phase-1-passed bid on the RFQ that isn't already queued."""
+    queued = {bid_id for (bid_id,) in (db.session.query(EvaluationJob.bid_id)
+                                       .join(Bid, Bid.id == EvaluationJob.bid_id)
+                                       .filter(Bid.rfq_id == rfq_id, EvaluationJob.kind == "rescore",
+                                               EvaluationJob.status == "pending"))}
+    bid_ids = [bid_id for (bid_id,) in (db.session.query(Bid.id)
+                                        .filter(Bid.rfq_id == rfq_id, Bid.phase1_status == "pass")
+                                        .order_by(Bid.id))
+               if bid_id not in queued]
+    jobs = [EvaluationJob(bid_id=bid_id, kind="rescore", status="pending", stage="queued") for bid_id in bid_ids]
+    db.session.add_all(jobs)
+    db.session.commit()
+    _wakeup.set()
+    return jobs
+
+
+def latest_job(bid_id: int) -> Optional[EvaluationJob]:
+    return (EvaluationJob.query
+            .filter_by(bid_id=bid_id)
+            .order_by(EvaluationJob.id.desc())
+            .first())
+
+
+# ---------------------------
+# Worker side
+# ---------------------------
+def _claim_next(worker_id: str) -> Optional[int]:
+    """Atomically move the oldest claimable job to `running`; return its id."""
+    stale_before = datetime.utcnow() - timedelta(seconds=LEASE_SECONDS)
+    claimable = or_(
+        EvaluationJob.status == "pending",
+        and_(EvaluationJob.status == "running", EvaluationJob.started_at < stale_before),
+    )
+    candidate = (db.session.query(EvaluationJob.id)
+                 .filter(claimable)
+                 .order_by(EvaluationJob.id)
+                 .first())
+    if candidate is None:
+        return None
+
+    claimed = (EvaluationJob.query
+               .filter(EvaluationJob.id == candidate.id, claimable)
+               .update({
+                   "status": "running",
+                   "worker_id": worker_id,
+                   "started_at": datetime.utcnow(),
+                   "attempts": EvaluationJob.attempts + 1,
+               }, synchronize_session=False))
+    db.session.commit()
+    # Another worker won the race for this row
+    return candidate.id if claimed == 1 else None
+
+
+def _set_stage(job: EvaluationJob, stage: str):
+    job.stage = stage
+    db.session.commit()
+
+
+def _index_documents(bid: Bid) -> str:
+    """
+    Index the bid's and the RFQ's files (resuming any interrupted extraction,
+    so a retried job doesn't start over) and return the bid's leading text.
+    """
+    docs = [page_index.index_row(bf) for bf in bid.files]
+    for rf in bid.rfq.files:  # read again by Phase 2
+        page_index.index_row(rf)
+    return page_index.leading_text([d.sha256 for d in docs if d is not None], QUALIFICATIONS_EXCERPT_CHARS)
+
+
+def _evaluate(job: EvaluationJob, bid: Bid):
+    """Extract, Phase 1 and (if passed) Phase 2 for a new bid."""
+    # Step 1: Extract text from files
+    _set_stage(job, "extract")
+    text_content = _index_documents(bid)
+    if text_content:
+        bid.qualifications = text_content
+    db.session.commit()
+
+    # Step 2: Phase 1 Evaluation
+    bid.phase1_status = "running"
+    _set_stage(job, "phase1")
+    p1 = evaluate_phase1(bid.qualifications, bid.rfq_id)
+    bid.phase1_status = p1.get("status", "pending")
+    bid.phase1_report = {
+        "reasons": p1.get("reasons", []),
+        "missing": p1.get("missing", []),
+        "red_flags": p1.get("red_flags", [])
+    }
+    bid.red_flags = p1.get("red_flags", []) or []
+
+    if bid.phase1_status == "reject":
+        bid.status = "rejected"
+    elif bid.phase1_status == "clarify":
+        bid.status = "needs_clarification"
+    else:
+        bid.status = "submitted"
+    db.session.commit()
+
+    # Step 3: Phase 2 Evaluation
+    if bid.phase1_status == "pass":
+        bid.phase2_status = "running"
+        _set_stage(job, "phase2")
+        p2 = evaluate_phase2(bid)
+        bid.phase2_status = p2.get("status", "pending")
+        bid.phase2_score = p2.get("score")
+        bid.phase2_breakdown = p2.get("breakdown")
+        bid.phase2_review = p2.get("review")
+        bid.red_flags = list(set((bid.red_flags or []) + p2.get("red_flags", [])))
+    else:
+        bid.phase2_status = "skipped"
+
+
+def _abandon_phases(bid: Bid):
+    """A failed job leaves no phase running."""
+    if bid.phase1_status == "running":
+        bid.phase1_status = "error"
+    if bid.phase2_status == "running":
+        bid.phase2_status = "error"
+
+
+def run_job(job_id: int):
+    """Run one claimed job to completion. Must be called inside an app context."""
+    job = EvaluationJob.query.get(job_id)
+    bid = Bid.query.get(job.bid_id)
+    if bid is None or (job.attempts or 0) > MAX_ATTEMPTS:
+        # Missing bid, or a job whose lease ran out on its last attempt (its worker died)
+        job.status = "failed"
+        job.error = "Bid not found" if bid is None else (job.error or "Exceeded max attempts")
+        job.finished_at = datetime.utcnow()
+        if bid is not None:
+            _abandon_phases(bid)
+        db.session.commit()
+        return
+
+    try:
+        if job.kind == "rescore":
+            _set_stage(job, "phase2")
+            rescore_rfq_bids(bid.rfq_id, bid_ids=[bid.id])
+        else:
+            _evaluate(job, bid)
+
+        job.stage = "complete"
+        job.status = "done"
+        job.error = None
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+        logger.info("Evaluation job %s for bid %s complete", job.id, bid.id)
+
+    except Exception:
+        db.session.rollback()
+        job = EvaluationJob.query.get(job_id)
+        job.error = traceback.format_exc()[-4000:]
+        if (job.attempts or 0) >= MAX_ATTEMPTS:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            _abandon_phases(Bid.query.get(job.bid_id))
+        else:
+            job.status = "pending"
+        db.session.commit()
+        logger.exception("Evaluation job %s failed (attempt %s)", job_id, job.attempts)
+
+
+def _worker_loop(app, worker_id: str):
+    while not _stop.is_set():
+        with app.app_context():
+            try:
+                job_id = _claim_next(worker_id)
+                if job_id is not None:
+                    run_job(job_id)
+                    continue
+            except Exception:
+                db.session.rollback()
+                logger.exception("Evaluation worker %s crashed while polling", worker_id)
+            finally:
+                db.session.remove()
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def start_workers(app, count: Optional[int] = None):
+    """Start `count` daemon worker threads bound to `app`."""
+    count = EVALUATION_WORKERS if count is None else count
+    _stop.clear()
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    for i in range(count):
+        worker_id = f"{base}:{i}"
+        t = threading.Thread(target=_worker_loop, args=(app, worker_id),
+                             name=f"evaluation-worker-{i}", daemon=True)
+        t.start()
+        _workers.append(t)
+
+
+def stop_workers(timeout: Optional[float] = None):
+    """Stop claiming new jobs and wait up to `timeout` seconds in total for in-flight ones."""
+    _stop.set()
+    _wakeup.set()
+    deadline = None if timeout is None else time.monotonic() + timeout
+    for t in _workers:
+        t.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+    _workers.clear()
+
+
+def init_app(app):
+    app.config.setdefault("EVALUATION_WORKERS", EVALUATION_WORKERS)
+    start_workers(app, app.config["EVALUATION_WORKERS"])
@@ -4,45 +4,211 @@ Local, free LLM utilities using Hugging Face Transformers.
 
 - Uses google/flan-t5-base (free) for instruction-following text2text generation
 - Provides ask_llm (raw text) and ask_llm_json (robust JSON with fallback)
+- Concurrent ask_llm calls are micro-batched into one padded generate() call
+- Deterministic (temperature=0) generations are served from a persistent cache
+- The model is loaded lazily through the shared model registry, not at import
 """
 
 import json
+import logging
+import os
+import queue
 import re
-from typing import Any, Dict, Optional
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
 
-import torch
-from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
+from src.services.llm_cache import get_cache
+from src.services.model_registry import registry
+
+logger = logging.getLogger(__name__)
 
 # -------- Config --------
 # Free, light, instruction-tuned model that runs on CPU/GPU
 MODEL_NAME = "google/flan-t5-base"
 
-# GPU if available, else CPU
-DEVICE = 0 if torch.cuda.is_available() else -1
+# Micro-batching: wait up to LLM_MAX_WAIT_MS for more prompts, up to LLM_MAX_BATCH_SIZE
+LLM_MAX_BATCH_SIZE = int(os.getenv("LLM_MAX_BATCH_SIZE", "8"))
+LLM_MAX_WAIT_MS = float(os.getenv("LLM_MAX_WAIT_MS", "25"))
+# Longest ask_llm waits for its batch before giving up
+LLM_RESULT_TIMEOUT = float(os.getenv("LLM_RESULT_TIMEOUT_SECONDS", "300"))
 
-# -------- Load once --------
-_tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
-_model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
-_generator = pipeline(
-    task="text2text-generation",
-    model=_model,
-    tokenizer=_tokenizer,
-    device=DEVICE,
-)
 
+# -------- Load on first use --------
+def _load_generator():
+    import torch
+    from transformers import AutoTokenizer, AutoModelForSeq2SeqLM, pipeline
 
-def ask_llm(prompt: str, max_new_tokens: int = 512, temperature: float = 0.0) -> str:
-    """
-    Run a prompt through the local model and return the raw string output.
-    """
-    out = _generator(
-        prompt,
+    # GPU if available, else CPU
+    device = 0 if torch.cuda.is_available() else -1
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_NAME, use_fast=True)
+    model = AutoModelForSeq2SeqLM.from_pretrained(MODEL_NAME)
+    return pipeline(
+        task="text2text-generation",
+        model=model,
+        tokenizer=tokenizer,
+        device=device,
+    )
+
+
+registry.register(MODEL_NAME, _load_generator)
+
+
+def _generate_batch(prompts: List[str], max_new_tokens: int, temperature: float) -> List[str]:
+    """Run several prompts through the pipeline as one padded batch."""
+    generator = registry.get(MODEL_NAME)
+    out = generator(
+        prompts,
+        batch_size=len(prompts),
         max_new_tokens=max_new_tokens,
         temperature=temperature,
         do_sample=temperature > 0,
         num_return_sequences=1,
     )
-    return out[0]["generated_text"]
+    # A list input yields one result per prompt, either a dict or a 1-item list
+    return [(r[0] if isinstance(r, list) else r)["generated_text"] for r in out]
+
+
+class BatchedGenerator:
+    """
+    Collects concurrent generation requests for up to `max_wait_ms` (or until
+    `max_batch_size` are queued) and runs them as a single batch on one
+    background thread. Each caller gets a Future for its own output.
+    """
+
+    def __init__(self, generate_fn, max_batch_size: int = 8, max_wait_ms: float = 25):
+        self._generate_fn = generate_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "batched_prompts": 0,
+            "max_batch_size_seen": 0,
+            "max_queue_depth": 0,
+            "total_queue_wait_ms": 0.0,
+        }
+
+    def submit(self, prompt: str, max_new_tokens: int, temperature: float) -> Future:
+        fut = Future()
+        self._ensure_started()
+        self._queue.put((prompt, max_new_tokens, temperature, fut, time.monotonic()))
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queue.qsize())
+        return fut
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["avg_batch_size"] = round(stats["batched_prompts"] / stats["batches"], 2) if stats["batches"] else 0.0
+        stats["avg_queue_wait_ms"] = round(stats["total_queue_wait_ms"] / stats["batched_prompts"], 2) if stats["batched_prompts"] else 0.0
+        stats["max_batch_size"] = self.max_batch_size
+        stats["max_wait_ms"] = self.max_wait * 1000.0
+        return stats
+
+    def _ensure_started(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="llm-batcher", daemon=True)
+                self._thread.start()
+
+    def _collect(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run_batch(batch)
+            except Exception:
+                logger.exception("LLM batch of %d prompts failed", len(batch))
+            finally:
+                # Never leave a caller waiting on a future this batch didn't resolve
+                for item in batch:
+                    if not item[3].done():
+                        item[3].set_exception(RuntimeError("LLM batch failed before producing this output"))
+
+    def _run_batch(self, batch: list):
+        started = time.monotonic()
+        with self._lock:
+            self._stats["batches"] += 1
+            self._stats["batched_prompts"] += len(batch)
+            self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(batch))
+            self._stats["total_queue_wait_ms"] += sum((started - i[4]) * 1000.0 for i in batch)
+
+        # Prompts with different generation settings can't share a generate() call
+        groups: Dict[tuple, list] = {}
+        for item in batch:
+            groups.setdefault((item[1], item[2]), []).append(item)
+
+        for (max_new_tokens, temperature), items in groups.items():
+            try:
+                texts = list(self._generate_fn([i[0] for i in items], max_new_tokens, temperature))
+                if len(texts) != len(items):
+                    raise RuntimeError(f"Model returned {len(texts)} outputs for {len(items)} prompts")
+                for item, text in zip(items, texts):
+                    item[3].set_result(text)
+            except Exception as e:
+                for item in items:
+                    if not item[3].done():
+                        item[3].set_exception(e)
+
+
+_batcher = BatchedGenerator(_generate_batch, LLM_MAX_BATCH_SIZE, LLM_MAX_WAIT_MS)
+
+
+def batch_metrics() -> Dict[str, Any]:
+    """Queue depth and batch-size counters for the shared generator."""
+    return _batcher.metrics()
+
+
+def cache_metrics() -> Dict[str, Any]:
+    """Hit/miss counters and size of the generation cache."""
+    cache = get_cache()
+    return cache.stats() if cache else {"enabled": False}
+
+
+def ask_llm(prompt: str, max_new_tokens: int = 512, temperature: float = 0.0) -> str:
+    """
+    Run a prompt through the local model and return the raw string output.
+    Concurrent callers are transparently batched together. Raises TimeoutError
+    if no output arrives within LLM_RESULT_TIMEOUT seconds.
+    """
+    # Greedy decoding is deterministic, so identical requests can be replayed
+    cache = get_cache() if temperature <= 0 else None
+    if cache is not None:
+        key = cache.make_key(MODEL_NAME, prompt, {
+            "max_new_tokens": max_new_tokens,
+            "temperature": temperature,
+            "num_return_sequences": 1,
+        })
+        hit = cache.get(key)
+        if hit is not None:
+            return hit
+
+    text = _batcher.submit(prompt, max_new_tokens, temperature).result(timeout=LLM_RESULT_TIMEOUT)
+
+    if cache is not None:
+        cache.put(key, MODEL_NAME, text)
+    return text
 
 
 def _extract_json_blob(text: str) -> Optional[str]:
@@ -0,0 +1,123 @@
+# src/services/model_registry.py
+"""
+Lazy model registry shared by the LLM and embedding services.
+
+- Models are registered with a loader callable and only loaded on first use
+- warmup() loads them ahead of time (e.g. before forking workers)
+- With MODEL_IDLE_TIMEOUT set, a reaper thread unloads models that have not
+  been used for that many seconds; the next get() reloads them transparently
+"""
+
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+# 0 / unset = keep models loaded for the life of the process
+MODEL_IDLE_TIMEOUT = float(os.getenv("MODEL_IDLE_TIMEOUT", "0"))
+
+
+class ModelRegistry:
+    def __init__(self, idle_timeout: Optional[float] = None):
+        self.idle_timeout = idle_timeout or None
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._last_used: Dict[str, float] = {}
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        with self._lock:
+            self._loaders[name] = loader
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def get(self, name: str) -> Any:
+        model = self._models.get(name)
+        if model is None:
+            if name not in self._loaders:
+                raise KeyError(f"No model registered under '{name}'")
+            # One loader per model at a time; other callers wait for it
+            with self._load_locks[name]:
+                model = self._models.get(name)
+                if model is None:
+                    started = time.monotonic()
+                    model = self._loaders[name]()
+                    self._models[name] = model
+                    logger.info("Loaded model %s in %.1fs", name, time.monotonic() - started)
+                    self._ensure_reaper()
+        self._last_used[name] = time.monotonic()
+        return model
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warmup(self, names: Optional[Iterable[str]] = None, background: bool = False):
+        """Load the given models (default: all registered) before they are needed."""
+        names = list(names) if names is not None else list(self._loaders)
+        if background:
+            threading.Thread(target=self.warmup, args=(names,), name="model-warmup", daemon=True).start()
+            return
+        for name in names:
+            self.get(name)
+
+    def unload(self, name: str):
+        with self._load_locks.get(name, self._lock):
+            model = self._models.pop(name, None)
+            self._last_used.pop(name, None)
+        if model is None:
+            return
+        del model
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logger.info("Unloaded idle model %s", name)
+
+    def unload_idle(self):
+        if not self.idle_timeout:
+            return
+        cutoff = time.monotonic() - self.idle_timeout
+        for name, last_used in list(self._last_used.items()):
+            if last_used < cutoff:
+                self.unload(name)
+
+    def status(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            name: {
+                "loaded": name in self._models,
+                "idle_seconds": round(now - self._last_used[name], 1) if name in self._last_used else None,
+            }
+            for name in self._loaders
+        }
+
+    def _ensure_reaper(self):
+        if not self.idle_timeout:
+            return
+        # Under the lock, so concurrent loads of different models start one reaper
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_loop, name="model-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap_loop(self):
+        interval = max(1.0, min(self.idle_timeout / 2, 60.0))
+        while True:
+            time.sleep(interval)
+            self.unload_idle()
+            # Exit and clear under the lock, so a model loaded meanwhile starts a new reaper
+            with self._lock:
+                if not self._models:
+                    self._reaper = None
+                    return
+
+
+registry = ModelRegistry(idle_timeout=MODEL_IDLE_TIMEOUT)
@@ -0,0 +1,216 @@
+# src/services/page_index.py
+"""
+Per-page store of extracted document text, with character offsets.
+
+- Documents are keyed by SHA-256, so identical uploads share one index entry
+- Pages are inserted in batches of PAGE_INDEX_COMMIT_PAGES and committed
+  together with the progress row (document_texts.pages_done / char_count); an
+  extraction cut short by a crash or restart resumes at the next page instead
+  of starting over
+- Page n covers [char_start, char_end) of the document text, i.e. all pages
+  joined with "\n"; read_pages() and read_chars() load only the pages a caller
+  asks for through the (sha256, char_start) index
+- Pages go in with INSERT OR IGNORE, so two workers indexing the same document
+  at once only duplicate effort
+- A document that fails to parse is marked failed and not retried until
+  EXTRACTOR_VERSION changes
+- index_document() commits the current session: call it with no pending work
+"""
+
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from flask import current_app
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from src.models.user import db, BidFile, DocumentPage, DocumentText, RFQFile
+from src.services import extraction
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+PAGE_INDEX_COMMIT_PAGES = int(os.getenv("PAGE_INDEX_COMMIT_PAGES", "16"))
+
+
+# ---------------------------
+# Indexing
+# ---------------------------
+def _start(sha256: str, filename: str) -> DocumentText:
+    """Progress row for a document, reset if it was built by an older extractor."""
+    doc = db.session.get(DocumentText, sha256)
+    if doc is not None and doc.extractor_version == extraction.EXTRACTOR_VERSION:
+        return doc
+
+    pages = DocumentPage.__table__
+    db.session.execute(pages.delete().where(pages.c.sha256 == sha256))
+    fresh = dict(filename=filename, extractor_version=extraction.EXTRACTOR_VERSION, status="running",
+                 pages_done=0, char_count=0, error=None, started_at=datetime.utcnow(),
+                 updated_at=datetime.utcnow(), completed_at=None)
+    if doc is None:
+        db.session.execute(sqlite_insert(DocumentText.__table__)
+                           .values(sha256=sha256, **fresh)
+                           .on_conflict_do_nothing(index_elements=["sha256"]))
+    else:
+        for key, value in fresh.items():
+            setattr(doc, key, value)
+    db.session.commit()
+    return db.session.get(DocumentText, sha256)
+
+
+def _save(doc: DocumentText, rows: List[dict], pages_done: int, char_count: int, **fields):
+    if rows:
+        db.session.execute(sqlite_insert(DocumentPage.__table__)
+                           .on_conflict_do_nothing(index_elements=["sha256", "page_no"]), rows)
+    texts = DocumentText.__table__
+    # Never move progress backwards if another worker got further
+    db.session.execute(update(texts)
+                       .where(texts.c.sha256 == doc.sha256, texts.c.pages_done <= pages_done)
+                       .values(pages_done=pages_done, char_count=char_count,
+                               updated_at=datetime.utcnow(), **fields))
+    db.session.commit()
+    db.session.expire(doc)
+
+
+def index_document(path: str, filename: str, sha256: Optional[str] = None) -> Optional[DocumentText]:
+    """Extract and store the pages of a document not yet indexed, resuming where a previous run stopped."""
+    try:
+        sha256 = sha256 or extraction.file_sha256(path)
+    except OSError as exc:
+        logger.warning("Cannot read %s for extraction: %s", path, exc)
+        return None
+
+    doc = _start(sha256, filename)
+    if doc.status in ("complete", "failed"):
+        return doc
+
+    page_no, offset = doc.pages_done, doc.char_count
+    if page_no:
+        logger.info("Resuming extraction of %s at page %d", filename, page_no)
+    batch = []
+    try:
+        for text in extraction.iter_pages(path, filename, start=page_no):
+            start = offset + 1 if page_no else 0  # pages are joined with "\n"
+            batch.append({"sha256": sha256, "page_no": page_no, "char_start": start,
+                          "char_end": start + len(text), "text": text})
+            page_no, offset = page_no + 1, start + len(text)
+            if len(batch) >= PAGE_INDEX_COMMIT_PAGES:
+                _save(doc, batch, page_no, offset)
+                batch = []
+        _save(doc, batch, page_no, offset, status="complete", completed_at=datetime.utcnow())
+    except Exception as exc:  # unreadable or unsupported document
+        db.session.rollback()
+        logger.warning("Text extraction failed for %s at page %d: %s", filename, page_no, exc)
+        texts = DocumentText.__table__
+        db.session.execute(update(texts)
+                           .where(texts.c.sha256 == sha256, texts.c.status != "complete")
+                           .values(status="failed", error=str(exc)[:1000], updated_at=datetime.utcnow()))
+        db.session.commit()
+        db.session.expire(doc)
+    return doc
+
+
+def index_row(row) -> Optional[DocumentText]:
+    """Index an RFQFile/BidFile."""
+    doc = index_document(row.filepath, row.filename, row.sha256)
+    if doc is not None and row.sha256 is None:
+        row.sha256 = doc.sha256  # rows saved before uploads were hashed
+    return doc
+
+
+# ---------------------------
+# Background indexing
+# ---------------------------
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="page-index")
+
+
+def _index_files(app, files):
+    with app.app_context():
+        for path, filename, sha256 in files:
+            try:
+                index_document(path, filename, sha256)
+            except Exception:
+                db.session.rollback()
+                logger.exception("Background indexing of %s failed", filename)
+        db.session.remove()
+
+
+def index_in_background(rows):
+    """
+    Index committed file rows off the request thread. Not durable: anything
+    lost to a restart is picked up by `flask index-documents` or by the next
+    reader, and resumes where it stopped.
+    """
+    files = [(row.filepath, row.filename, row.sha256) for row in rows]
+    if files:
+        _executor.submit(_index_files, current_app._get_current_object(), files)
+
+
+def index_all() -> dict:
+    """Index (or finish indexing) every RFQ and bid file. CLI: `flask index-documents`."""
+    counts = {}
+    for model in (RFQFile, BidFile):
+        for row in model.query.order_by(model.id).all():
+            doc = index_row(row)
+            db.session.commit()
+            status = doc.status if doc is not None else "missing"
+            counts[status] = counts.get(status, 0) + 1
+    return counts
+
+
+# ---------------------------
+# Reading
+# ---------------------------
+def read_pages(sha256: str, start: int = 0, stop: Optional[int] = None) -> List[DocumentPage]:
+    """Pages [start, stop) of a document."""
+    query = DocumentPage.query.filter(DocumentPage.sha256 == sha256, DocumentPage.page_no >= start)
+    if stop is not None:
+        query = query.filter(DocumentPage.page_no < stop)
+    return query.order_by(DocumentPage.page_no).all()
+
+
+def read_chars(sha256: str, start: int, end: int) -> str:
+    """Characters [start, end) of the document text, loading only the pages that overlap them."""
+    first = (db.session.query(DocumentPage.page_no, DocumentPage.char_start)
+             .filter(DocumentPage.sha256 == sha256, DocumentPage.char_start <= start)
+             .order_by(DocumentPage.char_start.desc())
+             .first())
+    if first is None or end <= start:
+        return ""
+    texts = (db.session.query(DocumentPage.text)
+             .filter(DocumentPage.sha256 == sha256,
+                     DocumentPage.page_no >= first.page_no,
+                     DocumentPage.char_start <= end)  # its "\n" separator may be in range
+             .order_by(DocumentPage.page_no)
+             .all())
+    joined = "\n".join(text for (text,) in texts)
+    return joined[start - first.char_start:end - first.char_start]
+
+
+def document_text(sha256: str) -> str:
+    texts = (db.session.query(DocumentPage.text)
+             .filter(DocumentPage.sha256 == sha256)
+             .order_by(DocumentPage.page_no))
+    return "\n".join(text for (text,) in texts)
+
+
+def leading_text(sha256s: Iterable[str], limit_chars: int) -> str:
+    """Up to limit_chars of the given documents' text, in order, reading only their first pages."""
+    parts, remaining = [], limit_chars
+    for sha256 in sha256s:
+        if remaining <= 0:
+            break
+        text = read_chars(sha256, 0, remaining).strip()
+        if text:
+            parts.append(text)
+            remaining -= len(text) + 1
+    return "\n".join(parts)[:limit_chars]
+
+
+def row_text(row) -> str:
+    """Full text of an RFQFile/BidFile, indexing it first if needed."""
+    doc = index_document(row.filepath, row.filename, row.sha256)
+    return document_text(doc.sha256) if doc is not None else ""
@@ -0,0 +1,74 @@
+# src/services/pagination.py
+"""
+Keyset pagination on (created_at, id), newest first.
+
+- The cursor is an opaque url-safe token holding the (created_at, id) of the
+  last row of the previous page; the next page is everything strictly older,
+  so pages stay stable while new rows are inserted
+- Each page is one indexed range scan (LIMIT n + 1 to know whether there is
+  a next page), no OFFSET
+"""
+
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, or_
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    payload = json.dumps({"t": created_at.isoformat(), "id": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(payload["t"]), int(payload["id"])
+    except Exception as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def wants_page(args) -> bool:
+    """Paginated envelope only when asked for, so existing clients keep getting a plain array."""
+    return "limit" in args or "cursor" in args
+
+
+def page_size(args) -> int:
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise InvalidCursor("limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def paginate(query, model, limit: int, cursor: Optional[str] = None):
+    """
+    Apply keyset ordering to `query` (over `model`) and return
+    (rows, next_cursor); next_cursor is None on the last page.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id),
+        ))
+    # Replace any ordering the caller set; the cursor only works with this one
+    rows = (query.order_by(None)
+            .order_by(model.created_at.desc(), model.id.desc())
+            .limit(limit + 1)
+            .all())
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1].created_at, rows[-1].id)
+    return rows, next_cursor
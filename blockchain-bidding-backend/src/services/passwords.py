@@ -0,0 +1,125 @@
+# src/services/passwords.py
+"""
+Password hashing and login throttling.
+
+- Hashes are werkzeug scrypt hashes ("scrypt:N:r:p$salt$hash") built with
+  PASSWORD_SCRYPT_N/R/P. needs_rehash() spots hashes made with other
+  parameters (or another method) so a successful login can upgrade them
+- scrypt runs on a pool of PASSWORD_HASH_WORKERS threads; hashlib releases the
+  GIL, so they hash on separate cores while the pool caps how many ~128*N*r
+  byte work areas exist at once. At most PASSWORD_HASH_QUEUE more requests
+  wait for a worker (up to PASSWORD_HASH_WAIT_SECONDS); past that HashingBusy
+  is raised and the caller answers 503 instead of piling up work
+- Failed logins are counted per username and per client IP over a fixed
+  window. check_throttle() counts each attempt as a failure up front, in one
+  atomic increment per counter, and refuses it over the limit before any
+  hashing is done; record_success()/release_attempt() give the count back. So
+  parallel guesses can't all pass the check before any is recorded. Counters
+  live in the process, so each worker enforces its own limits
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from src.services.cache import TTLCache
+
+# -------- Config --------
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 15)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "32"))
+PASSWORD_HASH_WAIT_SECONDS = float(os.getenv("PASSWORD_HASH_WAIT_SECONDS", "5"))
+LOGIN_FAILURE_WINDOW = int(os.getenv("LOGIN_FAILURE_WINDOW", "300"))
+LOGIN_MAX_FAILURES_PER_USER = int(os.getenv("LOGIN_MAX_FAILURES_PER_USER", "5"))
+LOGIN_MAX_FAILURES_PER_IP = int(os.getenv("LOGIN_MAX_FAILURES_PER_IP", "50"))
+
+
+class HashingBusy(RuntimeError):
+    """Every hashing worker and queue slot is taken."""
+
+
+class LoginThrottled(RuntimeError):
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+# ---------------------------
+# Hashing
+# ---------------------------
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE)
+
+
+def current_method() -> str:
+    return f"scrypt:{PASSWORD_SCRYPT_N}:{PASSWORD_SCRYPT_R}:{PASSWORD_SCRYPT_P}"
+
+
+def _run(fn, *args):
+    if not _slots.acquire(timeout=PASSWORD_HASH_WAIT_SECONDS):
+        raise HashingBusy("Too many logins in progress, try again shortly")
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password: str) -> str:
+    return _run(generate_password_hash, password, current_method())
+
+
+def verify_password(password_hash: Optional[str], password: str) -> bool:
+    if not password_hash or not password:
+        return False
+    return _run(check_password_hash, password_hash, password)
+
+
+def needs_rehash(password_hash: str) -> bool:
+    return password_hash.split("$", 1)[0] != current_method()
+
+
+# ---------------------------
+# Throttling
+# ---------------------------
+# key -> failures (including attempts in progress); entries expire with their window
+_failures = TTLCache(ttl=LOGIN_FAILURE_WINDOW, max_entries=100_000)
+
+
+def _limits(username: str, ip: Optional[str]):
+    yield ("user", (username or "").lower()), LOGIN_MAX_FAILURES_PER_USER
+    if ip:
+        yield ("ip", ip), LOGIN_MAX_FAILURES_PER_IP
+
+
+def check_throttle(username: str, ip: Optional[str]):
+    """
+    Count this attempt as a failed one; raise LoginThrottled (counting nothing)
+    if that puts the username or IP over its limit.
+    """
+    counted = []
+    for key, limit in _limits(username, ip):
+        count, seconds_left = _failures.incr(key, ttl=LOGIN_FAILURE_WINDOW)
+        counted.append(key)
+        if count > limit:
+            for done in counted:
+                _failures.incr(done, -1)
+            raise LoginThrottled("Too many failed login attempts, try again later",
+                                 retry_after=max(1, int(seconds_left) + 1))
+
+
+def record_success(username: str, ip: Optional[str]):
+    """The attempt succeeded: clear the username's failures and give the IP its attempt back."""
+    _failures.delete(("user", (username or "").lower()))
+    if ip:
+        _failures.incr(("ip", ip), -1)
+
+
+def release_attempt(username: str, ip: Optional[str]):
+    """The attempt was never checked (e.g. HashingBusy); don't count it."""
+    for key, _ in _limits(username, ip):
+        _failures.incr(key, -1)
@@ -0,0 +1,263 @@
+# src/services/recommend.py
+"""
+RFQ recommendations for bidders from a vector index over open RFQs.
+
+- Each open RFQ is embedded from its title, scope and evaluation criteria with
+  the MiniLM model used for evaluation (evalution._embed, so vectors are cached
+  in document_embeddings by text hash) and kept in an IVFIndex persisted at
+  RFQ_INDEX_PATH
+- The index follows RFQ writes incrementally: creating, editing or closing an
+  RFQ queues its id after the commit, and a single background thread embeds
+  it or drops it. Closed and deleted RFQs leave the index
+- sync() reconciles the index with the rfqs table (open RFQs missing from the
+  index, or indexed RFQs no longer open). It runs at startup and, every
+  RFQ_INDEX_SYNC_SECONDS, after a recommendation request, which also picks up
+  RFQs written by other processes
+- A bidder is matched by the mean vector of their company profile and the
+  qualifications of their most recent bids. Results are filtered against the
+  database, so a stale index can only miss RFQs, never show closed ones
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from src.models.user import db, Bid, RFQ
+from src.services.vector_index import IVFIndex
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+RFQ_INDEX_PATH = os.getenv(
+    "RFQ_INDEX_PATH",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "database", "rfq_index.npz"),
+)
+RFQ_INDEX_SAVE_SECONDS = int(os.getenv("RFQ_INDEX_SAVE_SECONDS", "30"))
+RFQ_INDEX_SYNC_SECONDS = int(os.getenv("RFQ_INDEX_SYNC_SECONDS", "300"))
+RECOMMEND_HISTORY_BIDS = int(os.getenv("RECOMMEND_HISTORY_BIDS", "10"))
+RECOMMEND_MAX_K = 50
+
+_STALE_KEY = "rfq_index_stale"
+_INDEXED_FIELDS = ("status", "title", "scope", "evaluation_criteria")
+
+_index: Optional[IVFIndex] = None
+_index_lock = threading.Lock()
+_last_save = _last_sync = 0.0
+_app = None
+_executor: Optional[ThreadPoolExecutor] = None  # set by init_app()
+
+
+def rfq_text(rfq: RFQ) -> str:
+    return "\n".join(part for part in (rfq.title, rfq.scope, rfq.evaluation_criteria) if part)
+
+
+def _embed(text: str) -> np.ndarray:
+    from src.services import evalution  # heavy import, only needed once there is work
+    return evalution._embed(text)
+
+
+# ---------------------------
+# Index maintenance
+# ---------------------------
+def get_index() -> Optional[IVFIndex]:
+    """The loaded index, read from RFQ_INDEX_PATH on first use (None until anything is indexed)."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            try:
+                _index = IVFIndex.load(RFQ_INDEX_PATH)
+            except Exception as exc:  # unreadable file: rebuilt by the next sync
+                logger.warning("Ignoring unreadable RFQ index %s: %s", RFQ_INDEX_PATH, exc)
+        return _index
+
+
+def _add(rfq_id: int, vector: np.ndarray):
+    global _index
+    with _index_lock:
+        if _index is None or _index.dim != len(vector):
+            _index = IVFIndex(len(vector))
+        index = _index
+    index.add(rfq_id, vector)
+
+
+def _maintain(force_save: bool = False):
+    """Retrain once the index has outgrown its lists, and save it now and then."""
+    global _last_save
+    index = get_index()
+    if index is None:
+        return
+    if index.needs_training:
+        index.train()
+    if force_save or time.monotonic() - _last_save >= RFQ_INDEX_SAVE_SECONDS:
+        index.save(RFQ_INDEX_PATH)
+        _last_save = time.monotonic()
+
+
+def apply(rfq_ids: Iterable[int]):
+    """Bring the given RFQs' index entries up to date with the database."""
+    rfq_ids = list(rfq_ids)
+    rows = {r.id: r for r in RFQ.query.filter(RFQ.id.in_(rfq_ids)).all()}
+    for rfq_id in rfq_ids:
+        rfq = rows.get(rfq_id)
+        if rfq is not None and rfq.status == "open":
+            _add(rfq_id, _embed(rfq_text(rfq)))
+        elif get_index() is not None:
+            get_index().remove(rfq_id)
+    _maintain()
+
+
+def sync(force_save: bool = False) -> Dict[str, int]:
+    """Add open RFQs missing from the index and drop indexed RFQs that are no longer open."""
+    global _last_sync
+    _last_sync = time.monotonic()
+    open_ids = {rfq_id for (rfq_id,) in db.session.query(RFQ.id).filter(RFQ.status == "open")}
+    index = get_index()
+    indexed = index.ids() if index is not None else set()
+    removed = indexed - open_ids
+    for rfq_id in removed:
+        index.remove(rfq_id)
+    missing = sorted(open_ids - indexed)
+    for start in range(0, len(missing), 500):
+        chunk = RFQ.query.filter(RFQ.id.in_(missing[start:start + 500])).all()
+        for rfq in chunk:
+            _add(rfq.id, _embed(rfq_text(rfq)))
+        db.session.expunge_all()
+    _maintain(force_save=force_save or bool(removed or missing))
+    return {"added": len(missing), "removed": len(removed), "indexed": len(get_index() or ())}
+
+
+def rebuild() -> Dict[str, int]:
+    """Discard the index and embed every open RFQ again. CLI: `flask rebuild-rfq-index`."""
+    global _index
+    with _index_lock:
+        _index = None
+    if os.path.exists(RFQ_INDEX_PATH):
+        os.remove(RFQ_INDEX_PATH)
+    return sync(force_save=True)
+
+
+# ---------------------------
+# Change tracking
+# ---------------------------
+@event.listens_for(RFQ, "after_insert")
+@event.listens_for(RFQ, "after_delete")
+def _rfq_written(mapper, connection, target):
+    session = Session.object_session(target)
+    if session is not None:
+        session.info.setdefault(_STALE_KEY, set()).add(target.id)
+
+
+@event.listens_for(RFQ, "after_update")
+def _rfq_updated(mapper, connection, target):
+    state = inspect(target)
+    if any(state.attrs[name].history.has_changes() for name in _INDEXED_FIELDS):
+        _rfq_written(mapper, connection, target)
+
+
+def _run(app, job, *args):
+    with app.app_context():
+        try:
+            job(*args)
+            db.session.commit()  # embeddings computed by the job
+        except Exception:
+            db.session.rollback()
+            logger.exception("RFQ index update failed")
+        finally:
+            db.session.remove()
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_stale(session):
+    stale = session.info.pop(_STALE_KEY, None)
+    if stale and _executor is not None:
+        _executor.submit(_run, _app, apply, sorted(stale))
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale(session):
+    session.info.pop(_STALE_KEY, None)
+
+
+def init_app(app):
+    """Start index maintenance: load the saved index and sync it in the background."""
+    global _app, _executor
+    _app = app
+    _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rfq-index")
+    _executor.submit(_run, app, sync)
+
+
+def shutdown(timeout: Optional[float] = None):
+    """Finish queued index updates and save the index, waiting up to `timeout` seconds."""
+    global _executor
+    if _executor is None:
+        return
+    executor, _executor = _executor, None
+    saved = executor.submit(_maintain, True)  # runs after the queued updates
+    executor.shutdown(wait=False)
+    try:
+        saved.result(timeout)
+    except FutureTimeout:
+        logger.warning("RFQ index not saved within %ss; the next sync catches up", timeout)
+
+
+# ---------------------------
+# Recommendations
+# ---------------------------
+def _profile_vector(user) -> Optional[np.ndarray]:
+    bids = (Bid.query.filter(Bid.bidder_id == user.id, Bid.qualifications.isnot(None))
+            .order_by(Bid.created_at.desc())
+            .limit(RECOMMEND_HISTORY_BIDS)
+            .all())
+    texts = [user.company] + [bid.qualifications for bid in bids]
+    texts = [t.strip() for t in texts if t and t.strip()]
+    if not texts:
+        return None
+    return np.mean([_embed(t) for t in texts], axis=0)
+
+
+def _newest_open(exclude: set, k: int) -> List[RFQ]:
+    query = RFQ.query.filter(RFQ.status == "open")
+    if exclude:
+        query = query.filter(RFQ.id.notin_(exclude))
+    return query.order_by(RFQ.created_at.desc(), RFQ.id.desc()).limit(k).all()
+
+
+def recommend(user, k: int = 10) -> Dict:
+    """
+    Up to k open RFQs the bidder hasn't bid on, most similar first. Falls back
+    to the newest open RFQs when there's no profile to match or no index yet.
+    """
+    k = max(1, min(k, RECOMMEND_MAX_K))
+    if _executor is not None and time.monotonic() - _last_sync >= RFQ_INDEX_SYNC_SECONDS:
+        _executor.submit(_run, _app, sync)
+
+    bid_on = {rfq_id for (rfq_id,) in db.session.query(Bid.rfq_id).filter(Bid.bidder_id == user.id).distinct()}
+    index = get_index()
+    hits = []
+    if index is not None and len(index):
+        try:
+            query = _profile_vector(user)
+        except Exception as exc:  # embedding model unavailable
+            logger.warning("Cannot embed profile of user %s: %s", user.id, exc)
+            query = None
+        if query is not None:
+            # Over-fetch: some hits may have closed since they were indexed
+            hits = index.search(query, k * 2, exclude=bid_on)
+
+    if not hits:
+        return {"strategy": "recent", "results": [
+            dict(r, score=None) for r in RFQ.to_dict_many(_newest_open(bid_on, k))]}
+
+    rows = {r.id: r for r in RFQ.query.filter(RFQ.id.in_([rfq_id for rfq_id, _ in hits]),
+                                              RFQ.status == "open")}
+    ranked = [(rows[rfq_id], score) for rfq_id, score in hits if rfq_id in rows][:k]
+    dicts = RFQ.to_dict_many([rfq for rfq, _ in ranked])
+    return {"strategy": "similar",
+            "results": [dict(d, score=round(score, 4)) for d, (_, score) in zip(dicts, ranked)]}
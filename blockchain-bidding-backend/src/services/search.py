@@ -0,0 +1,232 @@
+# src/services/search.py
+"""
+Full-text search over RFQs and extracted document text (SQLite FTS5).
+
+- rfq_fts indexes rfqs.title/scope/evaluation_criteria and document_fts
+  indexes document_pages.text. Both are external-content tables (the text is
+  not stored twice) kept in sync by SQL triggers, so every insert, update and
+  delete made through any code path is reflected in the same transaction
+- The tables and triggers are created alongside db.create_all(); on a
+  database that predates them they are built once from the existing rows
+- Document hits are per page and map back to RFQ files or bid files through
+  their SHA-256, so one shared document is indexed once
+- Each index ranks its hits with bm25 (title matches weigh most). bm25
+  scores of different indexes aren't comparable, so RFQ hits and document
+  hits are merged by their position within their own index (reciprocal rank
+  fusion) rather than by raw score
+- HTML-escaped snippets with <mark> around the matched terms are computed
+  afterwards for the returned page only
+"""
+
+import html
+import re
+from typing import Dict, List, Optional
+
+from sqlalchemy import column, event, literal_column, table, text
+
+from src.models.user import db, Bid, BidFile, DocumentPage, RFQ, RFQFile
+
+MAX_QUERY_TERMS = 16
+SNIPPET_TOKENS = 16
+RANK_FUSION_K = 60  # the n-th hit of an index scores 1 / (K + n)
+RESULT_TYPES = ("rfq", "rfq_file", "bid_file")
+
+# Control characters can't appear in extracted text, so they're safe markers
+# to put in the snippet before escaping it
+_MARK_START, _MARK_END = "\x02", "\x03"
+
+_FTS_TABLES = {
+    "rfq_fts": [
+        """CREATE VIRTUAL TABLE rfq_fts USING fts5(
+               title, scope, evaluation_criteria,
+               content='rfqs', content_rowid='id', tokenize='porter unicode61')""",
+        """CREATE TRIGGER rfq_fts_ai AFTER INSERT ON rfqs BEGIN
+               INSERT INTO rfq_fts(rowid, title, scope, evaluation_criteria)
+               VALUES (new.id, new.title, new.scope, new.evaluation_criteria);
+           END""",
+        """CREATE TRIGGER rfq_fts_ad AFTER DELETE ON rfqs BEGIN
+               INSERT INTO rfq_fts(rfq_fts, rowid, title, scope, evaluation_criteria)
+               VALUES ('delete', old.id, old.title, old.scope, old.evaluation_criteria);
+           END""",
+        """CREATE TRIGGER rfq_fts_au AFTER UPDATE OF title, scope, evaluation_criteria ON rfqs BEGIN
+               INSERT INTO rfq_fts(rfq_fts, rowid, title, scope, evaluation_criteria)
+               VALUES ('delete', old.id, old.title, old.scope, old.evaluation_criteria);
+               INSERT INTO rfq_fts(rowid, title, scope, evaluation_criteria)
+               VALUES (new.id, new.title, new.scope, new.evaluation_criteria);
+           END""",
+    ],
+    "document_fts": [
+        """CREATE VIRTUAL TABLE document_fts USING fts5(
+               text, content='document_pages', content_rowid='id', tokenize='porter unicode61')""",
+        """CREATE TRIGGER document_fts_ai AFTER INSERT ON document_pages BEGIN
+               INSERT INTO document_fts(rowid, text) VALUES (new.id, new.text);
+           END""",
+        """CREATE TRIGGER document_fts_ad AFTER DELETE ON document_pages BEGIN
+               INSERT INTO document_fts(document_fts, rowid, text) VALUES ('delete', old.id, old.text);
+           END""",
+        """CREATE TRIGGER document_fts_au AFTER UPDATE OF text ON document_pages BEGIN
+               INSERT INTO document_fts(document_fts, rowid, text) VALUES ('delete', old.id, old.text);
+               INSERT INTO document_fts(rowid, text) VALUES (new.id, new.text);
+           END""",
+    ],
+}
+
+rfq_fts = table("rfq_fts", column("rowid"))
+document_fts = table("document_fts", column("rowid"))
+
+
+class InvalidQuery(ValueError):
+    """The search string has no searchable terms."""
+
+
+# ---------------------------
+# Schema
+# ---------------------------
+@event.listens_for(db.metadata, "after_create")
+def install(target, connection, **kw):
+    """Create the FTS tables and triggers that are missing, backfilling new tables."""
+    if connection.dialect.name != "sqlite":
+        return
+    existing = {name for (name,) in connection.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for name, statements in _FTS_TABLES.items():
+        if name in existing:
+            continue
+        for statement in statements:
+            connection.exec_driver_sql(statement)
+        connection.exec_driver_sql(f"INSERT INTO {name}({name}) VALUES ('rebuild')")
+
+
+def rebuild():
+    """Rebuild both indexes from their content tables (CLI: `flask rebuild-search`)."""
+    for name in _FTS_TABLES:
+        db.session.execute(text(f"INSERT INTO {name}({name}) VALUES ('rebuild')"))
+    db.session.commit()
+
+
+# ---------------------------
+# Querying
+# ---------------------------
+def fts_query(q: str, prefix: bool = False) -> str:
+    """
+    Turn free text into an FTS5 query in which every term must match.
+    Operators and quotes in the input are treated as plain text, so user input
+    can never be a syntax error. With `prefix` the last term also matches as a
+    prefix (search-as-you-type); it's opt-in because a short prefix can expand
+    to most of the index and every match has to be ranked.
+    """
+    terms = re.findall(r"\w+", q or "")[:MAX_QUERY_TERMS]
+    if not terms:
+        raise InvalidQuery("Search query has no searchable terms")
+    quoted = [f'"{term}"' for term in terms]
+    if prefix:
+        quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _render(snippet: Optional[str]) -> str:
+    escaped = html.escape(snippet or "")
+    return escaped.replace(_MARK_START, "<mark>").replace(_MARK_END, "</mark>")
+
+
+def _add_snippets(hits: List[Dict], match: str):
+    """
+    snippet() is the expensive part of a match, so it runs only for the hits
+    being returned: one query per FTS table, restricted to their rowids.
+    """
+    by_table: Dict[str, List[Dict]] = {}
+    for hit in hits:
+        by_table.setdefault(hit.pop("_fts"), []).append(hit)
+    for fts, table_hits in by_table.items():
+        column_index = -1 if fts == "rfq_fts" else 0
+        rowids = {hit["_rowid"] for hit in table_hits}
+        snippets = dict(db.session.execute(
+            text(f"SELECT rowid, snippet({fts}, {column_index}, :start, :end, '…', {SNIPPET_TOKENS}) "
+                 f"FROM {fts} WHERE {fts} MATCH :match AND rowid IN ({', '.join(map(str, rowids))})"),
+            {"start": _MARK_START, "end": _MARK_END, "match": match}).all())
+        for hit in table_hits:
+            hit["snippet"] = _render(snippets.get(hit.pop("_rowid")))
+
+
+def _rfq_hits(match: str, filter_rfqs, limit: int) -> List[Dict]:
+    query = (db.session.query(RFQ.id, RFQ.title, RFQ.status, RFQ.deadline,
+                              literal_column("bm25(rfq_fts, 10.0, 4.0, 2.0)").label("rank"))
+             .select_from(rfq_fts)
+             .join(RFQ, RFQ.id == rfq_fts.c.rowid)
+             .filter(text("rfq_fts MATCH :match")))
+    rows = filter_rfqs(query).params(match=match).order_by(literal_column("rank")).limit(limit).all()
+    return [{"type": "rfq", "rfq_id": r.id, "title": r.title, "status": r.status, "deadline": r.deadline,
+             "rank": r.rank, "_fts": "rfq_fts", "_rowid": r.id} for r in rows]
+
+
+def _document_query(file_model, *columns):
+    return (db.session.query(file_model.id.label("file_id"), file_model.filename,
+                             DocumentPage.id.label("page_id"), DocumentPage.page_no,
+                             RFQ.id.label("rfq_id"), RFQ.title, *columns,
+                             literal_column("bm25(document_fts)").label("rank"))
+            .select_from(document_fts)
+            .join(DocumentPage, DocumentPage.id == document_fts.c.rowid)
+            .join(file_model, file_model.sha256 == DocumentPage.sha256)
+            .filter(text("document_fts MATCH :match")))
+
+
+def _document_hit(row, kind: str) -> Dict:
+    return {"type": kind, "rfq_id": row.rfq_id, "title": row.title, "file_id": row.file_id,
+            "filename": row.filename, "page": row.page_no + 1,
+            "rank": row.rank, "_fts": "document_fts", "_rowid": row.page_id}
+
+
+def _rfq_file_hits(match: str, filter_rfqs, limit: int) -> List[Dict]:
+    query = _document_query(RFQFile).join(RFQ, RFQ.id == RFQFile.rfq_id)
+    rows = filter_rfqs(query).params(match=match).order_by(literal_column("rank")).limit(limit).all()
+    return [_document_hit(r, "rfq_file") for r in rows]
+
+
+def _bid_file_hits(match: str, filter_rfqs, limit: int, user) -> List[Dict]:
+    query = (_document_query(BidFile, Bid.id.label("bid_id"))
+             .join(Bid, Bid.id == BidFile.bid_id)
+             .join(RFQ, RFQ.id == Bid.rfq_id))
+    # Owners see bids on their RFQs, bidders their own bids
+    if user.role == "owner":
+        query = query.filter(RFQ.owner_id == user.id)
+    elif user.role != "admin":
+        query = query.filter(Bid.bidder_id == user.id)
+    rows = filter_rfqs(query).params(match=match).order_by(literal_column("rank")).limit(limit).all()
+    return [dict(_document_hit(r, "bid_file"), bid_id=r.bid_id) for r in rows]
+
+
+def search(q: str, user, types=RESULT_TYPES, filter_rfqs=lambda query: query,
+           limit: int = 20, offset: int = 0, prefix: bool = False) -> Dict:
+    """
+    Ranked hits of every requested type, merged by rank within each index.
+    filter_rfqs narrows any query that joins RFQ (status, category, deadline, ...).
+    """
+    match = fts_query(q, prefix)
+    window = offset + limit + 1  # one extra row tells us whether there's a next page
+    sources = []
+    if "rfq" in types:
+        sources.append(_rfq_hits(match, filter_rfqs, window))
+    documents = []
+    if "rfq_file" in types:
+        documents += _rfq_file_hits(match, filter_rfqs, window)
+    if "bid_file" in types:
+        documents += _bid_file_hits(match, filter_rfqs, window, user)
+    if documents:
+        # Same index, so bm25 orders RFQ and bid documents against each other
+        documents.sort(key=lambda hit: hit["rank"])
+        sources.append(documents[:window])
+
+    hits = []
+    for source in sources:
+        for position, hit in enumerate(source, 1):
+            del hit["rank"]
+            hit["score"] = round(1.0 / (RANK_FUSION_K + position), 6)
+            hits.append(hit)
+    hits.sort(key=lambda hit: -hit["score"])  # stable: RFQ hits first on ties
+    page = hits[offset:offset + limit]
+    _add_snippets(page, match)
+    return {
+        "query": q,
+        "results": page,
+        "next_offset": offset + limit if len(hits) > offset + limit else None,
+    }
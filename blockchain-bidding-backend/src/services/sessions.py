@@ -0,0 +1,241 @@
+# src/services/sessions.py
+"""
+Server-side sessions: the cookie carries only a signed random session id and
+the data lives in a store, so sessions can be revoked and are shared by every
+worker process.
+
+- SESSION_BACKEND=sqlite (default) keeps sessions in the `sessions` table with
+  an index on expires_at; a background thread deletes expired rows every
+  SESSION_PURGE_SECONDS
+- SESSION_BACKEND=redis keeps them in Redis (or anything speaking its
+  commands) at SESSION_REDIS_URL through a connection pool, so reading a
+  session never touches the database. Redis expires keys itself. Needs the
+  `redis` package
+- A session is written only when it changed, or when its expiry is more than
+  SESSION_REFRESH_SECONDS old, not on every request
+- The session id is replaced whenever the signed-in user changes (login,
+  switching accounts), and a session emptied by logout is deleted from the
+  store
+- revoke_user() signs a user out everywhere
+"""
+
+import logging
+import os
+import secrets
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import BadSignature, Signer
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from werkzeug.datastructures import CallbackDict
+
+from src.models.user import db, UserSession
+
+logger = logging.getLogger(__name__)
+
+# -------- Config --------
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "sqlite")  # sqlite | redis
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_REDIS_POOL_SIZE = int(os.getenv("SESSION_REDIS_POOL_SIZE", "20"))
+SESSION_PURGE_SECONDS = int(os.getenv("SESSION_PURGE_SECONDS", "600"))
+SESSION_REFRESH_SECONDS = int(os.getenv("SESSION_REFRESH_SECONDS", "3600"))
+
+_serializer = TaggedJSONSerializer()
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid: Optional[str] = None, expires_at: Optional[datetime] = None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.expires_at = expires_at
+        self.loaded_user_id = (initial or {}).get("user_id")
+        self.modified = False
+
+
+# ---------------------------
+# Stores
+# ---------------------------
+class SQLSessionStore:
+    """Sessions in the app database. Uses its own connection, never the request's ORM session."""
+
+    def get(self, sid: str):
+        """(data, expires_at) of a live session, or None."""
+        table = UserSession.__table__
+        with db.engine.connect() as conn:
+            row = conn.execute(select(table.c.data, table.c.expires_at)
+                               .where(table.c.sid == sid, table.c.expires_at > datetime.utcnow())).first()
+        return (row.data, row.expires_at) if row else None
+
+    def set(self, sid: str, data: str, expires_at: datetime, user_id: Optional[int]):
+        values = dict(data=data, expires_at=expires_at, user_id=user_id)
+        with db.engine.begin() as conn:
+            conn.execute(sqlite_insert(UserSession.__table__).values(sid=sid, **values)
+                         .on_conflict_do_update(index_elements=["sid"], set_=values))
+
+    def delete(self, sid: str):
+        with db.engine.begin() as conn:
+            conn.execute(delete(UserSession.__table__).where(UserSession.__table__.c.sid == sid))
+
+    def revoke_user(self, user_id: int) -> int:
+        with db.engine.begin() as conn:
+            return conn.execute(delete(UserSession.__table__)
+                                .where(UserSession.__table__.c.user_id == user_id)).rowcount
+
+    def purge(self) -> int:
+        with db.engine.begin() as conn:
+            return conn.execute(delete(UserSession.__table__)
+                                .where(UserSession.__table__.c.expires_at <= datetime.utcnow())).rowcount
+
+
+class RedisSessionStore:
+    """
+    Sessions as Redis strings with a TTL, plus a set of session ids per user
+    for revoke_user(). `client` is a redis.Redis or anything with the same
+    get/set/delete/sadd/smembers/expire methods.
+    """
+
+    def __init__(self, client, prefix: str = "session:"):
+        self.client = client
+        self.prefix = prefix
+
+    def _user_key(self, user_id) -> str:
+        return f"{self.prefix}user:{user_id}"
+
+    def get(self, sid: str):
+        raw = self.client.get(self.prefix + sid)
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode("utf-8")
+        expires_at, _, data = raw.partition("\n")
+        return data, datetime.fromisoformat(expires_at)
+
+    def set(self, sid: str, data: str, expires_at: datetime, user_id: Optional[int]):
+        ttl = max(1, int((expires_at - datetime.utcnow()).total_seconds()))
+        self.client.set(self.prefix + sid, f"{expires_at.isoformat()}\n{data}", ex=ttl)
+        if user_id is not None:
+            self.client.sadd(self._user_key(user_id), sid)
+            self.client.expire(self._user_key(user_id), ttl)
+
+    def delete(self, sid: str):
+        self.client.delete(self.prefix + sid)
+
+    def revoke_user(self, user_id: int) -> int:
+        key = self._user_key(user_id)
+        sids = [s.decode() if isinstance(s, bytes) else s for s in self.client.smembers(key)]
+        revoked = sum(self.client.delete(self.prefix + sid) for sid in sids)
+        self.client.delete(key)
+        return revoked
+
+    def purge(self) -> int:
+        return 0  # keys expire on their own
+
+
+def redis_store(url: str = SESSION_REDIS_URL) -> RedisSessionStore:
+    import redis  # optional dependency, only needed for SESSION_BACKEND=redis
+    pool = redis.ConnectionPool.from_url(url, max_connections=SESSION_REDIS_POOL_SIZE)
+    return RedisSessionStore(redis.Redis(connection_pool=pool))
+
+
+# ---------------------------
+# Session interface
+# ---------------------------
+class ServerSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def _signer(self, app) -> Signer:
+        return Signer(app.secret_key, salt="server-session")
+
+    def open_session(self, app, request) -> ServerSession:
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if cookie:
+            try:
+                sid = self._signer(app).unsign(cookie).decode()
+            except BadSignature:
+                sid = None
+            found = self.store.get(sid) if sid else None
+            if found is not None:
+                data, expires_at = found
+                return ServerSession(_serializer.loads(data), sid=sid, expires_at=expires_at)
+        return ServerSession()
+
+    def save_session(self, app, session: ServerSession, response):
+        name, domain, path = self.get_cookie_name(app), self.get_cookie_domain(app), self.get_cookie_path(app)
+        if not session:
+            if session.sid is not None:  # emptied, e.g. by logout
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        user_id = session.get("user_id")
+        rotate = session.sid is None or user_id != session.loaded_user_id
+        lifetime = app.permanent_session_lifetime
+        now = datetime.utcnow()
+        stale = session.expires_at is None or session.expires_at - now < lifetime - timedelta(seconds=SESSION_REFRESH_SECONDS)
+        if not (rotate or session.modified or stale):
+            return
+
+        if rotate:
+            if session.sid is not None:
+                self.store.delete(session.sid)  # don't keep a pre-login id alive
+            session.sid = secrets.token_urlsafe(32)
+            session.loaded_user_id = user_id
+        session.expires_at = now + lifetime
+        self.store.set(session.sid, _serializer.dumps(dict(session)), session.expires_at, user_id)
+        response.vary.add("Cookie")
+        response.set_cookie(
+            name, self._signer(app).sign(session.sid).decode(),
+            expires=self.get_expiration_time(app, session), httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+            partitioned=self.get_cookie_partitioned(app),
+        )
+
+
+# ---------------------------
+# Setup
+# ---------------------------
+_store = None
+_stop = threading.Event()
+
+
+def _purge_loop(app):
+    while not _stop.wait(SESSION_PURGE_SECONDS):
+        with app.app_context():
+            try:
+                purged = _store.purge()
+                if purged:
+                    logger.info("Purged %d expired sessions", purged)
+            except Exception:
+                logger.exception("Session purge failed")
+
+
+def revoke_user(user_id: int) -> int:
+    """Delete every session of a user; returns how many were removed."""
+    return _store.revoke_user(user_id) if _store is not None else 0
+
+
+def init_app(app, store=None):
+    """Serve sessions from `store` (default: SESSION_BACKEND)."""
+    global _store
+    if store is None:
+        store = redis_store() if SESSION_BACKEND == "redis" else SQLSessionStore()
+    _store = store
+    app.session_interface = ServerSessionInterface(store)
+
+
+def start_purge(app):
+    """Delete expired sessions in the background (SQLite store only)."""
+    if isinstance(_store, SQLSessionStore):
+        _stop.clear()
+        threading.Thread(target=_purge_loop, args=(app,), name="session-purge", daemon=True).start()
+
+
+def stop_purge():
+    _stop.set()
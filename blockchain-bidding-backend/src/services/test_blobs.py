@@ -0,0 +1,92 @@
+# src/services/test_blobs.py
+import io
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from src.models.user import db, Blob, RFQ, RFQFile, User
+from src.services import blobs
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI="sqlite://", UPLOAD_FOLDER=str(tmp_path))
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        owner = User(username="owner", role="owner")
+        owner.set_password("pw")
+        db.session.add(owner)
+        db.session.flush()
+        for i in range(2):
+            db.session.add(RFQ(owner_id=owner.id, title=f"RFQ {i}", scope="s", deadline="2030-01-01",
+                               evaluation_criteria="e"))
+        db.session.commit()
+        yield app
+
+
+def _attach(rfq_id, data, name="spec.pdf"):
+    row = RFQFile(rfq_id=rfq_id)
+    blobs.attach(row, FileStorage(stream=io.BytesIO(data), filename=name))
+    db.session.add(row)
+    db.session.commit()
+    return row
+
+
+def test_identical_uploads_share_one_blob(app):
+    a = _attach(1, b"same bytes", "a.pdf")
+    b = _attach(2, b"same bytes", "b.pdf")
+
+    assert a.blob_sha256 == b.blob_sha256 and a.filepath == b.filepath
+    assert (a.filename, b.filename) == ("a.pdf", "b.pdf")
+    assert Blob.query.count() == 1
+    assert db.session.get(Blob, a.blob_sha256).refcount == 2
+
+
+def test_refcount_and_gc(app):
+    a = _attach(1, b"shared")
+    b = _attach(2, b"shared")
+    path = a.filepath
+
+    db.session.delete(a)
+    db.session.commit()
+    assert blobs.gc(grace_seconds=0)["deleted_blobs"] == 0
+    db.session.expire_all()
+    assert db.session.get(Blob, b.blob_sha256).refcount == 1
+
+    db.session.delete(b)
+    db.session.commit()
+    assert blobs.gc(grace_seconds=0)["deleted_blobs"] == 1
+    assert not os.path.exists(path)
+    assert Blob.query.count() == 0
+
+
+def test_gc_spares_a_blob_an_upload_is_reusing(app):
+    a = _attach(1, b"reused")
+    path = a.filepath
+    db.session.delete(a)
+    db.session.commit()
+    Blob.query.one().unreferenced_at = datetime.utcnow() - timedelta(hours=2)
+    db.session.commit()
+
+    # Stored again but not referenced by a row yet
+    blobs.store_upload(FileStorage(stream=io.BytesIO(b"reused"), filename="again.pdf"))
+    assert blobs.gc(grace_seconds=3600)["deleted_blobs"] == 0
+    assert os.path.exists(path)
+
+
+def test_upload_after_gc_writes_the_file_again(app):
+    a = _attach(1, b"collected")
+    path = a.filepath
+    db.session.delete(a)
+    db.session.commit()
+    assert blobs.gc(grace_seconds=0)["deleted_blobs"] == 1
+    assert not os.path.exists(path)
+
+    b = _attach(2, b"collected")
+    assert b.filepath == path and os.path.exists(path)
+    assert db.session.get(Blob, b.blob_sha256).refcount == 1
@@ -0,0 +1,145 @@
+# src/services/test_chunking.py
+import re
+
+import numpy as np
+import pytest
+
+from src.services import evalution
+
+
+class WordTokenizer:
+    """Fast-tokenizer stand-in: one token per whitespace-separated word."""
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=True):
+        return {"offset_mapping": [m.span() for m in re.finditer(r"\S+", text)]}
+
+
+class SlowTokenizer:
+    def __call__(self, text, **kwargs):
+        raise NotImplementedError("return_offset_mapping is not available when using Python tokenizers")
+
+
+class FakeModel:
+    def __init__(self, tokenizer=None, max_seq_length=256):
+        self.tokenizer = tokenizer or WordTokenizer()
+        self.max_seq_length = max_seq_length
+        self.encoded = []
+
+    def encode(self, texts, batch_size, normalize_embeddings, convert_to_numpy):
+        self.encoded.append(list(texts))
+        return np.array([[len(t.split()), 1.0] for t in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = FakeModel()
+    monkeypatch.setattr(evalution, "_get_sentence_model", lambda: model)
+    monkeypatch.setattr(evalution, "_embed_memo", type(evalution._embed_memo)())
+    return model
+
+
+def _words(n):
+    return " ".join(f"w{i}" for i in range(n))
+
+
+def test_chunks_overlap_and_end_on_the_last_token(model):
+    assert evalution._chunk_text(_words(10), max_tokens=4, overlap=1) == [
+        "w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+
+
+def test_last_chunk_may_be_short(model):
+    assert evalution._chunk_text(_words(8), max_tokens=4, overlap=1) == [
+        "w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7"]
+
+
+def test_chunks_keep_the_original_text_between_tokens(model):
+    assert evalution._chunk_text("Roof  repair,\nfull replacement", max_tokens=2, overlap=0) == [
+        "Roof  repair,", "full replacement"]
+
+
+def test_short_and_empty_text(model):
+    assert evalution._chunk_text(_words(3), max_tokens=4, overlap=1) == ["w0 w1 w2"]
+    assert evalution._chunk_text("", max_tokens=4) == []
+    assert evalution._chunk_text(" \n\t ", max_tokens=4) == []
+
+
+def test_window_defaults_to_the_model_sequence_length(model):
+    model.max_seq_length = 18  # 16 tokens once [CLS]/[SEP] are reserved
+
+    chunks = evalution._chunk_text(_words(40), overlap=2)
+
+    assert [len(c.split()) for c in chunks] == [16, 16, 12]
+    assert chunks[1].split()[0] == "w14"
+
+
+def test_window_is_at_least_16_tokens(model):
+    model.max_seq_length = 8
+
+    assert [len(c.split()) for c in evalution._chunk_text(_words(20), overlap=0)] == [16, 4]
+
+
+def test_chunk_count_is_capped(model, monkeypatch):
+    monkeypatch.setattr(evalution, "MAX_CHUNKS_PER_DOC", 2)
+
+    assert len(evalution._chunk_text(_words(100), max_tokens=4, overlap=0)) == 2
+
+
+def test_slow_tokenizers_fall_back_to_word_windows(model):
+    model.tokenizer = SlowTokenizer()
+
+    assert evalution._chunk_text(_words(10), max_tokens=8, overlap=4) == [
+        "w0 w1 w2 w3 w4 w5", "w3 w4 w5 w6 w7 w8", "w6 w7 w8 w9", "w9"]
+
+
+def test_embed_chunks_encodes_every_chunk_once(model):
+    model.max_seq_length = 50  # 48-token windows, 32 overlapping
+
+    mat = evalution._embed_chunks(_words(100))
+    again = evalution._embed_chunks(_words(100))
+
+    assert mat.shape == (5, 2) and mat.dtype == np.float32
+    np.testing.assert_array_equal(mat[:, 0], [48, 48, 48, 48, 36])
+    assert len(model.encoded) == 1 and again is mat
+
+
+def test_embed_chunks_of_empty_text(model):
+    assert evalution._embed_chunks("").shape == (0, 0)
+    assert model.encoded == []
+
+
+RFQ = np.array([[1, 0, 0], [0, 1, 0]], dtype=np.float32)
+MATRICES = {
+    "rfq": RFQ,
+    "three chunks": np.array([[1, 0, 0], [0, 0, 1], [0, 0.5, 0]], dtype=np.float32),  # best 1.0, 0.5
+    "one chunk": np.array([[0, 1, 0]], dtype=np.float32),                          # best 0.0, 1.0
+    "one mixed chunk": np.array([[0.6, 0.8, 0]], dtype=np.float32),                # best 0.6, 0.8
+    "opposite": np.array([[-1, -1, 0]], dtype=np.float32),
+}
+
+
+@pytest.fixture
+def chunk_matrices(monkeypatch):
+    monkeypatch.setattr(evalution, "_embed_chunks", lambda text: MATRICES[text])
+
+
+@pytest.mark.parametrize("bids, expected", [
+    (["three chunks", "one chunk", "one mixed chunk"], [0.75, 0.5, 0.7]),
+    (["one chunk", "three chunks"], [0.5, 0.75]),         # a one-chunk segment first
+    (["three chunks", "one chunk"], [0.75, 0.5]),         # ... and last
+    (["one chunk", "one mixed chunk"], [0.5, 0.7]),       # every segment one chunk
+    (["one mixed chunk"], [0.7]),
+])
+def test_semantic_scores_pool_each_bid_over_its_own_chunks(chunk_matrices, bids, expected):
+    np.testing.assert_allclose(evalution._semantic_scores("rfq", bids), expected, rtol=1e-6)
+
+
+def test_bids_without_text_score_zero_and_keep_their_place(chunk_matrices):
+    scores = evalution._semantic_scores("rfq", ["", "one chunk", "", "three chunks"])
+
+    np.testing.assert_allclose(scores, [0.0, 0.5, 0.0, 0.75], rtol=1e-6)
+
+
+def test_semantic_scores_are_clipped_and_zero_without_an_rfq(chunk_matrices):
+    assert evalution._semantic_scores("rfq", ["opposite"]).tolist() == [0.0]
+    assert evalution._semantic_scores("", ["one chunk"]).tolist() == [0.0]
+    assert evalution._semantic_scores("rfq", ["", ""]).tolist() == [0.0, 0.0]
@@ -0,0 +1,101 @@
+# src/services/test_embeddings.py
+import logging
+
+import numpy as np
+import pytest
+from flask import Flask
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from src.models.user import db, DocumentEmbedding
+from src.services import evalution
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    """Stand-in for MiniLM: records what gets encoded, one row per text."""
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(list(texts))
+        return np.array([[len(t), 1.0] for t in texts], dtype=np.float32)
+
+    monkeypatch.setattr(evalution, "_encode", fake_encode)
+    monkeypatch.setattr(evalution, "_chunk_text", lambda text: [text[:10], text[10:]])
+    monkeypatch.setattr(evalution, "_embed_memo", type(evalution._embed_memo)())
+    return calls
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'embeddings.db'}")
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+def _forget_memo():
+    evalution._embed_memo.clear()
+
+
+def test_stored_vectors_survive_the_memo(app, encoded):
+    first = evalution._embed_chunks("Scope of works: full roof replacement")
+    db.session.commit()
+    _forget_memo()
+
+    again = evalution._embed_chunks("Scope of works: full roof replacement")
+
+    assert encoded == [["Scope of w", "orks: full roof replacement"]]
+    np.testing.assert_array_equal(again, first)
+    row = DocumentEmbedding.query.one()
+    assert (row.model, row.dim) == (evalution.EMBEDDING_MODEL_NAME, 2)
+
+
+def test_changed_text_is_encoded_again(app, encoded):
+    evalution._embed("Tender for 40 solar panels")
+    db.session.commit()
+    _forget_memo()
+
+    evalution._embed("Tender for 40 solar panels")
+    evalution._embed("Tender for 48 solar panels")
+
+    assert encoded == [["Tender for 40 solar panels"], ["Tender for 48 solar panels"]]
+    assert DocumentEmbedding.query.count() == 2
+
+
+def test_vectors_stay_in_the_memo_without_an_app_context(encoded):
+    evalution._embed("no database here")
+    evalution._embed("no database here")
+
+    assert encoded == [["no database here"]]
+
+
+def test_a_concurrent_insert_is_not_an_error(app, encoded, monkeypatch, caplog):
+    def lost_race(*args, **kwargs):
+        raise IntegrityError("INSERT", {}, Exception("UNIQUE constraint failed"))
+
+    monkeypatch.setattr(db.session, "execute", lost_race)
+
+    with caplog.at_level(logging.ERROR, logger=evalution.__name__):
+        evalution._store_embedding("key", np.ones((1, 2), dtype=np.float32))
+
+    assert caplog.records == []
+
+
+def test_other_store_failures_are_logged_and_keep_the_transaction(app, encoded, monkeypatch, caplog):
+    db.session.add(DocumentEmbedding(content_hash="kept", model="m", dim=1, vector=b"\0\0\0\0"))
+
+    def disk_full(*args, **kwargs):
+        raise OperationalError("INSERT", {}, Exception("database or disk is full"))
+
+    monkeypatch.setattr(db.session, "execute", disk_full)
+
+    with caplog.at_level(logging.ERROR, logger=evalution.__name__):
+        evalution._store_embedding("key", np.ones((1, 2), dtype=np.float32))
+    monkeypatch.undo()
+    db.session.commit()
+
+    assert "Failed to store embedding key" in caplog.text
+    assert [row.content_hash for row in DocumentEmbedding.query] == ["kept"]
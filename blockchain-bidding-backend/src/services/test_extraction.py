@@ -0,0 +1,55 @@
+# src/services/test_extraction.py
+import zipfile
+
+import pptx
+import pytest
+
+from src.services import extraction
+
+
+@pytest.fixture(autouse=True)
+def stop_pool():
+    yield
+    extraction.shutdown()
+
+
+def _make_pptx(path, slides):
+    prs = pptx.Presentation()
+    for text in slides:
+        slide = prs.slides.add_slide(prs.slide_layouts[5])
+        slide.shapes.title.text = text
+    prs.save(path)
+
+
+def _make_docx(path, pages):
+    ns = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+    breaks = '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+    body = breaks.join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in pages)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", f"<w:document {ns}><w:body>{body}</w:body></w:document>")
+
+
+def test_pptx_pages_extracted_in_parallel_keep_their_order(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction, "EXTRACTION_WORKERS", 2)
+    monkeypatch.setattr(extraction, "EXTRACTION_PARALLEL_MIN_PAGES", 1)
+    monkeypatch.setattr(extraction, "EXTRACTION_PAGES_PER_TASK", 2)
+    path = tmp_path / "deck.pptx"
+    slides = [f"slide {i}" for i in range(5)]
+    _make_pptx(path, slides)
+
+    assert list(extraction.iter_pages(str(path), "deck.pptx")) == slides
+
+
+def test_docx_split_at_page_breaks(tmp_path):
+    path = tmp_path / "proposal.docx"
+    _make_docx(path, ["methodology", "references"])
+
+    assert list(extraction.iter_pages(str(path), "proposal.docx")) == ["methodology", "references"]
+    assert extraction.extract_text(str(path), "proposal.docx") == "methodology\nreferences"
+
+
+def test_extraction_can_start_at_a_later_page(tmp_path):
+    path = tmp_path / "deck.pptx"
+    _make_pptx(path, ["a", "b", "c"])
+
+    assert list(extraction.iter_pages(str(path), "deck.pptx", start=1)) == ["b", "c"]
@@ -0,0 +1,40 @@
+# src/services/test_ingest.py
+import hashlib
+import io
+import os
+
+import pytest
+from web3 import Web3
+from werkzeug.datastructures import FileStorage
+
+from src.services.ingest import UploadRejected, document_hash, ingest_upload
+
+
+def _upload(data: bytes, name="proposal.pdf"):
+    return FileStorage(stream=io.BytesIO(data), filename=name)
+
+
+def test_hashes_match_single_pass_reference(tmp_path):
+    data = os.urandom(200 * 1024 + 7)  # spans several chunks
+    item = ingest_upload(_upload(data), str(tmp_path))
+
+    assert item.size_bytes == len(data)
+    assert item.sha256 == hashlib.sha256(data).hexdigest()
+    assert item.keccak256 == Web3.to_hex(Web3.keccak(data))
+    with open(item.filepath, "rb") as f:
+        assert f.read() == data
+
+
+def test_oversized_upload_is_rejected_and_removed(tmp_path):
+    with pytest.raises(UploadRejected):
+        ingest_upload(_upload(b"x" * 1000), str(tmp_path), max_bytes=999)
+    assert os.listdir(tmp_path) == []
+
+
+def test_document_hash_depends_on_every_file(tmp_path):
+    a = ingest_upload(_upload(b"first", "a.pdf"), str(tmp_path))
+    b = ingest_upload(_upload(b"second", "b.pdf"), str(tmp_path))
+
+    assert document_hash([a, b]) == document_hash([a, b])
+    assert document_hash([a, b]) != document_hash([a])
+    assert document_hash([a, b]).startswith("0x") and len(document_hash([a])) == 66
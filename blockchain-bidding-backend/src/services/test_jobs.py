@@ -0,0 +1,155 @@
+# src/services/test_jobs.py
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from src.models.user import db, Bid, EvaluationJob, RFQ, User
+from src.services import jobs
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'jobs.db'}", UPLOAD_FOLDER=str(tmp_path))
+    db.init_app(app)
+    monkeypatch.setattr(jobs, "evaluate_phase1", lambda text, rfq_id: {"status": "pass"})
+    monkeypatch.setattr(jobs, "evaluate_phase2", lambda bid: {"status": "done", "score": 80.0})
+    with app.app_context():
+        db.create_all()
+        for name, role in (("owner", "owner"), ("bidder", "bidder")):
+            user = User(username=name, role=role)
+            user.set_password("pw")
+            db.session.add(user)
+        db.session.flush()
+        rfq = RFQ(owner_id=1, title="Roof", scope="s", deadline="2030-01-01", evaluation_criteria="e")
+        db.session.add(rfq)
+        db.session.flush()
+        for price in (100.0, 200.0):
+            db.session.add(Bid(rfq_id=rfq.id, bidder_id=2, price=price, qualifications="ISO 9001",
+                               timeline_start=date(2030, 1, 1), timeline_end=date(2030, 2, 1)))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def _job_row(job_id):
+    db.session.expire_all()
+    return db.session.get(EvaluationJob, job_id)
+
+
+def test_claim_takes_the_oldest_job_once(app):
+    first, second = jobs.enqueue_evaluation(1).id, jobs.enqueue_evaluation(2).id
+
+    assert jobs._claim_next("a") == first
+    assert jobs._claim_next("b") == second
+    assert jobs._claim_next("c") is None
+    assert (_job_row(first).worker_id, _job_row(first).attempts) == ("a", 1)
+
+
+def test_claim_loses_the_race_to_another_worker(app):
+    job_id = jobs.enqueue_evaluation(1).id
+
+    def other_worker_claims(conn, cursor, statement, *args):
+        if statement.startswith("UPDATE evaluation_jobs") and conn.info.pop("race", False):
+            with db.engine.begin() as other:
+                other.execute(EvaluationJob.__table__.update().values(status="running", worker_id="other",
+                                                                      started_at=datetime.utcnow()))
+
+    event.listen(db.engine, "before_cursor_execute", other_worker_claims)
+    try:
+        db.session.connection().info["race"] = True
+        assert jobs._claim_next("a") is None
+    finally:
+        event.remove(db.engine, "before_cursor_execute", other_worker_claims)
+    assert _job_row(job_id).worker_id == "other"
+
+
+def test_abandoned_job_is_claimable_after_its_lease(app):
+    job_id = jobs.enqueue_evaluation(1).id
+    jobs._claim_next("crashed")
+    assert jobs._claim_next("a") is None
+
+    job = _job_row(job_id)
+    job.started_at = datetime.utcnow() - timedelta(seconds=jobs.LEASE_SECONDS + 1)
+    db.session.commit()
+    assert jobs._claim_next("a") == job_id
+    assert _job_row(job_id).attempts == 2
+
+
+def test_failed_job_is_retried_until_it_succeeds(app, monkeypatch):
+    calls = []
+
+    def flaky_phase1(text, rfq_id):
+        calls.append(rfq_id)
+        if len(calls) == 1:
+            raise RuntimeError("model timed out")
+        return {"status": "pass"}
+
+    monkeypatch.setattr(jobs, "evaluate_phase1", flaky_phase1)
+    job_id = jobs.enqueue_evaluation(1).id
+
+    jobs.run_job(jobs._claim_next("a"))
+    job = _job_row(job_id)
+    assert job.status == "pending" and "model timed out" in job.error
+
+    jobs.run_job(jobs._claim_next("a"))
+    job, bid = _job_row(job_id), db.session.get(Bid, 1)
+    assert (job.status, job.stage, job.attempts, job.error) == ("done", "complete", 2, None)
+    assert (bid.phase1_status, bid.phase2_status, bid.phase2_score) == ("pass", "done", 80.0)
+
+
+def test_job_fails_after_max_attempts(app, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 1)
+    monkeypatch.setattr(jobs, "evaluate_phase1", lambda text, rfq_id: 1 / 0)
+    job_id = jobs.enqueue_evaluation(1).id
+
+    jobs.run_job(jobs._claim_next("a"))
+    assert _job_row(job_id).status == "failed"
+    assert db.session.get(Bid, 1).phase1_status == "error"
+    assert jobs._claim_next("a") is None
+
+
+def test_job_abandoned_on_its_last_attempt_errors_its_running_phase(app, monkeypatch):
+    monkeypatch.setattr(jobs, "MAX_ATTEMPTS", 1)
+    job_id = jobs.enqueue_evaluation(1).id
+    jobs._claim_next("crashed")
+    job, bid = _job_row(job_id), db.session.get(Bid, 1)
+    job.started_at = datetime.utcnow() - timedelta(seconds=jobs.LEASE_SECONDS + 1)
+    bid.phase1_status, bid.phase2_status = "pass", "running"  # the worker died in Phase 2
+    db.session.commit()
+
+    jobs.run_job(jobs._claim_next("a"))
+
+    job, bid = _job_row(job_id), db.session.get(Bid, 1)
+    assert (job.status, job.error, job.attempts) == ("failed", "Exceeded max attempts", 2)
+    assert (bid.phase1_status, bid.phase2_status) == ("pass", "error")
+    assert jobs._claim_next("a") is None
+
+
+def test_stop_waits_for_the_running_job_and_claims_no_more(app, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_phase1(text, rfq_id):
+        started.set()
+        release.wait(5)
+        return {"status": "pass"}
+
+    monkeypatch.setattr(jobs, "evaluate_phase1", slow_phase1)
+    running, queued = jobs.enqueue_evaluation(1).id, jobs.enqueue_evaluation(2).id
+    jobs.start_workers(app, 1)
+    assert started.wait(5)
+    worker = jobs._workers[0]
+
+    begun = time.monotonic()
+    jobs.stop_workers(timeout=0.2)
+    assert time.monotonic() - begun < 1 and worker.is_alive()  # bounded by the timeout
+
+    release.set()
+    worker.join(5)
+    assert not worker.is_alive()
+    assert _job_row(running).status == "done"
+    assert _job_row(queued).status == "pending"  # left for the next start
@@ -0,0 +1,91 @@
+# src/services/test_llm.py
+import threading
+
+import pytest
+
+from src.services import llm
+from src.services.llm import BatchedGenerator
+
+
+class RecordingGenerate:
+    def __init__(self, respond=None):
+        self.calls = []
+        self.respond = respond or (lambda prompts: [p.upper() for p in prompts])
+
+    def __call__(self, prompts, max_new_tokens, temperature):
+        self.calls.append((tuple(prompts), max_new_tokens, temperature))
+        return self.respond(prompts)
+
+
+def _submit_all(batcher, requests):
+    return [batcher.submit(prompt, tokens, temperature) for prompt, tokens, temperature in requests]
+
+
+def test_prompts_are_grouped_by_generation_settings():
+    generate = RecordingGenerate()
+    batcher = BatchedGenerator(generate, max_batch_size=5, max_wait_ms=1000)
+
+    futures = _submit_all(batcher, [("a", 16, 0.0), ("b", 32, 0.0), ("c", 16, 0.0), ("d", 16, 0.7), ("e", 32, 0.0)])
+
+    assert [f.result(5) for f in futures] == ["A", "B", "C", "D", "E"]
+    assert sorted(generate.calls) == sorted([(("a", "c"), 16, 0.0), (("b", "e"), 32, 0.0), (("d",), 16, 0.7)])
+    assert batcher.metrics()["batches"] == 1 and batcher.metrics()["max_batch_size_seen"] == 5
+
+
+def test_each_caller_gets_its_own_output_in_order():
+    batcher = BatchedGenerator(RecordingGenerate(lambda prompts: [f"out:{p}" for p in prompts]),
+                               max_batch_size=8, max_wait_ms=1000)
+    prompts = [f"p{i}" for i in range(8)]
+
+    futures = _submit_all(batcher, [(p, 16, 0.0) for p in prompts])
+
+    assert [f.result(5) for f in futures] == [f"out:{p}" for p in prompts]
+
+
+def test_a_failing_group_fails_only_its_own_callers():
+    def respond(prompts):
+        if "bad" in prompts:
+            raise ValueError("CUDA out of memory")
+        return [p.upper() for p in prompts]
+
+    batcher = BatchedGenerator(RecordingGenerate(respond), max_batch_size=3, max_wait_ms=1000)
+    bad, other, good = _submit_all(batcher, [("bad", 16, 0.0), ("also", 16, 0.0), ("good", 32, 0.0)])
+
+    for future in (bad, other):
+        with pytest.raises(ValueError, match="out of memory"):
+            future.result(5)
+    assert good.result(5) == "GOOD"
+
+
+def test_too_few_outputs_fail_every_caller_of_the_group():
+    batcher = BatchedGenerator(RecordingGenerate(lambda prompts: prompts[:1]), max_batch_size=2, max_wait_ms=1000)
+
+    for future in _submit_all(batcher, [("a", 16, 0.0), ("b", 16, 0.0)]):
+        with pytest.raises(RuntimeError, match="1 outputs for 2 prompts"):
+            future.result(5)
+
+
+def test_a_batch_failing_outside_generation_resolves_its_futures_and_keeps_the_worker():
+    batcher = BatchedGenerator(RecordingGenerate(), max_batch_size=1, max_wait_ms=0)
+
+    unhashable = batcher.submit("a", 16, [0.0])  # can't be grouped
+    with pytest.raises(RuntimeError, match="batch failed"):
+        unhashable.result(5)
+    assert batcher.submit("b", 16, 0.0).result(5) == "B"
+
+
+def test_ask_llm_gives_up_after_the_result_timeout(monkeypatch):
+    release = threading.Event()
+
+    def stuck(prompts):
+        release.wait(5)
+        return prompts
+
+    monkeypatch.setattr(llm, "_batcher", BatchedGenerator(RecordingGenerate(stuck), max_wait_ms=0))
+    monkeypatch.setattr(llm, "get_cache", lambda: None)
+    monkeypatch.setattr(llm, "LLM_RESULT_TIMEOUT", 0.05)
+    try:
+        with pytest.raises(TimeoutError):
+            llm.ask_llm("prompt")
+    finally:
+        release.set()
@@ -0,0 +1,37 @@
+# src/services/test_llm_cache.py
+from src.services.llm_cache import LLMCache
+
+
+def test_hit_and_miss_counters(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.db"))
+    key = cache.make_key("flan", "prompt", {"max_new_tokens": 16, "temperature": 0.0})
+
+    assert cache.get(key) is None
+    cache.put(key, "flan", '{"status": "pass"}')
+    assert cache.get(key) == '{"status": "pass"}'
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+
+def test_key_depends_on_model_and_params():
+    base = LLMCache.make_key("flan", "prompt", {"max_new_tokens": 16})
+    assert base == LLMCache.make_key("flan", "prompt", {"max_new_tokens": 16})
+    assert base != LLMCache.make_key("other", "prompt", {"max_new_tokens": 16})
+    assert base != LLMCache.make_key("flan", "prompt", {"max_new_tokens": 32})
+
+
+def test_lru_eviction(tmp_path):
+    cache = LLMCache(str(tmp_path / "cache.db"), max_entries=3)
+    keys = [cache.make_key("flan", f"p{i}", {}) for i in range(4)]
+    for k in keys[:3]:
+        cache.put(k, "flan", "x")
+    # Touch the oldest so the second entry becomes least-recently used
+    cache.get(keys[0])
+    cache.put(keys[3], "flan", "x")
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) == "x"
+    assert cache.stats()["entries"] <= 3
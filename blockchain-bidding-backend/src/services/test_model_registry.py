@@ -0,0 +1,47 @@
+# src/services/test_model_registry.py
+import threading
+import time
+
+from src.services import model_registry
+from src.services.model_registry import ModelRegistry
+
+
+def test_concurrent_loads_start_one_reaper(monkeypatch):
+    started = []
+    real_thread = threading.Thread
+
+    class CountingThread(real_thread):
+        def start(self):
+            if self.name == "model-reaper":
+                started.append(self)
+                time.sleep(0.01)  # widen the window between the check and the start
+            super().start()
+
+    monkeypatch.setattr(model_registry.threading, "Thread", CountingThread)
+    registry = ModelRegistry(idle_timeout=3600)
+    for i in range(8):
+        registry.register(f"model{i}", object)
+
+    loaders = [real_thread(target=registry.get, args=(f"model{i}",)) for i in range(8)]
+    for t in loaders:
+        t.start()
+    for t in loaders:
+        t.join()
+
+    assert len(started) == 1
+    assert all(registry.is_loaded(f"model{i}") for i in range(8))
+
+
+def test_reaper_unloads_idle_models_and_restarts_on_next_load(monkeypatch):
+    monkeypatch.setattr(model_registry.time, "sleep", lambda seconds: None)
+    registry = ModelRegistry(idle_timeout=60)
+    registry.register("model", object)
+
+    registry.get("model")
+    first = registry._reaper
+    registry._last_used["model"] -= 120  # idle past the timeout
+    first.join(5)
+    assert not registry.is_loaded("model") and registry._reaper is None
+
+    registry.get("model")
+    assert registry._reaper is not None and registry._reaper is not first
@@ -0,0 +1,75 @@
+# src/services/test_page_index.py
+import pytest
+from flask import Flask
+
+from src.models.user import db, DocumentPage, DocumentText
+from src.services import extraction, page_index
+
+PAGES = ["alpha", "", "gamma delta", "epsilon", "zeta"]
+
+
+@pytest.fixture
+def doc(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI="sqlite://", UPLOAD_FOLDER=str(tmp_path))
+    db.init_app(app)
+    path = tmp_path / "tender.txt"
+    path.write_text("\n".join(PAGES))
+    with app.app_context():
+        db.create_all()
+        yield str(path)
+
+
+def _fake_pages(pages, fail_after=None):
+    calls = []
+
+    def iter_pages(path, filename, start=0):
+        calls.append(start)
+        for n, text in enumerate(pages[start:], start):
+            if n == fail_after:
+                raise SystemExit("worker killed")
+            yield text
+    return iter_pages, calls
+
+
+def test_interrupted_extraction_resumes_at_the_next_batch(doc, monkeypatch):
+    monkeypatch.setattr(page_index, "PAGE_INDEX_COMMIT_PAGES", 2)
+    crashing, _ = _fake_pages(PAGES, fail_after=3)
+    monkeypatch.setattr(extraction, "iter_pages", crashing)
+    with pytest.raises(SystemExit):
+        page_index.index_document(doc, "tender.txt", "f" * 64)
+    db.session.rollback()
+    assert db.session.get(DocumentText, "f" * 64).pages_done == 2
+
+    resumed, calls = _fake_pages(PAGES)
+    monkeypatch.setattr(extraction, "iter_pages", resumed)
+    result = page_index.index_document(doc, "tender.txt", "f" * 64)
+
+    assert calls == [2]
+    assert result.status == "complete" and result.pages_done == len(PAGES)
+    assert page_index.document_text("f" * 64) == "\n".join(PAGES)
+
+
+def test_offsets_address_the_joined_text(doc, monkeypatch):
+    monkeypatch.setattr(extraction, "iter_pages", _fake_pages(PAGES)[0])
+    sha = page_index.index_document(doc, "tender.txt").sha256
+    full = "\n".join(PAGES)
+
+    pages = page_index.read_pages(sha)
+    assert [full[p.char_start:p.char_end] for p in pages] == [p.text for p in pages]
+    assert page_index.read_chars(sha, 8, 19) == full[8:19]
+    assert [p.page_no for p in page_index.read_pages(sha, 3, 4)] == [3]
+    assert page_index.leading_text([sha, sha], 10) == full[:10]
+
+
+def test_failed_documents_are_not_retried(doc, monkeypatch):
+    def broken(path, filename, start=0):
+        raise ValueError("corrupt")
+        yield
+
+    monkeypatch.setattr(extraction, "iter_pages", broken)
+    assert page_index.index_document(doc, "tender.txt").status == "failed"
+
+    monkeypatch.setattr(extraction, "iter_pages", lambda *a, **k: pytest.fail("parsed again"))
+    assert page_index.index_document(doc, "tender.txt").status == "failed"
+    assert DocumentPage.query.count() == 0
@@ -0,0 +1,93 @@
+# src/services/test_passwords.py
+import threading
+
+import pytest
+
+from src.models.user import User
+from src.services import passwords
+
+
+@pytest.fixture(autouse=True)
+def cheap_scrypt(monkeypatch):
+    monkeypatch.setattr(passwords, "PASSWORD_SCRYPT_N", 2 ** 10)
+    passwords._failures.clear()
+
+
+def test_login_rehashes_when_parameters_change(monkeypatch):
+    user = User(username="alice", role="bidder")
+    user.set_password("s3cret")
+    assert user.password_hash.startswith("scrypt:1024:8:1$")
+    assert not user.check_password("wrong") and not user.check_password(None)
+
+    monkeypatch.setattr(passwords, "PASSWORD_SCRYPT_N", 2 ** 11)
+    old_hash = user.password_hash
+    assert user.check_password("s3cret")
+    assert user.password_hash.startswith("scrypt:2048:8:1$") and user.password_hash != old_hash
+    assert not passwords.needs_rehash(user.password_hash)
+
+
+def test_failed_attempts_are_throttled_per_username_and_ip(monkeypatch):
+    monkeypatch.setattr(passwords, "LOGIN_MAX_FAILURES_PER_USER", 2)
+    monkeypatch.setattr(passwords, "LOGIN_MAX_FAILURES_PER_IP", 3)
+    for _ in range(2):
+        passwords.check_throttle("Alice", "10.0.0.1")  # both fail
+    with pytest.raises(passwords.LoginThrottled) as exc:
+        passwords.check_throttle("alice", "10.0.0.2")
+    assert 1 <= exc.value.retry_after <= passwords.LOGIN_FAILURE_WINDOW + 1
+
+    passwords.check_throttle("bob", "10.0.0.1")
+    with pytest.raises(passwords.LoginThrottled):
+        passwords.check_throttle("carol", "10.0.0.1")  # the IP is out of attempts
+    passwords.check_throttle("carol", "10.0.0.2")
+
+    passwords.record_success("alice", "10.0.0.2")
+    passwords.check_throttle("alice", "10.0.0.2")
+
+
+def test_successful_and_released_attempts_are_not_counted(monkeypatch):
+    monkeypatch.setattr(passwords, "LOGIN_MAX_FAILURES_PER_IP", 2)
+    for user in ("alice", "bob", "carol"):
+        passwords.check_throttle(user, "10.0.0.1")
+        passwords.record_success(user, "10.0.0.1")
+    passwords.check_throttle("dave", "10.0.0.1")
+    passwords.release_attempt("dave", "10.0.0.1")  # e.g. HashingBusy
+
+    assert passwords._failures.stats()["entries"] == 0
+
+
+def test_parallel_attempts_cannot_overrun_the_limit(monkeypatch):
+    monkeypatch.setattr(passwords, "LOGIN_MAX_FAILURES_PER_USER", 5)
+    start = threading.Barrier(20)
+    allowed = []
+
+    def attempt():
+        start.wait()
+        try:
+            passwords.check_throttle("alice", None)
+            allowed.append(True)
+        except passwords.LoginThrottled:
+            pass
+
+    threads = [threading.Thread(target=attempt) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(allowed) == 5
+    assert passwords._failures.get(("user", "alice")) == 5
+
+
+def test_full_queue_fails_fast(monkeypatch):
+    monkeypatch.setattr(passwords, "_slots", threading.BoundedSemaphore(1))
+    monkeypatch.setattr(passwords, "PASSWORD_HASH_WAIT_SECONDS", 0.01)
+    release = threading.Event()
+    holder = threading.Thread(target=passwords._run, args=(release.wait,))
+    holder.start()
+    try:
+        with pytest.raises(passwords.HashingBusy):
+            passwords.hash_password("pw")
+    finally:
+        release.set()
+        holder.join()
+    assert passwords.verify_password(passwords.hash_password("pw"), "pw")
@@ -0,0 +1,132 @@
+# src/services/test_rescore.py
+from datetime import date
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from src.models.user import db, Bid, EvaluationJob, RFQ, User
+from src.routes.user import user_bp
+from src.services import evalution, jobs
+
+
+def _bid(price, days, qualifications=""):
+    return SimpleNamespace(price=price, timeline_start=date(2030, 1, 1),
+                           timeline_end=date.fromordinal(date(2030, 1, 1).toordinal() + days),
+                           qualifications=qualifications)
+
+
+def test_score_bids_components_and_weights():
+    rfq = SimpleNamespace(budget_min=100, budget_max=200, start_date="2030-01-01", end_date="2030-01-31",
+                          evaluation_weights='{"price": 3, "semantic": 1}')
+    bids = [_bid(100, 30, "experience and certification " * 10), _bid(200, 15), _bid(0, 30)]
+
+    components, totals = evalution._score_bids(rfq, bids, np.array([0.8, 0.4, 0.0]))
+
+    np.testing.assert_allclose(components[:, 0], [1.0, 0.0, 0.5])        # price within the budget
+    np.testing.assert_allclose(components[:, 1], [1.0, 0.5, 1.0])        # timeline vs the RFQ window
+    np.testing.assert_allclose(components[:, 2], [0.5, 0.255, 0.255])    # keywords, short text penalty
+    # Named weights are normalised; unnamed components keep the 0.25 default
+    np.testing.assert_allclose(totals, np.clip(components @ [0.75, 0.25, 0.25, 0.25], 0.0, 1.0))
+
+
+def test_score_bids_without_a_budget_or_window_is_neutral():
+    rfq = SimpleNamespace(budget_min=None, budget_max=None, start_date=None, end_date=None, evaluation_weights=None)
+
+    components, _ = evalution._score_bids(rfq, [_bid(500, 10)], np.zeros(1))
+
+    assert components[0, 1] == 1.0
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    reviewed = []
+
+    def fake_review(rfq_text, bid_text):
+        reviewed.append(bid_text)
+        return {"text_hash": evalution._review_hash(rfq_text, bid_text),
+                "missing": [], "red_flags": [], "clarification_needed": []}
+
+    monkeypatch.setattr(evalution, "_ai_review", fake_review)
+    monkeypatch.setattr(evalution, "_semantic_scores", lambda rfq_text, texts: np.full(len(texts), 0.5))
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'rescore.db'}",
+                      TESTING=True)
+    db.init_app(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    app.reviewed = reviewed
+    with app.app_context():
+        db.create_all()
+        for name, role in (("owner", "owner"), ("bidder", "bidder")):
+            user = User(username=name, role=role)
+            user.set_password("pw")
+            db.session.add(user)
+        db.session.flush()
+        rfq = RFQ(owner_id=1, title="Roof", scope="Replace the roof", deadline="2030-01-01",
+                  evaluation_criteria="price", budget_min=100, budget_max=200)
+        db.session.add(rfq)
+        db.session.flush()
+        for price, phase1 in ((120.0, "pass"), (180.0, "pass"), (150.0, "reject")):
+            db.session.add(Bid(rfq_id=rfq.id, bidder_id=2, price=price, qualifications=f"Bid at {price}",
+                               phase1_status=phase1, timeline_start=date(2030, 1, 1),
+                               timeline_end=date(2030, 2, 1)))
+        db.session.commit()
+        yield app
+        db.session.remove()
+
+
+def test_rescore_reuses_reviews_whose_text_is_unchanged(app):
+    evalution.rescore_rfq_bids(1)
+    assert sorted(app.reviewed) == ["Bid at 120.0", "Bid at 180.0"]
+
+    db.session.get(Bid, 2).qualifications = "Bid at 180.0, now with references"
+    db.session.commit()
+    app.reviewed.clear()
+    ranking = evalution.rescore_rfq_bids(1)
+
+    assert app.reviewed == ["Bid at 180.0, now with references"]
+    assert [r["id"] for r in ranking] == [1, 2]
+    assert db.session.get(Bid, 1).phase2_review["text_hash"]
+
+
+def test_rescore_can_be_limited_to_some_bids(app):
+    assert [r["id"] for r in evalution.rescore_rfq_bids(1, bid_ids=[2])] == [2]
+    assert db.session.get(Bid, 1).phase2_score is None
+
+
+def _login(client, username):
+    assert client.post('/api/login', json={"username": username, "password": "pw"}).status_code == 200
+
+
+def test_rescore_route_queues_jobs_instead_of_scoring(app):
+    client = app.test_client()
+    _login(client, "owner")
+
+    r = client.post('/api/rfqs/1/rescore', json={"evaluation_weights": "price=3, semantic=1"})
+
+    assert r.status_code == 202, r.json
+    assert [(j["bid_id"], j["kind"], j["status"]) for j in r.json["jobs"]] == [(1, "rescore", "pending"),
+                                                                                (2, "rescore", "pending")]
+    assert app.reviewed == [] and db.session.get(Bid, 1).phase2_score is None
+    # Asking again while they're queued adds nothing
+    assert client.post('/api/rfqs/1/rescore').json["jobs"] == []
+
+    for job_id in (jobs._claim_next("a"), jobs._claim_next("a")):
+        jobs.run_job(job_id)
+    db.session.expire_all()
+    assert [j.status for j in EvaluationJob.query.order_by(EvaluationJob.id)] == ["done", "done"]
+    assert db.session.get(Bid, 1).phase2_score > db.session.get(Bid, 2).phase2_score
+    assert db.session.get(Bid, 3).phase2_score is None
+
+
+@pytest.mark.parametrize("weights", ["price=cheap", {"price": "high"}, {"speed": 1}, [0.5, 0.5],
+                                     '{"price": 0}', "not json"])
+def test_rescore_route_rejects_malformed_weights(app, weights):
+    client = app.test_client()
+    _login(client, "owner")
+
+    r = client.post('/api/rfqs/1/rescore', json={"evaluation_weights": weights})
+
+    assert r.status_code == 400 and "evaluation_weights" in r.json["error"]
+    assert EvaluationJob.query.count() == 0
@@ -0,0 +1,111 @@
+# src/services/test_sessions.py
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from src.models.user import db, User, UserSession
+from src.routes.user import user_bp
+from src.services import sessions
+
+
+class FakeRedis:
+    """The subset of redis.Redis the session store uses, with key expiry."""
+
+    def __init__(self):
+        self.data, self.expiry = {}, {}
+
+    def _live(self, key):
+        if key in self.expiry and self.expiry[key] <= time.monotonic():
+            self.data.pop(key, None)
+        return key in self.data
+
+    def get(self, key):
+        return self.data[key].encode() if self._live(key) else None
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+        self.expiry[key] = time.monotonic() + ex
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def sadd(self, key, member):
+        self.data.setdefault(key, set()).add(member)
+
+    def smembers(self, key):
+        return {m.encode() for m in self.data.get(key, set())} if self._live(key) else set()
+
+    def expire(self, key, seconds):
+        self.expiry[key] = time.monotonic() + seconds
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+def app(request, tmp_path):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'app.db'}")
+    db.init_app(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        for name, role in (("alice", "bidder"), ("root", "admin")):
+            user = User(username=name, role=role)
+            user.set_password("pw")
+            db.session.add(user)
+        db.session.commit()
+        store = sessions.RedisSessionStore(FakeRedis()) if request.param == "redis" else sessions.SQLSessionStore()
+        sessions.init_app(app, store)
+        yield app
+
+
+def _login(client, username):
+    assert client.post('/api/login', json={"username": username, "password": "pw"}).status_code == 200
+    return client.get_cookie("session").value
+
+
+def test_cookie_holds_only_an_id_that_rotates_on_login(app):
+    client = app.test_client()
+    assert client.get('/api/me').status_code == 401
+    assert client.get_cookie("session") is None  # nothing stored for anonymous requests
+
+    first = _login(client, "alice")
+    assert "alice" not in first and client.get('/api/me').json["username"] == "alice"
+    assert _login(client, "root") != first
+    assert sessions._store.get(first.rsplit(".", 1)[0]) is None  # the old id is gone
+
+    client.set_cookie("session", first[:-2] + "xx")
+    assert client.get('/api/me').status_code == 401
+
+
+def test_logout_and_revocation_end_sessions(app):
+    laptop, phone, admin = app.test_client(), app.test_client(), app.test_client()
+    cookie = _login(laptop, "alice")
+    _login(phone, "alice")
+    _login(admin, "root")
+
+    assert laptop.post('/api/logout').status_code == 200
+    assert sessions._store.get(cookie.rsplit(".", 1)[0]) is None
+    assert laptop.get('/api/me').status_code == 401
+    assert phone.get('/api/me').status_code == 200
+
+    alice = User.query.filter_by(username="alice").one()
+    assert admin.delete(f'/api/admin/users/{alice.id}/sessions').json == {"revoked": 1}
+    assert phone.get('/api/me').status_code == 401
+    assert admin.get('/api/me').status_code == 200
+
+
+def test_sessions_are_rewritten_only_when_needed_and_expired_rows_purged(app, monkeypatch):
+    client = app.test_client()
+    _login(client, "alice")
+    writes = []
+    monkeypatch.setattr(sessions._store, "set", lambda *args: writes.append(args))
+    client.get('/api/me')
+    assert writes == []
+
+    if isinstance(sessions._store, sessions.SQLSessionStore):
+        monkeypatch.undo()
+        db.session.add(UserSession(sid="old", data="{}", expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+        assert sessions._store.purge() == 1
+        assert UserSession.query.count() == 1
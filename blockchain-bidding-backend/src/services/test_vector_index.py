@@ -0,0 +1,62 @@
+# src/services/test_vector_index.py
+import numpy as np
+
+from src.services import vector_index
+from src.services.vector_index import IVFIndex
+
+
+def _clustered(n, dim=32, clusters=40, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(0, clusters, n)] + 0.3 * rng.normal(size=(n, dim))).astype(np.float32)
+
+
+def _exact(vectors, query, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return set(np.argsort(-(normed @ (query / np.linalg.norm(query))))[:k].tolist())
+
+
+def test_trained_index_matches_brute_force(monkeypatch):
+    monkeypatch.setattr(vector_index, "IVF_TRAIN_MIN", 500)
+    vectors = _clustered(5000)
+    index = IVFIndex(32, nprobe=8)
+    index.add_many(range(len(vectors)), vectors)
+    assert index.needs_training
+    index.train()
+    assert len(index.centroids) == 70 and not index.needs_training
+
+    queries = _clustered(20, seed=1)
+    recall = np.mean([len({i for i, _ in index.search(q, 10)} & _exact(vectors, q, 10)) / 10 for q in queries])
+    assert recall >= 0.9
+
+
+def test_add_replace_remove_and_exclude():
+    index = IVFIndex(3)
+    index.add(1, [1, 0, 0])
+    index.add(2, [0, 1, 0])
+    index.add(3, [0.9, 0.1, 0])
+    assert [i for i, _ in index.search([1, 0, 0], 2)] == [1, 3]
+    assert [i for i, _ in index.search([1, 0, 0], 2, exclude={1})] == [3, 2]
+
+    index.add(3, [0, 0, 1])  # replaces, doesn't duplicate
+    index.remove(1)
+    assert len(index) == 2 and 1 not in index
+    assert index.search([0, 0, 1], 5)[0][0] == 3
+    assert {i for i, _ in index.search([1, 0, 0], 5)} == {2, 3}
+
+
+def test_save_and_load_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "IVF_TRAIN_MIN", 100)
+    vectors = _clustered(400)
+    index = IVFIndex(32)
+    index.add_many(range(400), vectors)
+    index.train()
+    index.remove(7)
+
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = IVFIndex.load(path)
+    assert len(loaded) == 399 and 7 not in loaded
+    for q in vectors[:5]:
+        assert loaded.search(q, 5) == index.search(q, 5)
+    assert IVFIndex.load(str(tmp_path / "missing.npz")) is None
@@ -0,0 +1,218 @@
+# src/services/vector_index.py
+"""
+In-process approximate nearest-neighbour index (IVF, inner product) in NumPy.
+
+- Vectors are L2-normalized on the way in, so inner product is cosine
+  similarity
+- Below IVF_TRAIN_MIN vectors everything lives in one list and search is
+  exact. train() then clusters the vectors into ~sqrt(n) lists with
+  spherical k-means, and a query scans only the IVF_NPROBE closest lists
+- add() and remove() are incremental: a vector joins its nearest list, and a
+  removal moves the list's last row into the hole. The lists are re-clustered
+  once the index has grown IVF_RETRAIN_GROWTH times since the last training
+- save()/load() use a single .npz file, written to a temp file and renamed
+"""
+
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# -------- Config --------
+IVF_TRAIN_MIN = int(os.getenv("IVF_TRAIN_MIN", "4096"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+IVF_MAX_LISTS = int(os.getenv("IVF_MAX_LISTS", "1024"))
+IVF_RETRAIN_GROWTH = float(os.getenv("IVF_RETRAIN_GROWTH", "4"))
+IVF_TRAIN_SAMPLE = int(os.getenv("IVF_TRAIN_SAMPLE", "50000"))
+IVF_TRAIN_ITERATIONS = 10
+
+
+def _normalize(mat: np.ndarray) -> np.ndarray:
+    mat = np.asarray(mat, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=-1, keepdims=True)
+    return mat / np.maximum(norms, 1e-12)
+
+
+class IVFIndex:
+    def __init__(self, dim: int, nprobe: int = IVF_NPROBE):
+        self.dim = dim
+        self.nprobe = nprobe
+        self.centroids = np.zeros((0, dim), dtype=np.float32)
+        self.trained_size = 0
+        self.meta: Dict = {}  # free-form, saved with the vectors
+        self._lock = threading.RLock()
+        self._reset_lists(1)
+
+    def _reset_lists(self, nlist: int):
+        self._vectors = [np.zeros((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self._ids = [np.zeros(0, dtype=np.int64) for _ in range(nlist)]
+        self._sizes = [0] * nlist
+        self._where: Dict[int, Tuple[int, int]] = {}  # id -> (list, row)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, item_id: int) -> bool:
+        return item_id in self._where
+
+    def ids(self) -> set:
+        with self._lock:
+            return set(self._where)
+
+    @property
+    def needs_training(self) -> bool:
+        n = len(self)
+        if n < IVF_TRAIN_MIN:
+            return False
+        return self.trained_size == 0 or n >= self.trained_size * IVF_RETRAIN_GROWTH
+
+    # ---------------------------
+    # Updates
+    # ---------------------------
+    def _nearest_list(self, vec: np.ndarray) -> int:
+        if len(self.centroids) == 0:
+            return 0
+        return int(np.argmax(self.centroids @ vec))
+
+    def _append(self, lst: int, item_id: int, vec: np.ndarray):
+        size = self._sizes[lst]
+        if size == len(self._ids[lst]):  # grow capacity geometrically
+            capacity = max(16, size * 2)
+            vectors = np.zeros((capacity, self.dim), dtype=np.float32)
+            ids = np.zeros(capacity, dtype=np.int64)
+            vectors[:size] = self._vectors[lst][:size]
+            ids[:size] = self._ids[lst][:size]
+            self._vectors[lst], self._ids[lst] = vectors, ids
+        self._vectors[lst][size] = vec
+        self._ids[lst][size] = item_id
+        self._sizes[lst] = size + 1
+        self._where[item_id] = (lst, size)
+
+    def add(self, item_id: int, vector: np.ndarray):
+        """Insert or replace one vector."""
+        vec = _normalize(np.asarray(vector).reshape(self.dim))
+        with self._lock:
+            self.remove(item_id)
+            self._append(self._nearest_list(vec), int(item_id), vec)
+
+    def add_many(self, ids: Iterable[int], vectors: np.ndarray):
+        for item_id, vec in zip(ids, vectors):
+            self.add(item_id, vec)
+
+    def remove(self, item_id: int) -> bool:
+        with self._lock:
+            where = self._where.pop(int(item_id), None)
+            if where is None:
+                return False
+            lst, row = where
+            last = self._sizes[lst] - 1
+            if row != last:
+                moved = int(self._ids[lst][last])
+                self._vectors[lst][row] = self._vectors[lst][last]
+                self._ids[lst][row] = moved
+                self._where[moved] = (lst, row)
+            self._sizes[lst] = last
+            return True
+
+    def _all(self) -> Tuple[np.ndarray, np.ndarray]:
+        ids = np.concatenate([self._ids[l][:n] for l, n in enumerate(self._sizes)])
+        vectors = np.concatenate([self._vectors[l][:n] for l, n in enumerate(self._sizes)])
+        return ids, vectors
+
+    def train(self, seed: int = 0):
+        """
+        Cluster the vectors into ~sqrt(n) lists and redistribute them. k-means
+        runs on a snapshot without holding the lock; only the redistribution
+        blocks searches.
+        """
+        with self._lock:
+            n = len(self)
+            if n == 0:
+                return
+            rng = np.random.default_rng(seed)
+            nlist = max(1, min(IVF_MAX_LISTS, int(np.sqrt(n))))
+            _, vectors = self._all()
+            sample = vectors[rng.choice(n, min(n, max(IVF_TRAIN_SAMPLE, nlist)), replace=False)]
+
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = np.bincount(assign, minlength=nlist) == 0
+            sums[empty] = sample[rng.choice(len(sample), int(empty.sum()))]  # reseed
+            centroids = _normalize(sums)
+
+        with self._lock:
+            ids, vectors = self._all()
+            n = len(ids)
+            self.centroids = centroids
+            self._reset_lists(nlist)
+            assign = np.argmax(vectors @ centroids.T, axis=1)
+            for item_id, vec, lst in zip(ids, vectors, assign):
+                self._append(int(lst), int(item_id), vec)
+            self.trained_size = n
+
+    # ---------------------------
+    # Queries
+    # ---------------------------
+    def search(self, vector: np.ndarray, k: int, exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Top-k (id, cosine similarity), best first."""
+        query = _normalize(np.asarray(vector).reshape(self.dim))
+        exclude = set(exclude)
+        with self._lock:
+            if len(self.centroids):
+                probe = np.argsort(-(self.centroids @ query))[:self.nprobe]
+            else:
+                probe = [0]
+            scores = [self._vectors[l][:self._sizes[l]] @ query for l in probe]
+            ids = [self._ids[l][:self._sizes[l]].copy() for l in probe]
+        scores = np.concatenate(scores) if scores else np.zeros(0, dtype=np.float32)
+        ids = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        if exclude:
+            keep = ~np.isin(ids, np.fromiter(exclude, dtype=np.int64))
+            scores, ids = scores[keep], ids[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k)[:k]
+            scores, ids = scores[top], ids[top]
+        order = np.argsort(-scores)
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    # ---------------------------
+    # Persistence
+    # ---------------------------
+    def save(self, path: str):
+        with self._lock:
+            ids, vectors = self._all()
+            offsets = np.cumsum([0] + self._sizes)
+            header = {"dim": self.dim, "nprobe": self.nprobe, "trained_size": self.trained_size, "meta": self.meta}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, header=np.array(json.dumps(header, default=str)), centroids=self.centroids,
+                     ids=ids, vectors=vectors, offsets=offsets)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["IVFIndex"]:
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            header = json.loads(str(data["header"]))
+            index = cls(header["dim"], header["nprobe"])
+            index.trained_size = header["trained_size"]
+            index.meta = header["meta"]
+            index.centroids = data["centroids"].astype(np.float32)
+            offsets = data["offsets"]
+            index._reset_lists(max(1, len(offsets) - 1))
+            ids, vectors = data["ids"], data["vectors"]
+            for lst in range(len(offsets) - 1):
+                start, stop = int(offsets[lst]), int(offsets[lst + 1])
+                index._vectors[lst] = vectors[start:stop].astype(np.float32).copy()
+                index._ids[lst] = ids[start:stop].astype(np.int64).copy()
+                index._sizes[lst] = stop - start
+                for row, item_id in enumerate(index._ids[lst]):
+                    index._where[int(item_id)] = (lst, row)
+        return index
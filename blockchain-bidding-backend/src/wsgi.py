@@ -0,0 +1,21 @@
+# src/wsgi.py
+"""
+Production entry point:
+
+    gunicorn -c gunicorn.conf.py src.wsgi:app
+
+gunicorn.conf.py preloads this module in the master process, so the schema
+upgrade and (with MODEL_WARMUP=1) model loading happen once and the workers
+share the loaded models copy-on-write. Background threads can't survive
+fork(), so the workers start them in the post_fork hook. Servers other than
+gunicorn must call main.start_background(app) themselves.
+"""
+
+from src.main import MODEL_WARMUP, create_app, init_database
+from src.services.model_registry import registry
+
+app = create_app()
+init_database(app)
+
+if MODEL_WARMUP:
+    registry.warmup()
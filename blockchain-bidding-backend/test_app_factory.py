@@ -0,0 +1,40 @@
+# test_app_factory.py
+#
+# Importing the app module and building an app must not touch the database or
+# start threads; that's left to init_database() and start_background().
+import threading
+import time
+
+from sqlalchemy import inspect
+
+from src.main import create_app, init_database, stop_background
+from src.models.user import db
+from src.services import jobs
+
+
+def test_create_app_is_side_effect_free_until_initialised():
+    threads = set(threading.enumerate())
+    app = create_app({"SQLALCHEMY_DATABASE_URI": "sqlite://", "TESTING": True})
+    with app.app_context():
+        assert not inspect(db.engine).has_table("users")
+    assert set(threading.enumerate()) == threads
+
+    init_database(app)
+    with app.app_context():
+        assert {"users", "rfqs", "sessions", "rfq_fts"} <= set(inspect(db.engine).get_table_names())
+    client = app.test_client()
+    assert client.get('/api/me').status_code == 401
+    assert "init-db" in app.cli.commands
+
+
+def test_stop_background_shares_one_deadline(monkeypatch):
+    release = threading.Event()
+    busy = [threading.Thread(target=release.wait, daemon=True) for _ in range(3)]
+    for t in busy:
+        t.start()
+    monkeypatch.setattr(jobs, "_workers", list(busy))
+
+    start = time.monotonic()
+    stop_background(timeout=0.5)
+    assert time.monotonic() - start < 1.0  # not 0.5s per worker
+    release.set()
@@ -0,0 +1,102 @@
+# test_indexer.py
+#
+# Runs against a local Hardhat node:
+#   cd ../blockchain && npx hardhat compile && npx hardhat node
+#   HARDHAT_URL=http://127.0.0.1:8545 pytest test_indexer.py
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+from flask import Flask
+from web3 import Web3
+
+from src.models.user import db, ChainRFQ, ChainBid, IndexerCheckpoint
+from src.blockchain.indexer import EventIndexer
+
+HARDHAT_URL = os.getenv("HARDHAT_URL", "http://127.0.0.1:8545")
+ARTIFACT = os.path.join(os.path.dirname(__file__), "..", "blockchain", "artifacts",
+                        "contracts", "RFQRegistry.sol", "RFQRegistry.json")
+
+
+@pytest.fixture
+def chain():
+    w3 = Web3(Web3.HTTPProvider(HARDHAT_URL, request_kwargs={"timeout": 2}))
+    if not w3.is_connected():
+        pytest.skip(f"No Hardhat node at {HARDHAT_URL}")
+    if not os.path.exists(ARTIFACT):
+        pytest.skip("RFQRegistry artifact missing, run `npx hardhat compile`")
+    with open(ARTIFACT) as f:
+        artifact = json.load(f)
+
+    w3.eth.default_account = w3.eth.accounts[0]
+    factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+    receipt = w3.eth.wait_for_transaction_receipt(factory.constructor().transact())
+    contract = w3.eth.contract(address=receipt.contractAddress, abi=artifact["abi"])
+    return SimpleNamespace(w3=w3, contract=contract)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI="sqlite://", TESTING=True)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+
+
+def _create_rfq(chain, title):
+    deadline = int(time.time()) + 7 * 24 * 3600
+    tx = chain.contract.functions.createRFQ(title, "0xmeta", deadline, "IT", 1000, "Remote").transact()
+    chain.w3.eth.wait_for_transaction_receipt(tx)
+
+
+def _submit_bid(chain, rfq_id, bid_ref, price):
+    # Sent from the one operator account, as the backend does
+    tx = chain.contract.functions.submitBid(rfq_id, bid_ref, price, "0xdoc").transact()
+    chain.w3.eth.wait_for_transaction_receipt(tx)
+
+
+def test_indexes_events_and_resumes(app, chain):
+    indexer = EventIndexer(chain)
+    start = chain.w3.eth.block_number
+    _create_rfq(chain, "First")
+    _submit_bid(chain, 1, 1, 900)
+    _submit_bid(chain, 1, 2, 950)
+
+    result = indexer.sync_once()
+    assert result["indexed"] == 3
+    assert ChainRFQ.query.get(1).title == "First"
+    bids = ChainBid.query.filter_by(rfq_id=1).order_by(ChainBid.id).all()
+    assert [(b.bid_ref, b.price) for b in bids] == [(1, 900), (2, 950)]
+
+    # A new indexer (i.e. after a restart) only reads what was added since
+    tx = chain.contract.functions.closeRFQ(1).transact()
+    chain.w3.eth.wait_for_transaction_receipt(tx)
+    result = EventIndexer(chain).sync_once()
+    assert result["indexed"] == 1
+    assert ChainRFQ.query.get(1).active is False
+    assert IndexerCheckpoint.query.get(chain.contract.address).block_number > start
+
+
+def test_rolls_back_on_reorg(app, chain):
+    indexer = EventIndexer(chain)
+    _create_rfq(chain, "Kept")
+    indexer.sync_once()
+
+    snapshot = chain.w3.provider.make_request("evm_snapshot", [])["result"]
+    _create_rfq(chain, "Orphaned")
+    indexer.sync_once()
+    assert ChainRFQ.query.get(2).title == "Orphaned"
+
+    # Replace the orphaned block with a longer, different branch
+    chain.w3.provider.make_request("evm_revert", [snapshot])
+    _create_rfq(chain, "Replacement")
+    chain.w3.provider.make_request("hardhat_mine", ["0x2"])
+
+    result = indexer.sync_once()
+    assert result["reorg"] is True
+    assert ChainRFQ.query.get(1).title == "Kept"
+    assert ChainRFQ.query.get(2).title == "Replacement"
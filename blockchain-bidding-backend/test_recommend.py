@@ -0,0 +1,99 @@
+# test_recommend.py
+#
+# /api/rfqs/recommended: bidders get open RFQs closest to their profile and
+# past bids, never ones they've bid on or that have been closed.
+import hashlib
+import re
+from datetime import date
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from src.models.user import db, User, RFQ, Bid
+from src.routes.user import user_bp
+from src.services import recommend
+
+
+def _bag_of_words(text):
+    """Stand-in for MiniLM: one hashed dimension per word."""
+    vec = np.zeros(64, dtype=np.float32)
+    for word in re.findall(r"\w+", text.lower()):
+        vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1
+    return vec
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(recommend, "_embed", _bag_of_words)
+    monkeypatch.setattr(recommend, "RFQ_INDEX_PATH", str(tmp_path / "rfq_index.npz"))
+    monkeypatch.setattr(recommend, "_index", None)
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", SQLALCHEMY_DATABASE_URI="sqlite://", TESTING=True)
+    db.init_app(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        for name, role, company in (("owner", "owner", None), ("bidder", "bidder", "Solar panel installers")):
+            user = User(username=name, role=role, company=company)
+            user.set_password("pw")
+            db.session.add(user)
+        db.session.commit()
+        yield app.test_client()
+
+
+def _login(client, username):
+    client.post('/api/logout')
+    assert client.post('/api/login', json={"username": username, "password": "pw"}).status_code == 200
+
+
+def _rfq(title, scope):
+    rfq = RFQ(owner_id=User.query.filter_by(username="owner").one().id, title=title, scope=scope,
+              deadline="2030-01-01", evaluation_criteria="price", status="open")
+    db.session.add(rfq)
+    db.session.commit()
+    return rfq
+
+
+def _recommended(client):
+    r = client.get('/api/rfqs/recommended', query_string={"k": 3})
+    assert r.status_code == 200, r.json
+    return r.json
+
+
+def test_recommendations_follow_profile_history_and_closing(client):
+    solar = _rfq("Rooftop solar panel installation", "Install solar panel arrays")
+    _rfq("Catering services", "Lunch for staff")
+    _rfq("Road resurfacing", "Asphalt works")
+    bridge = _rfq("Bridge steel repainting", "Steel bridge painting and repairs")
+    assert recommend.sync()["indexed"] == 4
+
+    _login(client, "bidder")
+    result = _recommended(client)
+    assert result["strategy"] == "similar"
+    assert result["results"][0]["id"] == solar.id and result["results"][0]["score"] > 0
+
+    # Past bid text pulls in related RFQs; RFQs already bid on are excluded
+    bidder = User.query.filter_by(username="bidder").one()
+    db.session.add(Bid(rfq_id=solar.id, bidder_id=bidder.id, price=1.0, timeline_start=date(2030, 1, 1),
+                       timeline_end=date(2030, 2, 1), qualifications="Steel bridge painting crews"))
+    db.session.commit()
+    ids = [r["id"] for r in _recommended(client)["results"]]
+    assert solar.id not in ids and ids[0] == bridge.id
+
+    _login(client, "owner")
+    assert client.post(f'/api/rfqs/{bridge.id}/close').status_code == 200
+    assert client.post(f'/api/rfqs/{bridge.id}/close').status_code == 409
+    _login(client, "bidder")
+    assert bridge.id not in [r["id"] for r in _recommended(client)["results"]]  # filtered before the sync
+    assert recommend.sync()["removed"] == 1
+
+
+def test_falls_back_to_newest_open_rfqs_without_an_index(client):
+    older, newer = _rfq("Old", "a"), _rfq("New", "b")
+    _login(client, "bidder")
+    result = _recommended(client)
+    assert result["strategy"] == "recent"
+    assert [r["id"] for r in result["results"]] == [newer.id, older.id]
+    _login(client, "owner")
+    assert client.get('/api/rfqs/recommended').status_code == 403
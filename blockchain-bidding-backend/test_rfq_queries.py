@@ -0,0 +1,212 @@
+# test_rfq_queries.py
+#
+# GET /api/rfqs must issue the same number of queries no matter how many
+# RFQs, files and bids there are.
+from datetime import date
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+
+from src.models.user import db, User, RFQ, RFQFile, Bid
+from src.routes import user as user_routes
+from src.routes.user import user_bp
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", SQLALCHEMY_DATABASE_URI="sqlite://", TESTING=True)
+    db.init_app(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        client = app.test_client()
+        r = client.post('/api/register', json={"username": "owner", "password": "pw", "role": "owner"})
+        assert r.status_code == 201
+        yield client
+
+
+def _add_rfqs(count):
+    owner = User.query.filter_by(username="owner").first()
+    bidder = User.query.filter_by(username="bidder").first()
+    if bidder is None:
+        bidder = User(username="bidder", role="bidder")
+        bidder.set_password("pw")
+        db.session.add(bidder)
+        db.session.flush()
+    for i in range(count):
+        rfq = RFQ(owner_id=owner.id, title=f"RFQ {i}", scope="scope", deadline="2030-01-01",
+                  evaluation_criteria="price")
+        db.session.add(rfq)
+        db.session.flush()
+        db.session.add(RFQFile(rfq_id=rfq.id, filename="spec.pdf", filepath="/tmp/spec.pdf"))
+        for _ in range(3):
+            db.session.add(Bid(rfq_id=rfq.id, bidder_id=bidder.id, price=100.0,
+                               timeline_start=date(2030, 1, 1), timeline_end=date(2030, 2, 1)))
+    db.session.commit()
+    db.session.expunge_all()
+
+
+def _count_queries(fn):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        result = fn()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+    return result, len(statements)
+
+
+def test_rfq_list_query_count_is_constant(client):
+    _add_rfqs(2)
+    small, small_queries = _count_queries(lambda: client.get('/api/rfqs'))
+    _add_rfqs(20)
+    large, large_queries = _count_queries(lambda: client.get('/api/rfqs'))
+
+    assert small.status_code == large.status_code == 200
+    assert len(large.json) == 22
+    assert large_queries == small_queries
+    assert all(r["bid_count"] == 3 and len(r["files"]) == 1 for r in large.json)
+
+
+def test_to_dict_many_matches_to_dict(client):
+    _add_rfqs(3)
+    rfqs = RFQ.query.order_by(RFQ.id).all()
+    expected = [r.to_dict(include_files=True) for r in rfqs]
+    db.session.expunge_all()
+
+    rfqs = RFQ.query.order_by(RFQ.id).all()
+    assert RFQ.to_dict_many(rfqs, include_files=True) == expected
+
+
+def test_rfq_pagination_walks_every_row_once(client):
+    _add_rfqs(7)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        page = client.get('/api/rfqs', query_string=params).json
+        seen.extend(r["id"] for r in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == sorted(seen, reverse=True)
+    assert sorted(seen) == [r.id for r in RFQ.query.order_by(RFQ.id)]
+    assert client.get('/api/rfqs', query_string={"cursor": "garbage"}).status_code == 400
+    # Without limit/cursor the legacy plain array is returned
+    assert isinstance(client.get('/api/rfqs').json, list)
+
+
+def test_dashboard_cache_is_invalidated_by_new_bids(client):
+    _add_rfqs(2)
+    client.post('/api/logout')
+    client.post('/api/login', json={"username": "bidder", "password": "pw"})
+
+    first = client.get('/api/dashboard').json
+    assert first["available_rfqs"] == 2 and first["bid_count"] == 6
+    assert len(first["recent_rfqs"]) == 2
+
+    _, cached_queries = _count_queries(lambda: client.get('/api/dashboard'))
+    _add_rfqs(1)
+    second = client.get('/api/dashboard').json
+    assert second["bid_count"] == 9
+    # A cache hit only loads the session user
+    assert cached_queries <= 1
+
+
+def test_bid_stats_follow_bid_writes(client):
+    from src.services import bid_stats
+    _add_rfqs(1)
+    rfq = RFQ.query.first()
+    bids = Bid.query.filter_by(rfq_id=rfq.id).order_by(Bid.id).all()
+    for bid, price in zip(bids, (300.0, 100.0, 200.0)):
+        bid.price = price
+    bids[0].phase2_status = "pass"
+    bids[0].phase2_score = 80.0
+    db.session.commit()
+
+    stats = bid_stats.get(rfq.id).to_dict()
+    assert (stats["bid_count"], stats["min_price"], stats["max_price"], stats["median_price"]) == (3, 100.0, 300.0, 200.0)
+    assert stats["avg_phase2_score"] == 80.0
+    assert stats["phase2_counts"] == {"pass": 1, "pending": 2}
+
+    db.session.delete(bids[1])
+    db.session.commit()
+    stats = bid_stats.get(rfq.id).to_dict()
+    assert stats["bid_count"] == 2 and stats["median_price"] == 250.0
+    assert RFQ.query.get(rfq.id).bid_count == 2
+
+
+def _stored_stats(rfq_id):
+    from src.services import bid_stats
+    stats = bid_stats.get(rfq_id)
+    return {key: getattr(stats, key) for key in bid_stats.compute(db.session, rfq_id) if key != "updated_at"}
+
+
+def _recomputed_stats(rfq_id):
+    from src.services import bid_stats
+    stats = bid_stats.compute(db.session, rfq_id)
+    del stats["updated_at"]
+    return stats
+
+
+def test_bid_stats_deltas_match_a_recompute(client):
+    _add_rfqs(2)
+    first, second = RFQ.query.order_by(RFQ.id).all()
+    bids = Bid.query.filter_by(rfq_id=first.id).order_by(Bid.id).all()
+
+    bids[0].price, bids[0].phase2_score, bids[0].status = 50.0, 70.0, "accepted"
+    bids[1].phase1_status = "fail"
+    db.session.commit()
+    bids[2].phase2_score = 90.0
+    db.session.add(Bid(rfq_id=first.id, bidder_id=bids[0].bidder_id, price=400.0, phase2_score=60.0,
+                       timeline_start=date(2030, 1, 1), timeline_end=date(2030, 2, 1)))
+    db.session.commit()
+    db.session.delete(bids[0])  # the cheapest bid
+    db.session.commit()
+    bids[1].rfq_id = second.id  # moved, keeping its phase1 status
+    db.session.commit()
+
+    for rfq in (first, second):
+        assert _stored_stats(rfq.id) == _recomputed_stats(rfq.id)
+    assert _stored_stats(first.id)["bid_count"] == 2 and _stored_stats(second.id)["bid_count"] == 4
+    assert _stored_stats(second.id)["phase1_counts"] == {"pending": 3, "fail": 1}
+
+
+def test_bid_stats_status_change_runs_no_aggregate_query(client):
+    _add_rfqs(1)
+    bid = Bid.query.first()
+    bid.status = "accepted"
+
+    statements = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(db.engine, "before_cursor_execute", listener)
+    try:
+        db.session.commit()
+    finally:
+        event.remove(db.engine, "before_cursor_execute", listener)
+    assert not [s for s in statements if "FROM bids" in s]
+    assert _stored_stats(bid.rfq_id)["status_counts"] == {"submitted": 2, "accepted": 1}
+
+
+def test_user_is_loaded_once_and_optionally_cached(client, monkeypatch):
+    _add_rfqs(1)
+    client.post('/api/logout')
+    client.post('/api/login', json={"username": "bidder", "password": "pw"})
+    profile = lambda: client.get('/api/bidder/profile')  # role_required + handler lookup
+
+    _, uncached_queries = _count_queries(profile)
+    assert uncached_queries == 1
+
+    monkeypatch.setattr(user_routes, "USER_CACHE_TTL", 60)
+    profile()
+    response, cached_queries = _count_queries(profile)
+    assert cached_queries == 0 and response.json["company"] is None
+
+    assert client.put('/api/bidder/profile', json={"company": "Acme"}).status_code == 200
+    assert profile().json["company"] == "Acme"  # the update cleared the cache
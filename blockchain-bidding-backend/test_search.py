@@ -0,0 +1,126 @@
+# test_search.py
+#
+# /api/search: FTS5 indexes follow writes, rank title hits first, and only
+# show bid documents to the people allowed to see the bid.
+from datetime import date
+
+import pytest
+from flask import Flask
+
+from src.models.user import db, User, RFQ, Bid, BidFile, RFQFile
+from src.routes.user import user_bp
+from src.services import page_index
+
+
+@pytest.fixture
+def client(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SECRET_KEY="test", SQLALCHEMY_DATABASE_URI="sqlite://", TESTING=True,
+                      UPLOAD_FOLDER=str(tmp_path))
+    db.init_app(app)
+    app.register_blueprint(user_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+        for name, role in (("owner", "owner"), ("bidder", "bidder"), ("rival", "bidder")):
+            user = User(username=name, role=role)
+            user.set_password("pw")
+            db.session.add(user)
+        db.session.commit()
+        yield app.test_client()
+
+
+def _login(client, username):
+    client.post('/api/logout')
+    assert client.post('/api/login', json={"username": username, "password": "pw"}).status_code == 200
+
+
+def _rfq(title, scope, status="open"):
+    owner = User.query.filter_by(username="owner").one()
+    rfq = RFQ(owner_id=owner.id, title=title, scope=scope, deadline="2030-01-01",
+              evaluation_criteria="price", status=status)
+    db.session.add(rfq)
+    db.session.commit()
+    return rfq
+
+
+def _document(tmp_path, model, name, body, **keys):
+    path = tmp_path / name
+    path.write_text(body)
+    row = model(filename=name, filepath=str(path), **keys)
+    db.session.add(row)
+    db.session.commit()
+    page_index.index_row(row)
+    db.session.commit()
+    return row
+
+
+def _search(client, **params):
+    r = client.get('/api/search', query_string=params)
+    assert r.status_code == 200, r.json
+    return r.json
+
+
+def test_rfq_index_follows_inserts_updates_and_deletes(client):
+    _login(client, "bidder")
+    rfq = _rfq("Solar farm maintenance", "Inspect inverters")
+    _rfq("Office cleaning", "Weekly cleaning of the solar-powered office")
+
+    hits = _search(client, q="solar")["results"]
+    assert [h["rfq_id"] for h in hits][0] == rfq.id  # title match outranks scope match
+    assert "<mark>Solar</mark>" in hits[0]["snippet"]
+
+    rfq.title = "Wind farm maintenance"
+    db.session.commit()
+    assert _search(client, q="wind")["results"][0]["rfq_id"] == rfq.id
+    assert rfq.id not in [h["rfq_id"] for h in _search(client, q="solar farm")["results"]]
+
+    db.session.delete(rfq)
+    db.session.commit()
+    assert _search(client, q="wind")["results"] == []
+
+
+def test_filters_prefix_matching_and_bad_queries(client):
+    _login(client, "bidder")
+    _rfq("Bridge repair", "Steel works", status="open")
+    _rfq("Bridge painting", "Steel works", status="closed")
+
+    assert [h["title"] for h in _search(client, q="bri", prefix=1, status="closed")["results"]] == ["Bridge painting"]
+    assert _search(client, q="bri")["results"] == []
+    assert len(_search(client, q='"steel (works', type="rfq")["results"]) == 2
+    assert client.get('/api/search', query_string={"q": "  ?! "}).status_code == 400
+    assert client.get('/api/search', query_string={"q": "x", "type": "users"}).status_code == 400
+
+
+def test_document_pages_are_searchable_by_permitted_users(client, tmp_path):
+    rfq = _rfq("Data centre", "Cooling")
+    _document(tmp_path, RFQFile, "spec.txt", "Redundant chillers are mandatory", rfq_id=rfq.id)
+    bidder = User.query.filter_by(username="bidder").one()
+    bid = Bid(rfq_id=rfq.id, bidder_id=bidder.id, price=10.0,
+              timeline_start=date(2030, 1, 1), timeline_end=date(2030, 2, 1))
+    db.session.add(bid)
+    db.session.commit()
+    _document(tmp_path, BidFile, "proposal.txt", "We supply adiabatic chillers", bid_id=bid.id)
+
+    _login(client, "owner")
+    assert {h["type"] for h in _search(client, q="chillers")["results"]} == {"rfq_file", "bid_file"}
+    _login(client, "bidder")
+    assert {h["type"] for h in _search(client, q="chillers")["results"]} == {"rfq_file", "bid_file"}
+    _login(client, "rival")
+    hits = _search(client, q="chillers")["results"]
+    assert [(h["type"], h["filename"], h["page"]) for h in hits] == [("rfq_file", "spec.txt", 1)]
+
+
+def test_rfq_and_document_hits_are_merged_by_rank_not_raw_bm25(client, tmp_path):
+    _login(client, "owner")
+    first = _rfq("Pump station", "Pump pump pump")
+    second = _rfq("Pump refurbishment", "Seals")
+    _document(tmp_path, RFQFile, "a.txt", "pump " * 50, rfq_id=first.id)
+    _document(tmp_path, RFQFile, "b.txt", "pump " * 50 + "valves " * 500, rfq_id=second.id)
+
+    hits = _search(client, q="pump")["results"]
+    assert [h["type"] for h in hits] == ["rfq", "rfq_file", "rfq", "rfq_file"]
+    assert hits[0]["score"] == hits[1]["score"] > hits[2]["score"]
+    assert [h["filename"] for h in hits if h["type"] == "rfq_file"] == ["a.txt", "b.txt"]
+
+    page = _search(client, q="pump", limit=2, offset=2)
+    assert page["results"] == hits[2:] and page["next_offset"] is None
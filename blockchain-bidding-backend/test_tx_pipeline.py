@@ -0,0 +1,354 @@
+# test_tx_pipeline.py
+#
+# Outbox sending and receipt tracking against an in-memory fake node; signing
+# is real (eth_account), so tx hashes match what a node would report.
+import json
+from datetime import datetime, timedelta
+from decimal import Decimal
+from types import SimpleNamespace
+
+import pytest
+from eth_account import Account
+from flask import Flask
+from sqlalchemy import select
+from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from web3.providers.base import BaseProvider
+
+from src.blockchain import contract_service, tx_pipeline
+from src.blockchain.tx_pipeline import TxPipeline
+from src.models.user import db, ChainTransaction, RFQ, User
+from src.routes.user import user_bp
+
+
+class FakeEth:
+    def __init__(self):
+        self.account = Account
+        self.gas_price = Web3.to_wei(20, "gwei")
+        self.pending_count = 0
+        self.pool = {}  # hash -> raw tx the node knows about
+        self.mined = {}  # hash -> receipt
+        self.on_send = None
+        self.fail_send = None
+
+    def get_transaction_count(self, address, block):
+        return self.pending_count
+
+    def send_raw_transaction(self, raw):
+        tx_hash = Web3.to_hex(Web3.keccak(raw))
+        if self.on_send:
+            self.on_send(tx_hash)
+        if self.fail_send:
+            raise self.fail_send
+        self.pool[tx_hash] = raw
+        return Web3.keccak(raw)
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.pool and tx_hash not in self.mined:
+            raise TransactionNotFound(tx_hash)
+        return {"hash": tx_hash}
+
+    def get_transaction_receipt(self, tx_hash):
+        if tx_hash not in self.mined:
+            raise TransactionNotFound(tx_hash)
+        return self.mined[tx_hash]
+
+    def mine(self, tx_hash, status=1, to=None):
+        self.pool.pop(tx_hash, None)
+        self.mined[tx_hash] = SimpleNamespace(status=status, logs=[], to=to)
+
+
+class FakeW3:
+    to_hex = staticmethod(Web3.to_hex)
+    to_wei = staticmethod(Web3.to_wei)
+
+    def __init__(self):
+        self.eth = FakeEth()
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'chain.db'}", TESTING=True)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def node():
+    return FakeW3()
+
+
+@pytest.fixture
+def pipeline(node):
+    account = Account.create()
+    receipts = []
+    pipeline = TxPipeline(SimpleNamespace(w3=node), account.address, account.key,
+                          on_receipt=lambda record, receipt: receipts.append(record.id))
+    pipeline.receipts = receipts
+    return pipeline
+
+
+class EstimatingProvider(BaseProvider):
+    """Answers what build_transaction asks a node; every gas estimate is 60000."""
+
+    def make_request(self, method, params):
+        results = {"eth_estimateGas": hex(60000), "eth_chainId": hex(1337)}
+        return {"jsonrpc": "2.0", "id": 1, "result": results[method]}
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    """The deployed RFQRegistry ABI on a node that only estimates gas."""
+    with open(contract_service.CONTRACT_INFO_PATH) as f:
+        info = json.load(f)
+    contract = Web3(EstimatingProvider()).eth.contract(address=info["address"], abi=info["abi"])
+    monkeypatch.setattr(contract_service, "client", SimpleNamespace(contract=contract))
+    return contract
+
+
+def decoded(contract, tx):
+    function, args = contract.decode_function_input(tx["data"])
+    return function.fn_name, args
+
+
+def transfer(base):
+    return {**base, "to": "0x" + "11" * 20, "value": 0, "gas": 21000, "chainId": 1337}
+
+
+def outbox_row(status="recorded", **fields):
+    record = ChainTransaction(kind="close_rfq", args={"rfq_id": 1}, status=status, **fields)
+    db.session.add(record)
+    db.session.commit()
+    return record
+
+
+def committed_status(record_id):
+    table = ChainTransaction.__table__
+    with db.engine.connect() as conn:
+        return conn.execute(select(table.c.status, table.c.tx_hash).where(table.c.id == record_id)).first()
+
+
+def test_send_commits_the_row_before_broadcasting(app, node, pipeline):
+    record = outbox_row()
+    seen = []
+    node.eth.on_send = lambda tx_hash: seen.append((tx_hash, committed_status(record.id)))
+
+    tx_hash = pipeline.send([record], transfer, expected="recorded")
+
+    assert seen == [(tx_hash, ("sent", tx_hash))]
+    assert record.nonce == 0 and record.attempts == 1
+
+
+def test_send_skips_rows_another_sender_claimed(app, node, pipeline):
+    record = outbox_row()
+    pipeline.send([record], transfer, expected="recorded")
+
+    assert pipeline.send([record], transfer, expected="recorded") is None
+    assert len(node.eth.pool) == 1
+
+
+def test_tracker_resends_a_tx_the_node_lost(app, node, pipeline, monkeypatch):
+    monkeypatch.setattr(tx_pipeline, "RESEND_SECONDS", 0)
+    record = outbox_row()
+    node.eth.fail_send = OSError("connection reset")
+    tx_hash = pipeline.send([record], transfer, expected="recorded")
+    assert record.status == "sent" and node.eth.pool == {}
+
+    node.eth.fail_send = None
+    record.sent_at = datetime.utcnow() - timedelta(seconds=1)
+    db.session.commit()
+    pipeline.track_once()
+    assert tx_hash in node.eth.pool  # same signed tx, same hash
+
+    node.eth.mine(tx_hash)
+    pipeline.track_once()
+    assert record.status == "confirmed"
+    assert pipeline.receipts == [record.id]
+
+
+def test_write_stuck_at_max_gas_price_is_cancelled(app, node, pipeline, monkeypatch):
+    monkeypatch.setattr(tx_pipeline, "MAX_GAS_PRICE_GWEI", 20)
+    record = outbox_row()
+    stuck_hash = pipeline.send([record], transfer, expected="recorded")
+    record.sent_at = datetime.utcnow() - timedelta(seconds=tx_pipeline.STUCK_SECONDS + 1)
+    db.session.commit()
+
+    pipeline.track_once()
+    assert record.status == "cancelling" and record.nonce == 0
+    assert record.replaced_hashes == [stuck_hash]
+    assert record.tx["to"] == pipeline._address and record.tx["value"] == 0
+    assert record.gas_price > Web3.to_wei(20, "gwei")
+
+    node.eth.mine(record.tx_hash, to=pipeline._address)
+    pipeline.track_once()
+    assert record.status == "failed" and "cancelled" in record.error
+    assert pipeline.receipts == []
+
+
+def test_original_write_mined_while_cancelling_is_confirmed(app, node, pipeline, monkeypatch):
+    monkeypatch.setattr(tx_pipeline, "MAX_GAS_PRICE_GWEI", 20)
+    record = outbox_row()
+    stuck_hash = pipeline.send([record], transfer, expected="recorded")
+    record.sent_at = datetime.utcnow() - timedelta(seconds=tx_pipeline.STUCK_SECONDS + 1)
+    db.session.commit()
+    pipeline.track_once()
+
+    node.eth.mine(stuck_hash, to="0x" + "11" * 20)
+    pipeline.track_once()
+    assert record.status == "confirmed" and record.tx_hash == stuck_hash
+    assert pipeline.receipts == [record.id]
+
+
+def test_waiting_writes_follow_their_rfq_create(app):
+    create = outbox_row(status="sent")
+    bid = ChainTransaction(kind="submit_bid", args={"rfq_id": None, "price_int": 100, "doc_hash": "0x1"},
+                           status="waiting", depends_on=create.id)
+    db.session.add(bid)
+    db.session.commit()
+
+    contract_service._resolve_waiting()
+    assert bid.status == "waiting"
+
+    create.status, create.result_id = "confirmed", 7
+    db.session.commit()
+    contract_service._resolve_waiting()
+    db.session.refresh(bid)
+    assert bid.status == "recorded" and bid.args["rfq_id"] == 7
+
+
+def test_waiting_writes_fail_with_their_rfq_create(app):
+    create = outbox_row(status="failed", error="Transaction reverted")
+    close = outbox_row(status="waiting", depends_on=create.id)
+
+    contract_service._resolve_waiting()
+    db.session.refresh(close)
+    assert close.status == "failed" and "reverted" in close.error
+
+
+def test_bid_on_a_pending_rfq_waits_for_its_create(app):
+    rfq = RFQ(owner_id=1, title="Roof repair", scope="Replace tiles", deadline="2030-01-01",
+              evaluation_criteria="Price", status="open")
+    db.session.add(rfq)
+    db.session.flush()
+    contract_service.create_rfq_onchain("Roof repair", "0xmeta", "2030-01-01", "Construction", 100, "Oslo",
+                                        ref_id=rfq.id)
+    db.session.commit()
+
+    rfq_onchain_id, waits_for = contract_service.rfq_chain_ref(rfq)
+    assert rfq_onchain_id is None and waits_for is not None
+    result = contract_service.submit_bid_onchain(rfq_onchain_id, Decimal("12.50"), "0xdoc", ref_id=1,
+                                                 depends_on=waits_for)
+    db.session.commit()
+    bid = db.session.get(ChainTransaction, result["pendingId"])
+    assert bid.status == "waiting"
+
+    create = db.session.get(ChainTransaction, waits_for)
+    create.status, create.result_id = "confirmed", 3
+    db.session.commit()
+    assert contract_service.rfq_chain_ref(rfq) == (3, None)
+    contract_service._resolve_waiting()
+    db.session.refresh(bid)
+    assert bid.status == "recorded"
+    assert bid.args == {"rfq_id": 3, "bid_ref": 1, "price_int": 1250, "doc_hash": "0xdoc"}
+
+
+def test_close_of_a_pending_rfq_fails_with_its_create(app):
+    create = outbox_row(status="sent")
+    result = contract_service.close_rfq_onchain(None, ref_id=1, depends_on=create.id)
+    db.session.commit()
+    close = db.session.get(ChainTransaction, result["pendingId"])
+    assert close.status == "waiting" and close.args == {"rfq_id": None}
+
+    create.status, create.error = "failed", "Transaction reverted"
+    db.session.commit()
+    contract_service._resolve_waiting()
+    db.session.refresh(close)
+    assert close.status == "failed"
+
+
+def test_several_bids_on_one_rfq_are_told_apart_by_bid_id(app, registry):
+    base = {"from": "0x" + "22" * 20, "nonce": 0, "gasPrice": Web3.to_wei(20, "gwei"), "chainId": 1337}
+    ids = [contract_service.submit_bid_onchain(3, Decimal("10.00") + n, f"0xdoc{n}", ref_id=40 + n)["pendingId"]
+           for n in range(3)]
+    db.session.commit()
+    records = [db.session.get(ChainTransaction, record_id) for record_id in ids]
+    assert [r.args["bid_ref"] for r in records] == [40, 41, 42]
+
+    for n, record in enumerate(records):
+        tx = contract_service._BUILDERS["submit_bid"](**record.args)(base)
+        assert decoded(registry, tx) == ("submitBid", {"rfqId": 3, "bidRef": 40 + n,
+                                                      "price": 1000 + 100 * n, "docHash": f"0xdoc{n}"})
+
+
+def test_bids_on_one_rfq_share_a_batch(app, registry):
+    base = {"from": "0x" + "22" * 20, "nonce": 0, "gasPrice": Web3.to_wei(20, "gwei"), "chainId": 1337}
+    ids = [contract_service.submit_bid_onchain(3, Decimal("10.00"), f"0xdoc{n}", ref_id=40 + n)["pendingId"]
+           for n in range(3)]
+    db.session.commit()
+    records = [db.session.get(ChainTransaction, record_id) for record_id in ids]
+
+    # A deadline rush on one RFQ goes out as one submitBidBatch
+    tx = contract_service._build_batch("submit_bid", [r.args for r in records])(base)
+    name, args = decoded(registry, tx)
+    assert name == "submitBidBatch"
+    assert [(item["rfqId"], item["bidRef"]) for item in args["items"]] == [(3, 40), (3, 41), (3, 42)]
+    assert tx["gas"] == int(60000 * contract_service.GAS_HEADROOM)
+
+
+def test_single_writes_use_the_gas_estimate(registry):
+    base = {"from": "0x" + "22" * 20, "nonce": 0, "gasPrice": Web3.to_wei(20, "gwei"), "chainId": 1337}
+    builds = [contract_service._build_create_rfq("Roof", "0xmeta", 1893456000, "Construction", 100, "Oslo"),
+              contract_service._build_close_rfq(3),
+              contract_service._build_submit_bid(3, 40, 1000, "0xdoc")]
+
+    assert [build(base)["gas"] for build in builds] == [int(60000 * contract_service.GAS_HEADROOM)] * 3
+
+
+def test_unparseable_receipt_is_logged(registry, caplog):
+    with caplog.at_level("WARNING", logger=contract_service.__name__):
+        assert contract_service._parse_result_id("submit_bid", {"logs": []}) is None
+
+    assert "No BidSubmitted event found" in caplog.text
+
+
+def test_bid_without_an_off_chain_id_is_refused(app):
+    with pytest.raises(ValueError, match="ref_id"):
+        contract_service.submit_bid_onchain(3, Decimal("10"), "0xdoc")
+
+
+def test_failed_writes_are_requeued_for_the_tracker(app):
+    reverted = outbox_row(status="failed", error="Transaction reverted", batch_index=2)
+    orphan = outbox_row(status="failed", error="RFQ create #1 failed", depends_on=reverted.id)
+    orphan.args = {"rfq_id": None}
+    confirmed = outbox_row(status="confirmed")
+
+    assert contract_service.retry_failed([reverted.id, orphan.id, confirmed.id]) == 1
+    db.session.commit()
+    assert (reverted.status, reverted.error, reverted.batch_index) == ("recorded", None, None)
+    assert (orphan.status, confirmed.status) == ("failed", "confirmed")
+
+
+def test_replay_route_only_requeues_and_wakes_the_senders(app, monkeypatch):
+    app.config["SECRET_KEY"] = "test"
+    app.register_blueprint(user_bp, url_prefix='/api')
+    admin = User(username="admin", role="admin")
+    admin.set_password("pw")
+    db.session.add(admin)
+    failed = outbox_row(status="failed", error="Transaction reverted")
+    woken = []
+    monkeypatch.setattr(contract_service.pipeline, "send", lambda *args, **kwargs: pytest.fail("request sent a tx"))
+    monkeypatch.setattr(contract_service.pipeline, "wake", lambda: woken.append("tracker"))
+    monkeypatch.setattr(contract_service.batcher, "wake", lambda: woken.append("batcher"))
+    client = app.test_client()
+    assert client.post('/api/login', json={"username": "admin", "password": "pw"}).status_code == 200
+
+    assert client.post('/api/admin/chain/replay', json={"ids": "all"}).status_code == 400
+    r = client.post('/api/admin/chain/replay', json={"ids": [failed.id]})
+
+    assert r.status_code == 202 and r.json == {"retried": 1, "recorded_pending": 1, "queued": 0}
+    assert committed_status(failed.id) == ("recorded", None)
+    assert woken == ["tracker", "batcher"]
@@ -43,7 +43,7 @@ export default function BidderDashboard() {
       const data = await res.json()
 
       if (data.role === "bidder") {
-        const wonBids = data.bids.filter((bid) => bid.status === "selected").length
+        const wonBids = data.won_count ?? data.bids.filter((bid) => bid.status === "selected").length
         setStats({
           availableRFQs: data.available_rfqs,
           myBids: data.bid_count,
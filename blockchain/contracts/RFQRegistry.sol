@@ -17,9 +17,28 @@ contract RFQRegistry {
     struct Bid {
         uint256 id;
         uint256 rfqId;
-        address bidder;
-        uint256 price;    // stored in cents
-        string docHash;   // off-chain reference
+        uint256 bidRef;     // off-chain bid id
+        address submitter;  // operator account that anchored it on the bidder's behalf
+        uint256 price;      // stored in cents
+        string docHash;     // off-chain reference
+    }
+
+    // One createRFQBatch item; same fields as createRFQ
+    struct RFQInput {
+        string title;
+        string metaHash;
+        uint256 deadline;
+        string category;
+        uint256 budget;
+        string location;
+    }
+
+    // One submitBidBatch item; same fields as submitBid
+    struct BidInput {
+        uint256 rfqId;
+        uint256 bidRef;
+        uint256 price;
+        string docHash;
     }
 
     uint256 public nextId;
@@ -27,7 +46,9 @@ contract RFQRegistry {
 
     mapping(uint256 => RFQ) public rfqs;
     mapping(uint256 => Bid[]) private rfqBids; // RFQ ID → array of bids
-    mapping(uint256 => mapping(address => bool)) private hasBid; // rfqId → bidder → true
+    // submitter → off-chain bid id → on-chain bid id. Keyed by the off-chain id,
+    // not msg.sender: one operator account submits every bidder's bids
+    mapping(address => mapping(uint256 => uint256)) public bidIdByRef;
 
     // ----------------- Events -----------------
     event RFQCreated(
@@ -45,7 +66,8 @@ contract RFQRegistry {
     event BidSubmitted(
         uint256 indexed id,
         uint256 indexed rfqId,
-        address indexed bidder,
+        address indexed submitter,
+        uint256 bidRef,
         uint256 price,
         string docHash
     );
@@ -59,6 +81,33 @@ contract RFQRegistry {
         uint256 budget,
         string calldata location
     ) external returns (uint256 id) {
+        id = _createRFQ(title, metaHash, deadline, category, budget, location);
+    }
+
+    /// Create several RFQs in one transaction; reverts as a whole if any item is invalid.
+    function createRFQBatch(RFQInput[] calldata items) external returns (uint256[] memory ids) {
+        ids = new uint256[](items.length);
+        for (uint256 i = 0; i < items.length; i++) {
+            RFQInput calldata item = items[i];
+            ids[i] = _createRFQ(
+                item.title,
+                item.metaHash,
+                item.deadline,
+                item.category,
+                item.budget,
+                item.location
+            );
+        }
+    }
+
+    function _createRFQ(
+        string calldata title,
+        string calldata metaHash,
+        uint256 deadline,
+        string calldata category,
+        uint256 budget,
+        string calldata location
+    ) internal returns (uint256 id) {
         require(deadline > block.timestamp, "Deadline must be in future");
 
         id = ++nextId;
@@ -85,21 +134,41 @@ contract RFQRegistry {
     }
 
     // ----------------- Bid Functions -----------------
+    /// Anchor the off-chain bid `bidRef`; each bidRef can be submitted once per submitter.
     function submitBid(
         uint256 rfqId,
+        uint256 bidRef,
         uint256 price,
         string calldata docHash
     ) external returns (uint256 bidId) {
+        bidId = _submitBid(rfqId, bidRef, price, docHash);
+    }
+
+    /// Submit several bids (to any RFQs, including the same one) in one transaction; reverts as a whole if any item is invalid.
+    function submitBidBatch(BidInput[] calldata items) external returns (uint256[] memory bidIds) {
+        bidIds = new uint256[](items.length);
+        for (uint256 i = 0; i < items.length; i++) {
+            BidInput calldata item = items[i];
+            bidIds[i] = _submitBid(item.rfqId, item.bidRef, item.price, item.docHash);
+        }
+    }
+
+    function _submitBid(
+        uint256 rfqId,
+        uint256 bidRef,
+        uint256 price,
+        string calldata docHash
+    ) internal returns (uint256 bidId) {
         RFQ storage r = rfqs[rfqId];
         require(r.active, "RFQ not active");
         require(block.timestamp <= r.deadline, "Deadline passed");
-        require(!hasBid[rfqId][msg.sender], "Already submitted");
+        require(bidIdByRef[msg.sender][bidRef] == 0, "Already submitted");
 
         bidId = ++nextBidId;
-        rfqBids[rfqId].push(Bid(bidId, rfqId, msg.sender, price, docHash));
-        hasBid[rfqId][msg.sender] = true;
+        rfqBids[rfqId].push(Bid(bidId, rfqId, bidRef, msg.sender, price, docHash));
+        bidIdByRef[msg.sender][bidRef] = bidId;
 
-        emit BidSubmitted(bidId, rfqId, msg.sender, price, docHash);
+        emit BidSubmitted(bidId, rfqId, msg.sender, bidRef, price, docHash);
     }
 
     function getBids(uint256 rfqId) external view returns (Bid[] memory) {
@@ -0,0 +1,195 @@
+const {
+  time,
+  loadFixture,
+} = require("@nomicfoundation/hardhat-toolbox/network-helpers");
+const { expect } = require("chai");
+
+const BATCH_SIZES = [1, 5, 10, 25];
+
+describe("RFQRegistry", function () {
+  async function deployRegistryFixture() {
+    const [owner, bidder] = await ethers.getSigners();
+    const RFQRegistry = await ethers.getContractFactory("RFQRegistry");
+    const registry = await RFQRegistry.deploy();
+    const deadline = (await time.latest()) + 7 * 24 * 60 * 60;
+    return { registry, owner, bidder, deadline };
+  }
+
+  function rfqInput(i, deadline) {
+    return {
+      title: `RFQ ${i}`,
+      metaHash: ethers.id(`scope ${i}`),
+      deadline,
+      category: "IT Services",
+      budget: 100000,
+      location: "Remote",
+    };
+  }
+
+  function bidInput(rfqId, bidRef, price, docHash) {
+    return { rfqId, bidRef, price, docHash };
+  }
+
+  async function createRFQs(registry, count, deadline) {
+    const items = Array.from({ length: count }, (_, i) => rfqInput(i, deadline));
+    await (await registry.createRFQBatch(items)).wait();
+  }
+
+  async function gasUsed(txPromise) {
+    const receipt = await (await txPromise).wait();
+    return receipt.gasUsed;
+  }
+
+  describe("Batch entry points", function () {
+    it("creates RFQs in order and emits one event per item", async function () {
+      const { registry, owner, deadline } = await loadFixture(deployRegistryFixture);
+      const items = [rfqInput(0, deadline), rfqInput(1, deadline)];
+
+      await expect(registry.createRFQBatch(items))
+        .to.emit(registry, "RFQCreated")
+        .withArgs(1, owner.address, "RFQ 0", items[0].metaHash, deadline, "IT Services", 100000, "Remote");
+      expect(await registry.nextId()).to.equal(2);
+      expect((await registry.rfqs(2)).title).to.equal("RFQ 1");
+    });
+
+    it("submits bids to several RFQs in one call", async function () {
+      const { registry, bidder, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 3, deadline);
+
+      await expect(
+        registry.connect(bidder).submitBidBatch([
+          bidInput(1, 11, 900, "0xa"), bidInput(2, 12, 950, "0xb"), bidInput(3, 13, 1000, "0xc"),
+        ])
+      )
+        .to.emit(registry, "BidSubmitted")
+        .withArgs(3, 3, bidder.address, 13, 1000, "0xc");
+      expect((await registry.getBids(2))[0].price).to.equal(950);
+    });
+
+    it("reverts the whole batch if one item is invalid", async function () {
+      const { registry, bidder, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 2, deadline);
+      await registry.closeRFQ(2);
+
+      await expect(
+        registry.connect(bidder).submitBidBatch([bidInput(1, 11, 900, "0xa"), bidInput(2, 12, 950, "0xb")])
+      ).to.be.revertedWith("RFQ not active");
+      expect(await registry.nextBidId()).to.equal(0);
+    });
+  });
+
+  describe("Operator-submitted bids", function () {
+    it("accepts many bids on one RFQ from the same operator account", async function () {
+      const { registry, owner, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 1, deadline);
+
+      for (const bidRef of [7, 8, 9]) {
+        await registry.submitBid(1, bidRef, 900 + bidRef, ethers.id(`bid ${bidRef}`));
+      }
+      const bids = await registry.getBids(1);
+      expect(bids.map((b) => b.bidRef)).to.deep.equal([7n, 8n, 9n]);
+      expect(bids.every((b) => b.submitter === owner.address)).to.equal(true);
+      expect(await registry.bidIdByRef(owner.address, 8)).to.equal(2);
+    });
+
+    it("batches several bids for the same RFQ", async function () {
+      const { registry, owner, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 2, deadline);
+
+      await expect(
+        registry.submitBidBatch([
+          bidInput(1, 21, 900, "0xa"), bidInput(1, 22, 950, "0xb"),
+          bidInput(2, 23, 990, "0xc"), bidInput(1, 24, 1000, "0xd"),
+        ])
+      )
+        .to.emit(registry, "BidSubmitted")
+        .withArgs(4, 1, owner.address, 24, 1000, "0xd");
+      expect((await registry.getBids(1)).map((b) => b.bidRef)).to.deep.equal([21n, 22n, 24n]);
+      expect(await registry.nextBidId()).to.equal(4);
+    });
+
+    it("rejects the same off-chain bid twice, alone or within a batch", async function () {
+      const { registry, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 1, deadline);
+      await registry.submitBid(1, 5, 900, "0xa");
+
+      await expect(registry.submitBid(1, 5, 900, "0xa")).to.be.revertedWith("Already submitted");
+      await expect(
+        registry.submitBidBatch([bidInput(1, 6, 900, "0xb"), bidInput(1, 6, 900, "0xb")])
+      ).to.be.revertedWith("Already submitted");
+    });
+
+    it("keeps each submitter's bid ids separate", async function () {
+      const { registry, owner, bidder, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 1, deadline);
+
+      await registry.submitBid(1, 5, 900, "0xa");
+      await registry.connect(bidder).submitBid(1, 5, 950, "0xb");
+      expect(await registry.bidIdByRef(owner.address, 5)).to.equal(1);
+      expect(await registry.bidIdByRef(bidder.address, 5)).to.equal(2);
+    });
+  });
+
+  describe("Gas per item", function () {
+    for (const size of BATCH_SIZES) {
+      it(`batch of ${size} bids costs less per bid than single calls`, async function () {
+        const { registry, bidder, deadline } = await loadFixture(deployRegistryFixture);
+        await createRFQs(registry, size * 2, deadline);
+        const doc = ethers.id("bid document");
+
+        let single = 0n;
+        for (let i = 1; i <= size; i++) {
+          single += await gasUsed(registry.connect(bidder).submitBid(i, i, 900, doc));
+        }
+
+        const ids = Array.from({ length: size }, (_, i) => size + i + 1);
+        const batch = await gasUsed(
+          registry.connect(bidder).submitBidBatch(ids.map((id) => bidInput(id, id, 900, doc)))
+        );
+
+        const perSingle = single / BigInt(size);
+        const perBatch = batch / BigInt(size);
+        console.log(`      submitBid x${size}: ${perSingle} gas/bid single, ${perBatch} gas/bid batched`);
+        if (size > 1) {
+          expect(perBatch).to.be.lessThan(perSingle);
+        }
+      });
+    }
+
+    it("a deadline rush of bids on one RFQ batches too", async function () {
+      const { registry, deadline } = await loadFixture(deployRegistryFixture);
+      await createRFQs(registry, 1, deadline);
+      const doc = ethers.id("bid document");
+      const size = 10;
+
+      let single = 0n;
+      for (let i = 1; i <= size; i++) {
+        single += await gasUsed(registry.submitBid(1, i, 900, doc));
+      }
+      const refs = Array.from({ length: size }, (_, i) => size + i + 1);
+      const batch = await gasUsed(registry.submitBidBatch(refs.map((ref) => bidInput(1, ref, 900, doc))));
+
+      console.log(`      submitBid x${size} on one RFQ: ${single / BigInt(size)} gas/bid single, ${batch / BigInt(size)} gas/bid batched`);
+      expect(batch).to.be.lessThan(single);
+      expect((await registry.getBids(1)).length).to.equal(2 * size);
+    });
+
+    it("batched RFQ creation costs less per RFQ than single calls", async function () {
+      const { registry, deadline } = await loadFixture(deployRegistryFixture);
+      const size = 10;
+
+      let single = 0n;
+      for (let i = 0; i < size; i++) {
+        const item = rfqInput(i, deadline);
+        single += await gasUsed(
+          registry.createRFQ(item.title, item.metaHash, item.deadline, item.category, item.budget, item.location)
+        );
+      }
+      const items = Array.from({ length: size }, (_, i) => rfqInput(i, deadline));
+      const batch = await gasUsed(registry.createRFQBatch(items));
+
+      console.log(`      createRFQ x${size}: ${single / BigInt(size)} gas/RFQ single, ${batch / BigInt(size)} gas/RFQ batched`);
+      expect(batch).to.be.lessThan(single);
+    });
+  });
+});